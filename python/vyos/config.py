@@ -64,7 +64,6 @@ In operational mode, all functions return values from the running config.
 """
 
 import re
-import json
 from copy import deepcopy
 from typing import Union
 
@@ -234,15 +233,7 @@ class Config(object):
         if cached:
             return cached
 
-        if effective:
-            config = self._running_config
-        else:
-            config = self._session_config
-
-        if config:
-            config_dict = json.loads(config.to_json())
-        else:
-            config_dict = {}
+        config_dict = self._config_source.get_root_dict(effective)
 
         self._dict_cache[effective] = config_dict
 
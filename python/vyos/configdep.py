@@ -13,14 +13,23 @@
 # You should have received a copy of the GNU Lesser General Public License
 # along with this library.  If not, see <http://www.gnu.org/licenses/>.
 
+import io
 import os
+import sys
 import json
 import typing
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import wait as wait_futures
+from functools import partial
 from inspect import stack
 from graphlib import TopologicalSorter, CycleError
 
 from vyos.utils.system import load_as_module
+from vyos.profiler import span
+from vyos.utils import netlink
 from vyos.configdict import dict_merge
+from vyos.configdict import tagnode_context
 from vyos.defaults import directories
 from vyos.configsource import VyOSError
 from vyos import ConfigError
@@ -29,11 +38,25 @@ from vyos import ConfigError
 # for type 'Config'
 if typing.TYPE_CHECKING:
     from vyos.config import Config
+    from vyos.configdiff import ConfigDiff
 
 dependency_dir = os.path.join(directories['data'],
                               'config-mode-dependencies')
 
-dependent_func: dict[str, list[typing.Callable]] = {}
+# caller: [(dependent, tagnode, func), ...]
+dependent_func: dict[str, list[tuple[str, typing.Optional[str], typing.Callable]]] = {}
+
+# Number of workers used to run generate/apply of the dependents called by a
+# script concurrently; 0 keeps the serial behavior. Opt-in, set by
+# vyos-configd. call_dependents() returns once all of them are applied.
+parallel_workers = 0
+
+# (owned config paths, callers) of all scripts, see load_script_ownership()
+script_ownership = None
+
+# Serializes get_config/verify of concurrently run scripts, as these depend
+# on the edit level of the shared config
+config_lock = threading.RLock()
 
 def canon_name(name: str) -> str:
     return os.path.splitext(name)[0].replace('-', '_')
@@ -68,27 +91,48 @@ def get_dependency_dict(config: 'Config') -> dict:
         setattr(config, 'cached_dependency_dict', d)
     return d
 
-def run_config_mode_script(script: str, config: 'Config'):
-    path = os.path.join(directories['conf_mode'], script)
-    name = canon_name(script)
-    mod = load_as_module(name, path)
-
-    config.set_level([])
+def generate_apply(mod, c, tagnode=None):
     try:
-        c = mod.get_config(config)
-        mod.verify(c)
-        mod.generate(c)
-        mod.apply(c)
+        with tagnode_context(tagnode), span(mod.__name__, 'script'):
+            with span('generate'):
+                mod.generate(c)
+            with span('apply'):
+                mod.apply(c)
     except (VyOSError, ConfigError) as e:
         raise ConfigError(repr(e))
 
+def run_config_mode_script(script: str, config: 'Config',
+                           tagnode: typing.Optional[str] = None,
+                           defer: bool = False) -> typing.Optional[typing.Callable]:
+    """ Run the script; with defer, only run get_config/verify and return
+    the function running generate/apply """
+    path = os.path.join(directories['conf_mode'], script)
+    name = canon_name(script)
+
+    with config_lock:
+        mod = load_as_module(name, path)
+
+        config.set_level([])
+        try:
+            with tagnode_context(tagnode), span(name, 'script'), netlink.snapshot():
+                with span('get_config'):
+                    c = mod.get_config(config)
+                with span('verify'):
+                    mod.verify(c)
+        except (VyOSError, ConfigError) as e:
+            raise ConfigError(repr(e))
+
+    if defer:
+        return partial(generate_apply, mod, c, tagnode)
+    generate_apply(mod, c, tagnode)
+    return None
+
 def def_closure(target: str, config: 'Config',
                 tagnode: typing.Optional[str] = None) -> typing.Callable:
     script = target + '.py'
-    def func_impl():
-        if tagnode:
-            os.environ['VYOS_TAGNODE_VALUE'] = tagnode
-        run_config_mode_script(script, config)
+    def func_impl(defer=False):
+        return run_config_mode_script(script, config, tagnode=tagnode,
+                                      defer=defer)
     return func_impl
 
 def set_dependents(case: str, config: 'Config',
@@ -98,15 +142,135 @@ def set_dependents(case: str, config: 'Config',
     l = dependent_func.setdefault(k, [])
     for target in d[k][case]:
         func = def_closure(target, config, tagnode)
-        l.append(func)
+        l.append((canon_name(target), tagnode, func))
 
 def call_dependents():
     k = canon_name_of_path(caller_name())
     l = dependent_func.get(k, [])
+    if parallel_workers and len(l) > 1:
+        call_dependents_parallel(l)
+        return
     while l:
-        f = l.pop(0)
+        _, _, f = l.pop(0)
         f()
 
+def call_dependents_parallel(l: list):
+    """ Run the dependents in l level by level, see dependent_levels():
+    get_config/verify serially, so that they see the changes applied by the
+    preceding levels, then generate/apply of the level concurrently """
+    from vyos.xml_ref import priorities
+
+    levels = dependent_levels([(name, tagnode) for name, tagnode, _ in l],
+                              read_dependency_dict(), priorities())
+    tasks = list(l)
+    l.clear()
+
+    with ThreadPoolExecutor(max_workers=parallel_workers,
+                            thread_name_prefix='configdep') as executor:
+        for level in levels:
+            funcs = [(tasks[i][0], tasks[i][2](defer=True)) for i in level]
+            errors = run_concurrently(executor, funcs)
+            if errors:
+                raise errors[0][1]
+
+def dependent_levels(runs: list, dependency_dict: dict = {},
+                     priorities: dict = {}) -> list:
+    """
+    Group the indices of the (script, tagnode) runs, in the order they would
+    run serially, into levels of runs which may run concurrently.
+
+    A run is in a later level than the preceding runs it depends on: of
+    scripts related through config-mode-dependencies, of scripts of a
+    different commit priority and of the same script, also for different
+    tagnodes, as the dependents a script calls are kept by script name.
+    Scripts of unknown priority depend on everything.
+    """
+    graph = {canon_name(k): {canon_name(t) for t in v}
+             for k, v in graph_from_dependency_dict(dependency_dict).items()}
+    prio = {canon_name(k): v for k, v in priorities.items()}
+
+    def precedes(earlier, later):
+        (a, _), (b, _) = earlier, later
+        if a == b:
+            return True
+        if b in graph.get(a, set()) or a in graph.get(b, set()):
+            return True
+        p = prio.get(a)
+        q = prio.get(b)
+        return p is None or q is None or p != q
+
+    runs = [(canon_name(name), tagnode) for name, tagnode in runs]
+    depth = []
+    for i, run in enumerate(runs):
+        depth.append(max((depth[j] + 1 for j in range(i)
+                          if precedes(runs[j], run)), default=0))
+    levels = [[] for _ in range(max(depth, default=-1) + 1)]
+    for i, d in enumerate(depth):
+        levels[d].append(i)
+    return levels
+
+_task_output = threading.local()
+
+class TaskStdout:
+    """ sys.stdout replacement, output of a concurrently run task is kept in
+    the buffer of its thread and emitted in submission order """
+    def __init__(self, stream):
+        self.stream = stream
+
+    def write(self, s):
+        buffer = getattr(_task_output, 'buffer', None)
+        if buffer is None:
+            return self.stream.write(s)
+        return buffer.write(s)
+
+    def __getattr__(self, name):
+        return getattr(self.stream, name)
+
+def captured() -> bool:
+    """ Check if the output of the current thread is kept by run_captured() """
+    return getattr(_task_output, 'buffer', None) is not None
+
+def run_captured(executor: ThreadPoolExecutor, funcs: list) -> list:
+    """ Run the functions of funcs in executor and return the list of their
+    (future, output), in the order of funcs """
+    def run(func, buffer):
+        _task_output.buffer = buffer
+        try:
+            return func()
+        finally:
+            _task_output.buffer = None
+
+    stdout = sys.stdout
+    # dependents run concurrently may call dependents themselves
+    wrapped = isinstance(stdout, TaskStdout)
+    if not wrapped:
+        sys.stdout = TaskStdout(stdout)
+    try:
+        tasks = []
+        for func in funcs:
+            buffer = io.StringIO()
+            tasks.append((executor.submit(run, func, buffer), buffer))
+        wait_futures([future for future, _ in tasks])
+    finally:
+        if not wrapped:
+            sys.stdout = stdout
+
+    return [(future, buffer.getvalue()) for future, buffer in tasks]
+
+def run_concurrently(executor: ThreadPoolExecutor, funcs: list) -> list:
+    """ Run the (name, func) of funcs in executor, emit their output in the
+    order of funcs and return the list of (name, exception) of failed ones """
+    results = run_captured(executor, [func for _, func in funcs])
+
+    stdout = sys.stdout
+    errors = []
+    for (name, _), (future, output) in zip(funcs, results):
+        stdout.write(output)
+        if future.exception() is not None:
+            errors.append((name, future.exception()))
+    stdout.flush()
+    return errors
+
 def graph_from_dependency_dict(d: dict) -> dict:
     g = {}
     for k in list(d):
@@ -119,6 +283,133 @@ def graph_from_dependency_dict(d: dict) -> dict:
 
     return g
 
+def reverse_graph_from_dependency_dict(d: dict) -> dict:
+    """ Map the canonical name of every dependent script to the set of
+    scripts which may call it """
+    g = graph_from_dependency_dict(d)
+    r = {}
+    for k, targets in g.items():
+        for target in targets:
+            r.setdefault(canon_name(target), set()).add(k)
+
+    return r
+
+def configd_option(option: str) -> bool:
+    """ Opt-in features of vyos-configd are enabled by the presence of the
+    file /config/vyos-configd.<option> or the environment variable
+    VYOS_CONFIGD_<OPTION> set to a value other than '', 0, no or false """
+    env = os.environ.get(f'VYOS_CONFIGD_{option.upper()}', '')
+    if env.lower() not in ('', '0', 'no', 'false'):
+        return True
+    return os.path.exists(f'/config/vyos-configd.{option}')
+
+def load_script_ownership() -> tuple:
+    """ Config paths owned by each script and the scripts which may call it
+    as a dependent, by canonical script name; loaded on first use by an
+    incremental commit of vyos-configd """
+    global script_ownership
+    from vyos.xml_ref import owners
+
+    owned = {canon_name(k): v for k, v in owners().items()}
+    callers = reverse_graph_from_dependency_dict(read_dependency_dict())
+    script_ownership = (owned, callers)
+    return script_ownership
+
+def script_config_changed(diff: 'ConfigDiff', script_name: str,
+                          tagnode: str = None, ownership: tuple = None) -> bool:
+    """ Check if any config path owned by the script, or by a script which may
+    call it as a dependent, changed in diff. Scripts with unknown ownership
+    are always considered changed. ownership defaults to
+    load_script_ownership() """
+    owned, callers = ownership or script_ownership or load_script_ownership()
+
+    key = canon_name(script_name)
+    scripts = {key} | callers.get(key, set())
+    if not scripts.issubset(owned):
+        return True
+
+    for script in scripts:
+        for path, is_tag in owned[script]:
+            if is_tag and tagnode and script == key:
+                path = path + [tagnode]
+            if diff.is_node_changed(path):
+                return True
+
+    return False
+
+def commit_runs(diff: 'ConfigDiff', ownership: tuple = None,
+                is_tag: typing.Callable = None) -> list:
+    """ The (script, tagnode) runs the commit of diff calls, for the config
+    paths owned by the scripts which changed and are not deleted. Scripts
+    owning nodes below a tag node are left out, as the tagnode they are run
+    for is not known. ownership defaults to load_script_ownership(). """
+    owned, _ = ownership or script_ownership or load_script_ownership()
+    if is_tag is None:
+        from vyos.xml_ref import is_tag
+
+    runs = []
+    seen = set()
+    for script, paths in owned.items():
+        for path, tag in paths:
+            if tag:
+                values = diff.get_child_nodes_diff(path)['merge']
+                candidates = [(path + [value], value) for value in values]
+            elif is_tag(path):
+                # path cut at a tag node, see Xml.owners()
+                continue
+            elif path[-1] in diff.get_child_nodes_diff(path[:-1])['merge']:
+                candidates = [(path, None)]
+            else:
+                continue
+            for node, tagnode in candidates:
+                run = (script, tagnode)
+                if run not in seen and diff.is_node_changed(node):
+                    seen.add(run)
+                    runs.append(run)
+    return runs
+
+def commit_levels(runs: list, dependency_dict: dict = {},
+                  priorities: dict = {}) -> list:
+    """
+    Group the (script, tagnode) runs of a commit into levels of runs which
+    may run concurrently, ordered by priority: runs of scripts of the same
+    commit priority which, together with all dependents they may call, are
+    disjoint. The same script is never run concurrently, not even for
+    different tagnodes, as its dependents are kept by script name. Runs of
+    scripts of unknown priority are left out.
+    """
+    graph = {canon_name(k): {canon_name(t) for t in v}
+             for k, v in graph_from_dependency_dict(dependency_dict).items()}
+    prio = {canon_name(k): v for k, v in priorities.items()}
+
+    def closure(name):
+        res = {name}
+        todo = [name]
+        while todo:
+            for target in graph.get(todo.pop(), set()):
+                if target not in res:
+                    res.add(target)
+                    todo.append(target)
+        return res
+
+    # priority: [(scripts of the level, [runs of the level]), ...]
+    levels = {}
+    for name, tagnode in runs:
+        name = canon_name(name)
+        if name not in prio:
+            continue
+        scripts = closure(name)
+        for level_scripts, level_runs in levels.setdefault(prio[name], []):
+            if scripts.isdisjoint(level_scripts):
+                level_scripts |= scripts
+                level_runs.append((name, tagnode))
+                break
+        else:
+            levels[prio[name]].append((scripts, [(name, tagnode)]))
+
+    return [level_runs for priority in sorted(levels)
+            for _, level_runs in levels[priority]]
+
 def is_acyclic(d: dict) -> bool:
     g = graph_from_dependency_dict(d)
     ts = TopologicalSorter(g)
@@ -18,10 +18,36 @@ A library for retrieving value dicts from VyOS configs in a declarative fashion.
 """
 import os
 import json
+import threading
+
+from contextlib import contextmanager
 
 from vyos.utils.dict import dict_search
 from vyos.utils.process import cmd
 
+_tagnode = threading.local()
+
+@contextmanager
+def tagnode_context(tagnode):
+    """
+    Use tagnode as the tagNode value of the conf_mode script run by the
+    current thread, instead of VYOS_TAGNODE_VALUE of the process environment
+    shared by all scripts run concurrently by vyos-configd.
+    """
+    saved = getattr(_tagnode, 'value', None)
+    _tagnode.value = tagnode
+    try:
+        yield
+    finally:
+        _tagnode.value = saved
+
+def get_tagnode_value():
+    """ tagNode value of the running conf_mode script, None if not set """
+    value = getattr(_tagnode, 'value', None)
+    if value is not None:
+        return value
+    return os.environ.get('VYOS_TAGNODE_VALUE')
+
 def retrieve_config(path_hash, base_path, config):
     """
     Retrieves a VyOS config as a dict according to a declarative description
@@ -422,9 +448,9 @@ def get_interface_dict(config, base, ifname='', recursive_defaults=True):
     if not ifname:
         from vyos import ConfigError
         # determine tagNode instance
-        if 'VYOS_TAGNODE_VALUE' not in os.environ:
+        ifname = get_tagnode_value()
+        if ifname is None:
             raise ConfigError('Interface (VYOS_TAGNODE_VALUE) not specified')
-        ifname = os.environ['VYOS_TAGNODE_VALUE']
 
     # Check if interface has been removed. We must use exists() as
     # get_config_dict() will always return {} - even when an empty interface
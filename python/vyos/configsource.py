@@ -16,8 +16,12 @@
 
 import os
 import re
+import json
+import hashlib
 import subprocess
 
+from collections import OrderedDict
+
 from vyos.configtree import ConfigTree
 from vyos.utils.boot import boot_configuration_complete
 
@@ -41,6 +45,19 @@ class ConfigSource:
     def get_configtree_tuple(self):
         return self._running_config, self._session_config
 
+    def get_root_dict(self, effective=False):
+        """
+        Args:
+            effective (bool): running config if True, session config otherwise
+
+        Returns:
+            dict: representation of the complete config tree, {} if empty
+        """
+        config = self._running_config if effective else self._session_config
+        if config:
+            return json.loads(config.to_json())
+        return {}
+
     def session_changed(self):
         """
         Returns:
@@ -308,12 +325,93 @@ class ConfigSourceSession(ConfigSource):
         except VyOSError:
             return False
 
+class CachedConfig:
+    """
+    Parsed config tree and its JSON representation, the JSON is only built on
+    first use. The tree is shared by every user of the cache entry and must
+    not be modified, every root dict is a new object.
+    """
+    def __init__(self, tree):
+        self.tree = tree
+        self._json = None
+
+    @property
+    def root_dict(self):
+        # get_config_dict() returns lists and subtrees of the root dict, which
+        # callers may modify, those must not leak into later commits
+        if self._json is None:
+            self._json = self.tree.to_json()
+        return json.loads(self._json)
+
+class ConfigTreeCache:
+    """
+    LRU cache of parsed configs keyed by a hash of the config text.
+
+    Subsequent commits mostly hand over a running config which is identical to
+    the session config of the previous commit, those need not be parsed again.
+    """
+    def __init__(self, maxsize=4):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+
+    @staticmethod
+    def key(config_text):
+        return hashlib.sha256(config_text.encode()).hexdigest()
+
+    def get(self, config_text):
+        """
+        Returns:
+            CachedConfig: entry for config_text, parsed on cache miss
+
+        Raises:
+            ValueError: if config_text can not be parsed
+        """
+        key = self.key(config_text)
+        entry = self._entries.get(key)
+        if entry is not None:
+            self.hits += 1
+            self._entries.move_to_end(key)
+            return entry
+
+        self.misses += 1
+        entry = CachedConfig(ConfigTree(config_text))
+        self._entries[key] = entry
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+        return entry
+
+    def clear(self):
+        self._entries.clear()
+
+    def stats(self):
+        return {'size': len(self._entries), 'maxsize': self.maxsize,
+                'hits': self.hits, 'misses': self.misses}
+
 class ConfigSourceString(ConfigSource):
-    def __init__(self, running_config_text=None, session_config_text=None):
+    def __init__(self, running_config_text=None, session_config_text=None,
+                 cache=None):
         super().__init__()
+        self._running_cached = None
+        self._session_cached = None
 
         try:
-            self._running_config = ConfigTree(running_config_text) if running_config_text else None
-            self._session_config = ConfigTree(session_config_text) if session_config_text else None
+            if cache is None:
+                self._running_config = ConfigTree(running_config_text) if running_config_text else None
+                self._session_config = ConfigTree(session_config_text) if session_config_text else None
+            else:
+                if running_config_text:
+                    self._running_cached = cache.get(running_config_text)
+                    self._running_config = self._running_cached.tree
+                if session_config_text:
+                    self._session_cached = cache.get(session_config_text)
+                    self._session_config = self._session_cached.tree
         except ValueError:
             raise ConfigSourceError(f"Init error in {type(self)}")
+
+    def get_root_dict(self, effective=False):
+        cached = self._running_cached if effective else self._session_cached
+        if cached is not None:
+            return cached.root_dict
+        return super().get_root_dict(effective)
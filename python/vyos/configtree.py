@@ -17,6 +17,7 @@ import re
 import json
 
 from ctypes import cdll, c_char_p, c_void_p, c_int, c_bool
+from threading import Lock
 
 LIBPATH = '/usr/lib/libvyosconfig.so.0'
 
@@ -43,96 +44,98 @@ class ConfigTreeError(Exception):
     pass
 
 
+class LibVyOSConfig(object):
+    """ Process-wide handle to libvyosconfig with all function prototypes
+    declared once.
+
+    Loading the library and setting ctypes argtypes/restype is not free, so it
+    must not be repeated for every ConfigTree, subtree or DiffTree instance.
+    Use get_library() instead of instantiating this class directly.
+    """
+    # function name: (argtypes, restype)
+    prototypes = {
+        'from_string': ([c_char_p], c_void_p),
+        'get_error': ([], c_char_p),
+        'to_string': ([c_void_p, c_bool], c_char_p),
+        'to_commands': ([c_void_p, c_char_p], c_char_p),
+        'to_json': ([c_void_p], c_char_p),
+        'to_json_ast': ([c_void_p], c_char_p),
+        'set_add_value': ([c_void_p, c_char_p, c_char_p], c_int),
+        'delete_value': ([c_void_p, c_char_p, c_char_p], c_int),
+        'delete_node': ([c_void_p, c_char_p], c_int),
+        'rename_node': ([c_void_p, c_char_p, c_char_p], c_int),
+        'copy_node': ([c_void_p, c_char_p, c_char_p], c_int),
+        'set_replace_value': ([c_void_p, c_char_p, c_char_p], c_int),
+        'set_valueless': ([c_void_p, c_char_p], c_int),
+        'exists': ([c_void_p, c_char_p], c_int),
+        'list_nodes': ([c_void_p, c_char_p], c_char_p),
+        'return_value': ([c_void_p, c_char_p], c_char_p),
+        'return_values': ([c_void_p, c_char_p], c_char_p),
+        'is_tag': ([c_void_p, c_char_p], c_int),
+        'set_tag': ([c_void_p, c_char_p], c_int),
+        'get_subtree': ([c_void_p, c_char_p], c_void_p),
+        'destroy': ([c_void_p], c_int),
+        'show_diff': ([c_bool, c_char_p, c_void_p, c_void_p], c_char_p),
+        'tree_union': ([c_void_p, c_void_p], c_void_p),
+        'reference_tree_to_json': ([c_char_p, c_char_p], c_int),
+        'diff_tree': ([c_char_p, c_void_p, c_void_p], c_void_p),
+    }
+
+    def __init__(self, libpath=LIBPATH):
+        self.libpath = libpath
+        lib = cdll.LoadLibrary(libpath)
+        for name, (argtypes, restype) in self.prototypes.items():
+            func = getattr(lib, name)
+            func.argtypes = argtypes
+            func.restype = restype
+            setattr(self, name, func)
+
+_libraries = {}
+_libraries_lock = Lock()
+
+def get_library(libpath=LIBPATH):
+    """ Return the shared LibVyOSConfig binding for libpath, loading the
+    library and declaring its prototypes on first use only """
+    lib = _libraries.get(libpath)
+    if lib is None:
+        with _libraries_lock:
+            lib = _libraries.get(libpath)
+            if lib is None:
+                lib = LibVyOSConfig(libpath)
+                _libraries[libpath] = lib
+    return lib
+
+
 class ConfigTree(object):
     def __init__(self, config_string=None, address=None, libpath=LIBPATH):
         if config_string is None and address is None:
             raise TypeError("ConfigTree() requires one of 'config_string' or 'address'")
         self.__config = None
-        self.__lib = cdll.LoadLibrary(libpath)
+        self.__libpath = libpath
+        self.__lib = get_library(libpath)
 
         # Import functions
         self.__from_string = self.__lib.from_string
-        self.__from_string.argtypes = [c_char_p]
-        self.__from_string.restype = c_void_p
-
         self.__get_error = self.__lib.get_error
-        self.__get_error.argtypes = []
-        self.__get_error.restype = c_char_p
-
         self.__to_string = self.__lib.to_string
-        self.__to_string.argtypes = [c_void_p, c_bool]
-        self.__to_string.restype = c_char_p
-
         self.__to_commands = self.__lib.to_commands
-        self.__to_commands.argtypes = [c_void_p, c_char_p]
-        self.__to_commands.restype = c_char_p
-
         self.__to_json = self.__lib.to_json
-        self.__to_json.argtypes = [c_void_p]
-        self.__to_json.restype = c_char_p
-
         self.__to_json_ast = self.__lib.to_json_ast
-        self.__to_json_ast.argtypes = [c_void_p]
-        self.__to_json_ast.restype = c_char_p
-
         self.__set_add_value = self.__lib.set_add_value
-        self.__set_add_value.argtypes = [c_void_p, c_char_p, c_char_p]
-        self.__set_add_value.restype = c_int
-
         self.__delete_value = self.__lib.delete_value
-        self.__delete_value.argtypes = [c_void_p, c_char_p, c_char_p]
-        self.__delete_value.restype = c_int
-
         self.__delete = self.__lib.delete_node
-        self.__delete.argtypes = [c_void_p, c_char_p]
-        self.__delete.restype = c_int
-
         self.__rename = self.__lib.rename_node
-        self.__rename.argtypes = [c_void_p, c_char_p, c_char_p]
-        self.__rename.restype = c_int
-
         self.__copy = self.__lib.copy_node
-        self.__copy.argtypes = [c_void_p, c_char_p, c_char_p]
-        self.__copy.restype = c_int
-
         self.__set_replace_value = self.__lib.set_replace_value
-        self.__set_replace_value.argtypes = [c_void_p, c_char_p, c_char_p]
-        self.__set_replace_value.restype = c_int
-
         self.__set_valueless = self.__lib.set_valueless
-        self.__set_valueless.argtypes = [c_void_p, c_char_p]
-        self.__set_valueless.restype = c_int
-
         self.__exists = self.__lib.exists
-        self.__exists.argtypes = [c_void_p, c_char_p]
-        self.__exists.restype = c_int
-
         self.__list_nodes = self.__lib.list_nodes
-        self.__list_nodes.argtypes = [c_void_p, c_char_p]
-        self.__list_nodes.restype = c_char_p
-
         self.__return_value = self.__lib.return_value
-        self.__return_value.argtypes = [c_void_p, c_char_p]
-        self.__return_value.restype = c_char_p
-
         self.__return_values = self.__lib.return_values
-        self.__return_values.argtypes = [c_void_p, c_char_p]
-        self.__return_values.restype = c_char_p
-
         self.__is_tag = self.__lib.is_tag
-        self.__is_tag.argtypes = [c_void_p, c_char_p]
-        self.__is_tag.restype = c_int
-
         self.__set_tag = self.__lib.set_tag
-        self.__set_tag.argtypes = [c_void_p, c_char_p]
-        self.__set_tag.restype = c_int
-
         self.__get_subtree = self.__lib.get_subtree
-        self.__get_subtree.argtypes = [c_void_p, c_char_p]
-        self.__get_subtree.restype = c_void_p
-
         self.__destroy = self.__lib.destroy
-        self.__destroy.argtypes = [c_void_p]
 
         if address is None:
             config_section, version_section = extract_version(config_string)
@@ -328,7 +331,7 @@ class ConfigTree(object):
         path_str = " ".join(map(str, path)).encode()
 
         res = self.__get_subtree(self.__config, path_str, with_node)
-        subt = ConfigTree(address=res)
+        subt = ConfigTree(address=res, libpath=self.__libpath)
         return subt
 
 def show_diff(left, right, path=[], commands=False, libpath=LIBPATH):
@@ -345,13 +348,9 @@ def show_diff(left, right, path=[], commands=False, libpath=LIBPATH):
     check_path(path)
     path_str = " ".join(map(str, path)).encode()
 
-    __lib = cdll.LoadLibrary(libpath)
+    __lib = get_library(libpath)
     __show_diff = __lib.show_diff
-    __show_diff.argtypes = [c_bool, c_char_p, c_void_p, c_void_p]
-    __show_diff.restype = c_char_p
     __get_error = __lib.get_error
-    __get_error.argtypes = []
-    __get_error.restype = c_char_p
 
     res = __show_diff(commands, path_str, left._get_config(), right._get_config())
     res = res.decode()
@@ -369,27 +368,19 @@ def union(left, right, libpath=LIBPATH):
     if not (isinstance(left, ConfigTree) and isinstance(right, ConfigTree)):
         raise TypeError("Arguments must be instances of ConfigTree")
 
-    __lib = cdll.LoadLibrary(libpath)
+    __lib = get_library(libpath)
     __tree_union = __lib.tree_union
-    __tree_union.argtypes = [c_void_p, c_void_p]
-    __tree_union.restype = c_void_p
-    __get_error = __lib.get_error
-    __get_error.argtypes = []
-    __get_error.restype = c_char_p
 
     res = __tree_union( left._get_config(), right._get_config())
-    tree = ConfigTree(address=res)
+    tree = ConfigTree(address=res, libpath=libpath)
 
     return tree
 
 def reference_tree_to_json(from_dir, to_file, libpath=LIBPATH):
     try:
-        __lib = cdll.LoadLibrary(libpath)
+        __lib = get_library(libpath)
         __reference_tree_to_json = __lib.reference_tree_to_json
-        __reference_tree_to_json.argtypes = [c_char_p, c_char_p]
         __get_error = __lib.get_error
-        __get_error.argtypes = []
-        __get_error.restype = c_char_p
         res = __reference_tree_to_json(from_dir.encode(), to_file.encode())
     except Exception as e:
         raise ConfigTreeError(e)
@@ -414,11 +405,8 @@ class DiffTree:
         self.left = left
         self.right = right
 
-        self.__lib = cdll.LoadLibrary(libpath)
-
+        self.__lib = get_library(libpath)
         self.__diff_tree = self.__lib.diff_tree
-        self.__diff_tree.argtypes = [c_char_p, c_void_p, c_void_p]
-        self.__diff_tree.restype = c_void_p
 
         check_path(path)
         path_str = " ".join(map(str, path)).encode()
@@ -426,7 +414,7 @@ class DiffTree:
         res = self.__diff_tree(path_str, left._get_config(), right._get_config())
 
         # full diff config_tree and python dict representation
-        self.full = ConfigTree(address=res)
+        self.full = ConfigTree(address=res, libpath=libpath)
         self.dict = json.loads(self.full.to_json())
 
         # config_tree sub-trees
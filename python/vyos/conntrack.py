@@ -0,0 +1,227 @@
+# Copyright 2023 VyOS maintainers and contributors <maintainers@vyos.io>
+#
+# This library is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License as published by the Free Software Foundation; either
+# version 2.1 of the License, or (at your option) any later version.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with this library.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Streaming reader of the conntrack table.
+
+The XML output of 'conntrack --dump' is parsed incrementally and every flow
+is handed to the caller as soon as it was read, then discarded. Memory use
+does not depend on the number of flows, and the dump is stopped as soon as
+the caller stops reading.
+"""
+
+import heapq
+
+from collections import Counter
+from ipaddress import ip_address
+from ipaddress import ip_network
+from subprocess import Popen
+from subprocess import PIPE
+from subprocess import DEVNULL
+from xml.etree.ElementTree import XMLPullParser
+
+chunk_size = 65536
+
+def parse_flows(stream, size=chunk_size):
+    """
+    Generator of <flow> elements read from a binary stream of conntrack XML
+    in chunks of 'size' bytes. An element is only valid until the next one
+    was requested.
+    """
+    parser = XMLPullParser(events=('start', 'end'))
+    root = None
+    for chunk in iter(lambda: stream.read(size), b''):
+        parser.feed(chunk)
+        for event, element in parser.read_events():
+            if event == 'start':
+                if root is None:
+                    root = element
+            elif element.tag == 'flow':
+                yield element
+                # drop the flow from the tree, so that it does not grow
+                root.clear()
+
+def dump(family='ipv4', args=None):
+    """
+    Generator of <flow> elements of the conntrack table, 'args' are extra
+    conntrack options filtering the dump. Raises OSError if conntrack failed.
+    """
+    command = ['conntrack', '--dump', '--family', family, '--output', 'xml']
+    proc = Popen(command + (args or []), stdout=PIPE, stderr=DEVNULL)
+    complete = False
+    try:
+        yield from parse_flows(proc.stdout)
+        complete = True
+    finally:
+        proc.stdout.close()
+        if not complete:
+            proc.kill()
+        proc.wait()
+    if proc.returncode != 0:
+        raise OSError(f'conntrack failed with exit code {proc.returncode}')
+
+def _element_dict(element):
+    # same structure as xmltodict.parse(xml, attr_prefix='')
+    res = dict(element.attrib)
+    for child in element:
+        value = _element_dict(child)
+        if child.tag not in res:
+            res[child.tag] = value
+        elif isinstance(res[child.tag], list):
+            res[child.tag].append(value)
+        else:
+            res[child.tag] = [res[child.tag], value]
+    text = (element.text or '').strip()
+    if not res:
+        return text or None
+    if text:
+        res['#text'] = text
+    return res
+
+def flow_dict(flow) -> dict:
+    """ Flow element as a dictionary, as it was returned by xmltodict """
+    res = _element_dict(flow)
+    if not isinstance(res.get('meta'), list):
+        res['meta'] = [res['meta']] if 'meta' in res else []
+    return res
+
+def flow_info(flow) -> dict:
+    """
+    Flat dictionary of the commonly used fields of a flow element, counters
+    are the sum of both directions and 0 without connection accounting
+    """
+    info = {'id': '', 'protocol': '', 'protonum': '', 'state': '', 'timeout': '',
+            'mark': '', 'zone': '', 'packets': 0, 'bytes': 0}
+    for meta in flow.iterfind('meta'):
+        direction = meta.get('direction')
+        if direction in ['original', 'reply']:
+            prefix = 'orig' if direction == 'original' else 'reply'
+            layer3 = meta.find('layer3')
+            layer4 = meta.find('layer4')
+            if layer3 is not None:
+                info[f'{prefix}_src'] = layer3.findtext('src', '')
+                info[f'{prefix}_dst'] = layer3.findtext('dst', '')
+            if layer4 is not None:
+                info[f'{prefix}_sport'] = layer4.findtext('sport', '')
+                info[f'{prefix}_dport'] = layer4.findtext('dport', '')
+                info['protocol'] = layer4.get('protoname', '')
+                info['protonum'] = layer4.get('protonum', '')
+            counters = meta.find('counters')
+            if counters is not None:
+                info['packets'] += int(counters.findtext('packets', 0))
+                info['bytes'] += int(counters.findtext('bytes', 0))
+        elif direction == 'independent':
+            for key in ['id', 'state', 'timeout', 'mark', 'zone']:
+                info[key] = meta.findtext(key, '')
+    return info
+
+def _parse_mark(mark):
+    value, _, mask = mark.partition('/')
+    return int(value, 0), int(mask, 0) if mask else 0xffffffff
+
+class FlowFilter:
+    """
+    Match flows by original source and destination prefix, protocol name or
+    number, zone and mark ('value' or 'value/mask'). Unset criteria match
+    every flow. Raises ValueError for invalid criteria.
+    """
+    def __init__(self, source=None, destination=None, protocol=None, zone=None,
+                 mark=None):
+        self.source = ip_network(source, strict=False) if source else None
+        self.destination = ip_network(destination, strict=False) if destination else None
+        self.protocol = str(protocol).lower() if protocol else None
+        self.zone = str(int(zone)) if zone is not None else None
+        self.mark = _parse_mark(str(mark)) if mark is not None else None
+
+    def args(self) -> list:
+        """ conntrack options doing the same filtering before the XML output """
+        args = []
+        if self.source and self.source.num_addresses == 1:
+            args += ['--orig-src', str(self.source.network_address)]
+        if self.destination and self.destination.num_addresses == 1:
+            args += ['--orig-dst', str(self.destination.network_address)]
+        if self.protocol:
+            args += ['--proto', self.protocol]
+        if self.zone is not None:
+            args += ['--zone', self.zone]
+        if self.mark is not None:
+            args += ['--mark', f'{self.mark[0]}/{self.mark[1]}']
+        return args
+
+    @staticmethod
+    def _in(address, network):
+        try:
+            return ip_address(address) in network
+        except ValueError:
+            return False
+
+    def __call__(self, info: dict) -> bool:
+        if self.source and not self._in(info.get('orig_src', ''), self.source):
+            return False
+        if self.destination and not self._in(info.get('orig_dst', ''), self.destination):
+            return False
+        if self.protocol and self.protocol not in [info['protocol'], info['protonum']]:
+            return False
+        if self.zone is not None and info['zone'] != self.zone:
+            return False
+        if self.mark is not None:
+            value, mask = self.mark
+            if int(info['mark'] or 0) & mask != value:
+                return False
+        return True
+
+def top(items, count: int, key: str):
+    """ The count largest (info, ...) items by info[key], read in one pass """
+    return heapq.nlargest(count, items, key=lambda item: item[0][key])
+
+def nat_endpoints(info: dict, direction: str):
+    """
+    Inside address, public address and public port of a NAT translation in
+    'source' or 'destination' direction
+    """
+    if direction == 'source':
+        return info.get('orig_src'), info.get('reply_dst'), info.get('reply_dport')
+    return info.get('reply_src'), info.get('orig_dst'), info.get('orig_dport')
+
+def nat_aggregate(infos, direction: str, view: str, block_size=1024) -> list:
+    """
+    Number of translations per 'inside' address, 'public' address or
+    'block' of block_size public ports, counted in one pass. Returns (key,
+    count) tuples ordered by count, port blocks are (address, first port).
+    Translations without ports (e.g. ICMP) are not part of any port block.
+    """
+    counts = Counter()
+    for info in infos:
+        inside, public, port = nat_endpoints(info, direction)
+        if view == 'inside':
+            counts[inside] += 1
+        elif view == 'public':
+            counts[public] += 1
+        elif port:
+            counts[(public, int(port) // block_size * block_size)] += 1
+    return sorted(counts.items(), key=lambda item: (-item[1], str(item[0])))
+
+def format_table(headers: list, widths: list, rows):
+    """
+    Lines of a left aligned table with fixed column widths, like the plain
+    tabulate output but without reading all rows first
+    """
+    def line(values):
+        return '  '.join(str(v).ljust(w) for v, w in zip(values, widths)).rstrip()
+
+    yield line(headers)
+    yield line('-' * w for w in widths)
+    for row in rows:
+        yield line(row)
@@ -15,6 +15,11 @@
 
 import os
 import sys
+import json
+import atexit
+import threading
+from collections import deque
+from contextlib import contextmanager
 from datetime import datetime
 
 def message(message, flag='', destination=sys.stdout):
@@ -63,6 +68,11 @@ def enabled(flag):
      - ifconfig: when modifying an interface,
        prints command with result and sysfs access on stdout for interface
      - command: print command run with result
+     - profile: record the time spent in commit phases and processes,
+       see vyos.profiler
+     - process: account all processes spawned through vyos.utils.process
+       and dump the statistics as JSON on exit (per commit for vyos-configd),
+       see ProcessAccounting
 
     Having the flag setup on the filesystem is required to have
     debuging at boot time, however, setting the flag via environment
@@ -75,7 +85,8 @@ def enabled(flag):
 
     # this is to force all new flags to be registered here to be
     # documented both here and a reminder to update readthedocs :-)
-    if flag not in ['developer', 'log', 'ifconfig', 'command']:
+    if flag not in ['developer', 'log', 'ifconfig', 'command', 'profile',
+                    'process']:
         return ''
 
     return _fromenv(flag) or _fromfile(flag)
@@ -203,3 +214,167 @@ def _logfile(flag, default):
     if stat != 0o100666:
         return default
     return log_location
+
+
+class ProcessAccounting:
+    """
+    Count and latency of the processes spawned through vyos.utils.process
+    per calling module, with the slowest command lines of each module.
+    The latency percentile is taken from the last samples durations of
+    a module, so memory use is bounded in long running processes.
+    """
+    def __init__(self, top=10, samples=10000):
+        self.top = top
+        self.samples = samples
+        self._lock = threading.Lock()
+        self._modules = {}
+
+    def record(self, module, command, duration):
+        if not isinstance(command, str):
+            command = ' '.join(command)
+        with self._lock:
+            m = self._modules.get(module)
+            if m is None:
+                m = {'count': 0, 'total': 0.0, 'slowest': [],
+                     'durations': deque(maxlen=self.samples)}
+                self._modules[module] = m
+            m['count'] += 1
+            m['total'] += duration
+            m['durations'].append(duration)
+            m['slowest'].append((duration, command))
+            if len(m['slowest']) > self.top:
+                m['slowest'].sort(key=lambda x: x[0], reverse=True)
+                del m['slowest'][self.top:]
+
+    def reset(self):
+        with self._lock:
+            self._modules = {}
+
+    @staticmethod
+    def _percentile(values, percent):
+        values = sorted(values)
+        # nearest-rank method
+        rank = max(-(-len(values) * percent // 100), 1)
+        return values[int(rank) - 1]
+
+    def summary(self):
+        """
+        Returns a dict per calling module, most expensive module first:
+        {module: {'count', 'total', 'p95', 'slowest': [{'command', 'duration'}]}}
+        durations are in seconds
+        """
+        res = {}
+        with self._lock:
+            modules = sorted(self._modules.items(),
+                             key=lambda m: m[1]['total'], reverse=True)
+            for module, m in modules:
+                slowest = sorted(m['slowest'], key=lambda x: x[0],
+                                 reverse=True)[:self.top]
+                res[module] = {
+                    'count': m['count'],
+                    'total': round(m['total'], 6),
+                    'p95': round(self._percentile(m['durations'], 95), 6),
+                    'slowest': [{'command': c, 'duration': round(d, 6)}
+                                for d, c in slowest],
+                }
+        return res
+
+    def to_json(self):
+        return json.dumps(self.summary(), indent=2)
+
+    def dump(self, path):
+        with open(path, 'w') as f:
+            f.write(self.to_json())
+
+
+_accounting = []
+_flag_accounting = None
+# the debug flag is checked for the first process run, and again by
+# reset_process_accounting() for long running processes
+_flag_checked = False
+
+
+def _caller_module():
+    frame = sys._getframe(2)
+    while frame:
+        module = frame.f_globals.get('__name__', '')
+        if module not in ('vyos.utils.process', 'vyos.debug'):
+            if module == '__main__':
+                return os.path.basename(frame.f_globals.get('__file__', module))
+            return module
+        frame = frame.f_back
+    return ''
+
+
+def _check_process_flag():
+    """
+    start or stop the accounting of the debug flag 'process' as the flag is
+    set or removed
+    """
+    global _flag_accounting
+    global _flag_checked
+
+    _flag_checked = True
+    if enabled('process'):
+        if _flag_accounting is None:
+            _flag_accounting = ProcessAccounting()
+            atexit.register(dump_process_accounting)
+        if _flag_accounting not in _accounting:
+            _accounting.append(_flag_accounting)
+    elif _flag_accounting in _accounting:
+        _accounting.remove(_flag_accounting)
+
+
+def account_process(command, duration):
+    """
+    called by vyos.utils.process for every process run, records it for all
+    active ProcessAccounting instances
+    """
+    if not _flag_checked:
+        _check_process_flag()
+
+    if not _accounting:
+        return
+
+    module = _caller_module()
+    for accounting in _accounting:
+        accounting.record(module, command, duration)
+
+
+def dump_process_accounting():
+    """
+    write the accounting of the debug flag 'process', if set, to
+    /tmp/vyos-process.<program>.<pid>.json; done at exit, long running
+    processes (vyos-configd) also call it once their work for a commit is done
+    """
+    if _flag_accounting not in _accounting:
+        return
+    name = os.path.basename(sys.argv[0]) or 'python'
+    _flag_accounting.dump(f'/tmp/vyos-process.{name}.{os.getpid()}.json')
+
+
+def reset_process_accounting():
+    """
+    start the accounting of the debug flag 'process' over, e.g. per commit;
+    the flag is checked again, so it can be set or removed at runtime
+    """
+    _check_process_flag()
+    if _flag_accounting is not None:
+        _flag_accounting.reset()
+
+
+@contextmanager
+def process_accounting(top=10):
+    """
+    account the processes spawned within the context
+
+    with process_accounting() as accounting:
+        ...
+    print(accounting.to_json())
+    """
+    accounting = ProcessAccounting(top)
+    _accounting.append(accounting)
+    try:
+        yield accounting
+    finally:
+        _accounting.remove(accounting)
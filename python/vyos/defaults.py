@@ -44,6 +44,9 @@ cfg_vintage = 'vyos'
 
 commit_lock = '/opt/vyatta/config/.lock'
 
+# touched by a commit post-hook at the end of every commit
+commit_generation = '/opt/vyatta/config/.commit-generation'
+
 component_version_json = os.path.join(directories['data'], 'component-versions.json')
 
 https_data = {
@@ -0,0 +1,194 @@
+# Copyright 2023 VyOS maintainers and contributors <maintainers@vyos.io>
+#
+# This library is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License as published by the Free Software Foundation; either
+# version 2.1 of the License, or (at your option) any later version.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with this library.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Incremental reader of ISC dhcpd lease files.
+
+dhcpd appends a lease block to its lease file for every change of a lease
+and periodically rewrites the file with only the current leases. A
+LeaseFile parses only the blocks appended since it was last read, and
+reads the file again from the start once it was replaced or truncated.
+Later blocks for an address replace earlier ones.
+"""
+
+import binascii
+import codecs
+import os
+
+from calendar import timegm
+
+def parse_time(value):
+    """
+    UNIX time of a lease file time, e.g. '4 2023/08/03 10:00:00' (UTC) or
+    'epoch 1691056800', None for 'never'
+    """
+    words = value.split()
+    if not words or words[0] == 'never':
+        return None
+    if words[0] == 'epoch':
+        return float(words[1])
+    year, month, day = words[1].split('/')
+    hour, minute, second = words[2].split(':')
+    return float(timegm((int(year), int(month), int(day), int(hour), int(minute),
+                         int(second))))
+
+def _statement(line):
+    # 'binding state active;' -> ('binding', 'state active')
+    line = line.strip()
+    if line.endswith(';'):
+        line = line[:-1]
+    elif '; #' in line:
+        line = line[:line.index('; #')]
+    else:
+        return None, None
+    key, _, value = line.partition(' ')
+    return key, value
+
+def _properties(lines):
+    properties = {}
+    sets = {}
+    for line in lines:
+        key, value = _statement(line)
+        if key == 'set':
+            name, _, value = value.partition(' = ')
+            sets[name] = value.strip('"')
+        elif key:
+            properties[key] = value
+    return properties, sets
+
+def _state(properties):
+    return properties.get('binding', '').replace('state ', '', 1)
+
+def _lease4(address, lines):
+    properties, sets = _properties(lines)
+    hardware = properties.get('hardware', '').split()
+    return {'ip': address,
+            'state': _state(properties),
+            'pool': sets.get('shared-networkname', ''),
+            'start': parse_time(properties['starts']) if 'starts' in properties else None,
+            'end': parse_time(properties.get('ends', 'never')),
+            'mac': hardware[1] if len(hardware) == 2 else None,
+            'hostname': properties.get('client-hostname', '').replace('"', '')}
+
+def _leases6(kind, identifier, lines):
+    # an ia-na/ia-ta/ia-pd block holds one iaaddr or iaprefix block per address
+    identifier = codecs.decode(identifier, 'unicode_escape').encode('latin-1')
+    common = []
+    addresses = []
+    address = None
+    for line in lines:
+        words = line.split()
+        if len(words) == 3 and words[0] in ['iaaddr', 'iaprefix'] and words[2] == '{':
+            address = (words[1], [])
+            addresses.append(address)
+        elif address and words == ['}']:
+            address = None
+        elif address:
+            address[1].append(line)
+        else:
+            common.append(line)
+
+    properties, _ = _properties(common)
+    cltt = properties.get('cltt')
+    leases = []
+    for address, block in addresses:
+        properties, sets = _properties(block)
+        leases.append({'ip': address,
+                       'state': _state(properties),
+                       'pool': sets.get('shared-networkname', ''),
+                       'end': parse_time(properties.get('ends', 'never')),
+                       'last_communication': parse_time(cltt) if cltt else None,
+                       'iaid_duid': binascii.hexlify(identifier).decode('ascii'),
+                       'type': kind})
+    return leases
+
+def parse_block(lines):
+    """ Leases of a top level lease file block, as list of dictionaries """
+    words = lines[0].split()
+    if words[0] == 'lease' and len(words) == 3:
+        return [_lease4(words[1], lines[1:-1])]
+    if words[0] in ['ia-na', 'ia-ta', 'ia-pd']:
+        identifier = lines[0].strip()[len(words[0]):-1].strip()
+        if identifier.startswith('"') and identifier.endswith('"'):
+            return _leases6(words[0][3:], identifier[1:-1], lines[1:-1])
+    return []
+
+def parse(data: bytes):
+    """
+    Leases of all complete top level blocks in data, in file order, and the
+    number of bytes parsed. An incomplete block at the end is not parsed.
+    """
+    leases = []
+    offset = 0
+    parsed = 0
+    block = []
+    depth = 0
+    for line in data.splitlines(keepends=True):
+        offset += len(line)
+        if not line.endswith(b'\n'):
+            break
+        text = line.decode('utf-8', 'replace').rstrip()
+        stripped = text.strip()
+        if not block and (not stripped or stripped.startswith('#')):
+            parsed = offset
+            continue
+        block.append(text)
+        if stripped.endswith('{'):
+            depth += 1
+        elif stripped.startswith('}'):
+            depth -= 1
+        if depth <= 0:
+            # statements outside of blocks, e.g. 'server-duid', are skipped
+            if len(block) > 1:
+                leases += parse_block(block)
+            block = []
+            depth = 0
+            parsed = offset
+    return leases, parsed
+
+class LeaseFile:
+    """ Current leases of a lease file by address, see module docstring """
+    def __init__(self, path: str):
+        self.path = path
+        self._leases = {}
+        self._inode = None
+        self._offset = 0
+
+    def leases(self) -> dict:
+        """ Leases by address, refreshed from the file """
+        try:
+            fd = os.open(self.path, os.O_RDONLY)
+        except FileNotFoundError:
+            self._leases, self._inode, self._offset = {}, None, 0
+            return self._leases
+
+        with os.fdopen(fd, 'rb') as f:
+            stat = os.fstat(f.fileno())
+            if (stat.st_dev, stat.st_ino) != self._inode or stat.st_size < self._offset:
+                self._leases, self._inode, self._offset = {}, (stat.st_dev, stat.st_ino), 0
+            f.seek(self._offset)
+            leases, parsed = parse(f.read())
+            self._offset += parsed
+            for lease in leases:
+                self._leases[lease['ip']] = lease
+        return self._leases
+
+_files = {}
+
+def lease_file(path: str) -> LeaseFile:
+    """ Process-wide LeaseFile of path, so repeated reads are incremental """
+    if path not in _files:
+        _files[path] = LeaseFile(path)
+    return _files[path]
@@ -13,10 +13,12 @@
 # You should have received a copy of the GNU Lesser General Public
 # License along with this library.  If not, see <http://www.gnu.org/licenses/>.
 
-import os
 import re
+import ctypes
+import socket
+import struct
 
-from vyos.utils.process import popen
+from fcntl import ioctl
 
 # These drivers do not support using ethtool to change the speed, duplex, or
 # flow control settings
@@ -24,6 +26,180 @@ _drivers_without_speed_duplex_flow = ['vmxnet3', 'virtio_net', 'xen_netfront',
                                       'iavf', 'ice', 'i40e', 'hv_netvsc', 'veth', 'ixgbevf',
                                       'tun']
 
+SIOCETHTOOL = 0x8946
+
+ETHTOOL_GDRVINFO = 0x03
+ETHTOOL_GRINGPARAM = 0x10
+ETHTOOL_GPAUSEPARAM = 0x12
+ETHTOOL_GSTRINGS = 0x1b
+ETHTOOL_GSSET_INFO = 0x37
+ETHTOOL_GFEATURES = 0x3a
+ETHTOOL_GLINKSETTINGS = 0x4c
+
+ETH_SS_FEATURES = 4
+ETH_SS_LINK_MODES = 7
+ETH_GSTRING_LEN = 32
+
+ETHTOOL_LINK_MODE_Autoneg_BIT = 6
+AUTONEG_ENABLE = 1
+
+# Feature groups as shown by 'ethtool --show-features' in addition to the
+# kernel feature names, a group is enabled if any of its features is enabled
+# and fixed if none of its features can be changed
+_feature_groups = {
+    'rx-checksumming': r'rx-checksum$',
+    'tx-checksumming': r'tx-checksum-',
+    'scatter-gather': r'tx-scatter-gather',
+    'tcp-segmentation-offload': r'tx-tcp.*-segmentation$',
+    'udp-fragmentation-offload': r'tx-udp-fragmentation$',
+    'generic-segmentation-offload': r'tx-generic-segmentation$',
+    'generic-receive-offload': r'rx-gro$',
+    'large-receive-offload': r'rx-lro$',
+    'rx-vlan-offload': r'rx-vlan-hw-parse$',
+    'tx-vlan-offload': r'tx-vlan-hw-insert$',
+    'ntuple-filters': r'rx-ntuple-filter$',
+    'receive-hashing': r'rx-hashing$',
+}
+
+# Adapter information is cached per process and interface name, setters
+# changing the adapter configuration call invalidate()
+_cache = {}
+
+def invalidate(ifname=None):
+    """ Drop cached adapter information of ifname or of all interfaces """
+    if ifname is None:
+        _cache.clear()
+    else:
+        _cache.pop(ifname, None)
+
+def _ethtool(sock, ifname, data):
+    """ Run a SIOCETHTOOL request, data is updated in place """
+    buf = ctypes.create_string_buffer(data, len(data))
+    ifreq = struct.pack('16sP', ifname.encode(), ctypes.addressof(buf))
+    ioctl(sock, SIOCETHTOOL, ifreq)
+    return buf.raw
+
+def _strings(sock, ifname, string_set):
+    """ Names of an ethtool string set, e.g. all kernel feature names """
+    data = _ethtool(sock, ifname, struct.pack('=IIQI', ETHTOOL_GSSET_INFO, 0,
+                                              1 << string_set, 0))
+    _, _, mask, count = struct.unpack('=IIQI', data)
+    if not mask:
+        return []
+    data = _ethtool(sock, ifname, struct.pack('=III', ETHTOOL_GSTRINGS,
+                                              string_set, count) +
+                    bytes(count * ETH_GSTRING_LEN))
+    return [data[12 + i * ETH_GSTRING_LEN:12 + (i + 1) * ETH_GSTRING_LEN]
+            .split(b'\0', 1)[0].decode() for i in range(count)]
+
+def _bits(words, nbits):
+    return [i for i in range(nbits) if words[i // 32] & (1 << (i % 32))]
+
+def _query(ifname):
+    """ Read all adapter information through the ethtool ioctl interface """
+    data = {
+        'driver': None,
+        'features': {},
+        'speed_duplex': {'auto': {'auto': ''}},
+        'auto_negotiation': False,
+        'auto_negotiation_supported': None,
+        'ring_buffers': {},
+        'ring_buffers_max': {},
+        'flow_control': False,
+        'flow_control_enabled': None,
+    }
+
+    with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:
+        try:
+            tmp = _ethtool(sock, ifname, struct.pack('=I', ETHTOOL_GDRVINFO) +
+                           bytes(192))
+            driver = re.match(r'\w+', tmp[4:36].split(b'\0', 1)[0].decode())
+            if driver:
+                data['driver'] = driver.group(0)
+        except OSError:
+            pass
+
+        # Supported link-speed and duplex settings and auto-negotiation
+        try:
+            header = struct.Struct('=IIBBBBBBBbBBBB28x')
+            tmp = _ethtool(sock, ifname, header.pack(ETHTOOL_GLINKSETTINGS,
+                                                     *[0] * 13))
+            nwords = -header.unpack_from(tmp)[9]
+            if nwords > 0:
+                tmp = _ethtool(sock, ifname, header.pack(
+                    ETHTOOL_GLINKSETTINGS, *[0] * 8, nwords, 0, 0, 0, 0) +
+                    bytes(3 * 4 * nwords))
+                autoneg = header.unpack_from(tmp)[5]
+                supported = struct.unpack_from(f'={nwords}I', tmp, header.size)
+                modes = _strings(sock, ifname, ETH_SS_LINK_MODES)
+                bits = _bits(supported, min(len(modes), 32 * nwords))
+                pattern = re.compile(r'\d+base.*')
+                for bit in bits:
+                    block = modes[bit]
+                    if not pattern.match(block) or '/' not in block:
+                        continue
+                    speed = block.split('base')[0]
+                    duplex = block.split('/')[-1].lower()
+                    data['speed_duplex'].setdefault(speed, {})[duplex] = ''
+                supports_autoneg = ETHTOOL_LINK_MODE_Autoneg_BIT in bits
+                data['auto_negotiation_supported'] = supports_autoneg
+                if supports_autoneg:
+                    data['auto_negotiation'] = bool(autoneg == AUTONEG_ENABLE)
+        except OSError:
+            pass
+
+        try:
+            names = _strings(sock, ifname, ETH_SS_FEATURES)
+            blocks = (len(names) + 31) // 32
+            tmp = _ethtool(sock, ifname, struct.pack('=II', ETHTOOL_GFEATURES,
+                                                     blocks) +
+                           bytes(16 * blocks))
+            words = struct.unpack_from(f'={4 * blocks}I', tmp, 8)
+            available, active, never_changed = [words[i::4] for i in (0, 2, 3)]
+            changeable = [a & ~n for a, n in zip(available, never_changed)]
+            enabled = set(_bits(active, len(names)))
+            fixed = set(range(len(names))) - set(_bits(changeable, len(names)))
+            for name, pattern in _feature_groups.items():
+                members = [i for i, n in enumerate(names) if re.match(pattern, n)]
+                if members:
+                    data['features'][name] = {
+                        'enabled': any(i in enabled for i in members),
+                        'fixed': all(i in fixed for i in members),
+                    }
+            for i, name in enumerate(names):
+                if name:
+                    data['features'][name] = {'enabled': i in enabled,
+                                              'fixed': i in fixed}
+        except OSError:
+            pass
+
+        try:
+            tmp = _ethtool(sock, ifname, struct.pack('=I', ETHTOOL_GRINGPARAM) +
+                           bytes(32))
+            values = struct.unpack('=8I', tmp[4:36])
+            # Zero is shown as n/a by ethtool, only tx/rx values are of interest
+            for key, max_value, value in zip(['rx', 'rx_mini', 'rx_jumbo', 'tx'],
+                                             values[:4], values[4:]):
+                if max_value:
+                    data['ring_buffers_max'][key] = str(max_value)
+                if value:
+                    data['ring_buffers'][key] = str(value)
+        except OSError:
+            pass
+
+        # Get current flow control settings, but this is not supported by
+        # all NICs (e.g. vmxnet3 does not support is)
+        try:
+            tmp = _ethtool(sock, ifname, struct.pack('=4I', ETHTOOL_GPAUSEPARAM,
+                                                     0, 0, 0))
+            autoneg = struct.unpack('=4I', tmp)[1]
+            data['flow_control'] = True
+            data['flow_control_enabled'] = 'on' if autoneg else 'off'
+        except OSError:
+            pass
+
+    return data
+
 class Ethtool:
     """
     Class is used to retrive and cache information about an ethernet adapter
@@ -57,88 +233,19 @@ class Ethtool:
     _flow_control_enabled = None
 
     def __init__(self, ifname):
-        # Get driver used for interface
-        out, err = popen(f'ethtool --driver {ifname}')
-        driver = re.search(r'driver:\s(\w+)', out)
-        if driver:
-            self._driver_name = driver.group(1)
-
-        # Build a dictinary of supported link-speed and dupley settings.
-        out, err = popen(f'ethtool {ifname}')
-        reading = False
-        pattern = re.compile(r'\d+base.*')
-        for line in out.splitlines()[1:]:
-            line = line.lstrip()
-            if 'Supported link modes:' in line:
-                reading = True
-            if 'Supported pause frame use:' in line:
-                reading = False
-            if reading:
-                for block in line.split():
-                    if pattern.search(block):
-                        speed = block.split('base')[0]
-                        duplex = block.split('/')[-1].lower()
-                        if speed not in self._speed_duplex:
-                            self._speed_duplex.update({ speed : {}})
-                        if duplex not in self._speed_duplex[speed]:
-                            self._speed_duplex[speed].update({ duplex : ''})
-            if 'Supports auto-negotiation:' in line:
-                # Split the following string: Auto-negotiation: off
-                # we are only interested in off or on
-                tmp = line.split()[-1]
-                self._auto_negotiation_supported = bool(tmp == 'Yes')
-            # Only read in if Auto-negotiation is supported
-            if self._auto_negotiation_supported and 'Auto-negotiation:' in line:
-                # Split the following string: Auto-negotiation: off
-                # we are only interested in off or on
-                tmp = line.split()[-1]
-                self._auto_negotiation = bool(tmp == 'on')
-
-        # Now populate features dictionaty
-        out, err = popen(f'ethtool --show-features {ifname}')
-        # skip the first line, it only says: "Features for eth0":
-        for line in out.splitlines()[1:]:
-            if ":" in line:
-                key, value = [s.strip() for s in line.strip().split(":", 1)]
-                fixed = bool('fixed' in value)
-                if fixed:
-                    value = value.split()[0].strip()
-                self._features[key.strip()] = {
-                    'enabled' : bool(value == 'on'),
-                    'fixed' : fixed
-                }
-
-        out, err = popen(f'ethtool --show-ring {ifname}')
-        # We are only interested in line 2-5 which contains the device maximum
-        # ringbuffers
-        for line in out.splitlines()[2:6]:
-            if ':' in line:
-                key, value = [s.strip() for s in line.strip().split(":", 1)]
-                key = key.lower().replace(' ', '_')
-                # T3645: ethtool version used on Debian Bullseye changed the
-                # output format from 0 -> n/a. As we are only interested in the
-                # tx/rx keys we do not care about RX Mini/Jumbo.
-                if value.isdigit():
-                    self._ring_buffers_max[key] = value
-        # Now we wan't to get the current RX/TX ringbuffer values - used for
-        for line in out.splitlines()[7:11]:
-            if ':' in line:
-                key, value = [s.strip() for s in line.strip().split(":", 1)]
-                key = key.lower().replace(' ', '_')
-                # T3645: ethtool version used on Debian Bullseye changed the
-                # output format from 0 -> n/a. As we are only interested in the
-                # tx/rx keys we do not care about RX Mini/Jumbo.
-                if value.isdigit():
-                    self._ring_buffers[key] = value
+        if ifname not in _cache:
+            _cache[ifname] = _query(ifname)
+        data = _cache[ifname]
 
-        # Get current flow control settings, but this is not supported by
-        # all NICs (e.g. vmxnet3 does not support is)
-        out, err = popen(f'ethtool --show-pause {ifname}')
-        if len(out.splitlines()) > 1:
-            self._flow_control = True
-            # read current flow control setting, this returns:
-            # ['Autonegotiate:', 'on']
-            self._flow_control_enabled = out.splitlines()[1].split()[-1]
+        self._driver_name = data['driver']
+        self._features = data['features']
+        self._speed_duplex = data['speed_duplex']
+        self._auto_negotiation = data['auto_negotiation']
+        self._auto_negotiation_supported = data['auto_negotiation_supported']
+        self._ring_buffers = data['ring_buffers']
+        self._ring_buffers_max = data['ring_buffers_max']
+        self._flow_control = data['flow_control']
+        self._flow_control_enabled = data['flow_control_enabled']
 
     def check_auto_negotiation_supported(self):
         """ Check if the NIC supports changing auto-negotiation """
@@ -14,22 +14,20 @@
 # You should have received a copy of the GNU General Public License
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
-import csv
-import gzip
 import os
 import re
 
 from pathlib import Path
-from socket import AF_INET
-from socket import AF_INET6
-from socket import getaddrinfo
 from time import strftime
 
+from vyos.geoip import open_index
 from vyos.remote import download
-from vyos.template import is_ipv4
 from vyos.template import render
+from vyos.utils.cache import persistent
 from vyos.utils.dict import dict_search_args
 from vyos.utils.dict import dict_search_recursive
+from vyos.utils.network import format_ranges
+from vyos.utils.network import merge_ranges
 from vyos.utils.process import call
 from vyos.utils.process import cmd
 from vyos.utils.process import run
@@ -56,13 +54,6 @@ def fqdn_config_parse(firewall):
                 set_name = f'name6_{priority}_{rule}_{suffix}'
             firewall['ip6_fqdn'][set_name] = domain
 
-def fqdn_resolve(fqdn, ipv6=False):
-    try:
-        res = getaddrinfo(fqdn, None, AF_INET6 if ipv6 else AF_INET)
-        return set(item[4][0] for item in res)
-    except:
-        return None
-
 # End Domain Resolver
 
 def find_nftables_rule(table, chain, rule_matches=[]):
@@ -85,6 +76,7 @@ def nft_action(vyos_action):
         return 'return'
     return vyos_action
 
+@persistent('firewall_rule')
 def parse_rule(rule_conf, hook, fw_name, rule_id, ip_name):
     output = []
 
@@ -514,23 +506,10 @@ nftables_geoip_conf = '/run/nftables-geoip.conf'
 geoip_database = '/usr/share/vyos-geoip/dbip-country-lite.csv.gz'
 geoip_lock_file = '/run/vyos-geoip.lock'
 
-def geoip_load_data(codes=[]):
-    data = None
-
-    if not os.path.exists(geoip_database):
-        return []
-
-    try:
-        with gzip.open(geoip_database, mode='rt') as csv_fh:
-            reader = csv.reader(csv_fh)
-            out = []
-            for start, end, code in reader:
-                if code.lower() in codes:
-                    out.append([start, end, code.lower()])
-            return out
-    except:
-        print('Error: Failed to open GeoIP database')
-    return []
+def geoip_load_ranges(codes, ipv6=False):
+    """ Integer (start, end) ranges of the requested country codes, by code """
+    with open_index(geoip_database) as index:
+        return {code: index.ranges(code, ipv6) for code in codes}
 
 def geoip_download_data():
     url = 'https://download.db-ip.com/free/dbip-country-lite-{}.csv.gz'.format(strftime("%Y-%m"))
@@ -598,19 +577,26 @@ def geoip_update(firewall, force=False):
                 print("GeoIP not in use by firewall")
             return True
 
-        geoip_data = geoip_load_data([*ipv4_codes, *ipv6_codes])
-
-        # Iterate IP blocks to assign to sets
-        for start, end, code in geoip_data:
-            ipv4 = is_ipv4(start)
-            if code in ipv4_codes and ipv4:
-                ip_range = f'{start}-{end}' if start != end else start
-                for setname in ipv4_codes[code]:
-                    ipv4_sets.setdefault(setname, []).append(ip_range)
-            if code in ipv6_codes and not ipv4:
-                ip_range = f'{start}-{end}' if start != end else start
-                for setname in ipv6_codes[code]:
-                    ipv6_sets.setdefault(setname, []).append(ip_range)
+        try:
+            ipv4_ranges = geoip_load_ranges(ipv4_codes)
+            ipv6_ranges = geoip_load_ranges(ipv6_codes, ipv6=True)
+        except (OSError, ValueError):
+            print('Error: Failed to open GeoIP database')
+            return False
+
+        # Assign IP blocks of every country to its sets
+        for code, ip_ranges in ipv4_ranges.items():
+            for setname in ipv4_codes[code]:
+                ipv4_sets.setdefault(setname, []).extend(ip_ranges)
+        for code, ip_ranges in ipv6_ranges.items():
+            for setname in ipv6_codes[code]:
+                ipv6_sets.setdefault(setname, []).extend(ip_ranges)
+
+        # Merge adjacent ranges of neighbouring countries
+        for setname, ip_ranges in ipv4_sets.items():
+            ipv4_sets[setname] = format_ranges(merge_ranges(ip_ranges))
+        for setname, ip_ranges in ipv6_sets.items():
+            ipv6_sets[setname] = format_ranges(merge_ranges(ip_ranges), ipv6=True)
 
         render(nftables_geoip_conf, 'firewall/nftables-geoip-update.j2', {
             'ipv4_sets': ipv4_sets,
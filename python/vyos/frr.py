@@ -18,7 +18,8 @@ A Library for interracting with the FRR daemon suite.
 It supports simple configuration manipulation and loading using the official tools
 supplied with FRR (vtysh and frr-reload)
 
-All configuration management and manipulation is done using strings and regex.
+All configuration management and manipulation is done using strings and regex,
+FRRConfig keeps the configuration indexed by top level sections.
 
 
 Example Usage
@@ -68,6 +69,10 @@ Apply the new configuration:
 import tempfile
 import re
 
+from bisect import bisect_left
+from threading import Lock
+
+from vyos import frr_vty
 from vyos.utils.permission import chown
 from vyos.utils.process import cmd
 from vyos.utils.process import popen
@@ -210,8 +215,7 @@ def reload_configuration(config, daemon=None):
     LOG.debug(f'reload_configuration: Executing command against frr-reload: "{cmd}"')
     output, code = popen(cmd, stderr=STDOUT)
     f.close()
-    for i, e in enumerate(output.split('\n')):
-        LOG.debug(f'frr-reload output: {i:3} {e}')
+    _log_lines('frr-reload output:', output.split('\n'))
     if code == 1:
         raise CommitError('FRR configuration failed while running commit. Please ' \
                           'enable debugging to examine logs.\n\n\n' \
@@ -223,6 +227,23 @@ def reload_configuration(config, daemon=None):
     return output
 
 
+def reload_with_retry(config, daemon=None, count_max=5):
+    """ reload_configuration(), retried up to count_max times """
+    # https://github.com/FRRouting/frr/issues/10132
+    # https://github.com/FRRouting/frr/issues/10133
+    count = 0
+    while count < count_max:
+        count += 1
+        try:
+            reload_configuration(config, daemon=daemon)
+            return
+        except:
+            # we just need to re-try the commit of the configuration
+            # for the listed FRR issues above
+            pass
+    raise ConfigurationNotValid(f'Config commit retry counter ({count_max}) exceeded for {daemon} dameon!')
+
+
 def save_configuration():
     """ T3217: Save FRR configuration to /run/frr/config/frr.conf """
     return cmd(f'{path_vtysh} -n -w')
@@ -235,14 +256,8 @@ def execute(command):
     if not isinstance(command, str):
         raise ValueError(f'command needs to be a string: {repr(command)}')
 
-    cmd = f"{path_vtysh} -c '{command}'"
-
-    output, code = popen(cmd, stderr=STDOUT)
-    if code:
-        raise OSError(code, output)
-
-    config = output.replace('\r', '')
-    return config
+    # commands are not known to be read-only, do not cache the output
+    return frr_vty.execute(command, cache=False)
 
 
 def configure(lines, daemon=False):
@@ -332,98 +347,129 @@ def remove_section(config, from_re, to_re='!'):
     return _replace_section(config, '', replace_re=rf'^{from_re}$.*?^{to_re}$', before_re=None)
 
 
-def _find_first_block(config, start_pattern, stop_pattern, start_at=0):
-    '''Find start and stop line numbers for a config block
-    config:        (list) A list conaining the configuration that is searched
-    start_pattern: (raw-str) The pattern searched for a a start of block tag
-    stop_pattern:  (raw-str) The pattern searched for to signify the end of the block
-    start_at:      (int) The index to start searching at in the <config>
-
-    Returns:
-        None: No complete block could be found
-        set(int, int): A complete block found between the line numbers returned in the set
-
-    The object <config> is searched from the start for the regex <start_pattern> until the first match is found.
-    On a successful match it continues the search for the regex <stop_pattern> until it is found.
-    After a successful run a set is returned containing the start and stop line numbers.
-    '''
-    LOG.debug(f'_find_first_block: find start={repr(start_pattern)} stop={repr(stop_pattern)} start_at={start_at}')
-    _start = None
-    for i, element in enumerate(config[start_at:], start=start_at):
-        # LOG.debug(f'_find_first_block: running line {i:3} "{element}"')
-        if not _start:
-            if not re.match(start_pattern, element):
-                LOG.debug(f'_find_first_block: no match     {i:3} "{element}"')
-                continue
-            _start = i
-            LOG.debug(f'_find_first_block: Found start  {i:3} "{element}"')
-            continue
-
-        if not re.match(stop_pattern, element):
-            LOG.debug(f'_find_first_block: no match     {i:3} "{element}"')
-            continue
-
-        LOG.debug(f'_find_first_block: Found stop   {i:3} "{element}"')
-        return (_start, i)
-
-    LOG.debug('_find_first_block: exit start={repr(start_pattern)} stop={repr(stop_pattern)} start_at={start_at}')
-    return None
-
+_regex_meta = set('.^$*+?{}[]\\|()')
 
-def _find_first_element(config, pattern, start_at=0):
-    '''Find the first element that matches the current pattern in config
-    config:        (list) A list containing the configuration that is searched
-    start_pattern: (raw-str) The pattern searched for
-    start_at:      (int) The index to start searching at in the <config>
+def _log_lines(prefix, lines):
+    """ Debug log every line, without formatting them when debugging is off """
+    if LOG.isEnabledFor(logging.DEBUG):
+        for i, e in enumerate(lines):
+            LOG.debug('%s %3d %s', prefix, i, e)
 
-    return:   Line index of the line containing the searched pattern
+def _keyword(line):
+    """ Index key of a top level line, its first word """
+    return line.split(' ', 1)[0]
 
-    TODO: for now it returns -1 on a no-match because 0 also returns as False
-    TODO: that means that we can not use False matching to tell if its
-    '''
-    LOG.debug(f'_find_first_element: find start="{pattern}" start_at={start_at}')
-    for i, element in enumerate(config[start_at:], start=0):
-        if re.match(pattern + '$', element):
-            LOG.debug(f'_find_first_element: Found stop {i:3} "{element}"')
-            return i
-        LOG.debug(f'_find_first_element: no match   {i:3} "{element}"')
-    LOG.debug(f'_find_first_element: Did not find any match, exiting')
-    return -1
-
-
-def _find_elements(config, pattern, start_at=0):
-    '''Find all instances of pattern and return a list containing all element indexes
-    config:        (list) A list containing the configuration that is searched
-    start_pattern: (raw-str) The pattern searched for
-    start_at:      (int) The index to start searching at in the <config>
-
-    return:    A list of line indexes containing the searched pattern
-    TODO: refactor this to return a generator instead
-    '''
-    return [i for i, element in enumerate(config[start_at:], start=0) if re.match(pattern + '$', element)]
+def _literal_prefix(pattern):
+    """
+    Text every line matched by pattern (with re.match) starts with, or an
+    empty string if it can not be determined
+    """
+    if '|' in pattern:
+        return ''
+    if pattern.startswith('^'):
+        pattern = pattern[1:]
+    end = 0
+    while end < len(pattern) and pattern[end] not in _regex_meta:
+        end += 1
+    literal = pattern[:end]
+    # the last character is optional or repeated, e.g. 'ospf6?'
+    if end < len(pattern) and pattern[end] in '*?{':
+        literal = literal[:-1]
+    return literal
 
 
 class FRRConfig:
     '''Main FRR Configuration manipulation object
     Using this object the user could load, manipulate and commit the configuration to FRR
+
+    The configuration lines are kept in slots, initially one slot for every
+    top level line followed by its indented lines, e.g. a 'router bgp' stanza.
+    Slots are never inserted or removed, edits only change the lines of the
+    affected slots. An index maps the first word of all top level lines to
+    the slots containing them, so sections are found without matching every
+    line of the configuration.
     '''
     def __init__(self, config=[]):
         self.imported_config = ''
+        # section edits since the configuration was loaded, see Transaction
+        self.edits = []
 
         if isinstance(config, list):
-            self.config = config.copy()
+            self.config = config
             self.original_config = config.copy()
         elif isinstance(config, str):
             self.config = config.split('\n')
-            self.original_config = self.config.copy()
+            self.original_config = self.config
         else:
             raise ValueError(
                 'The config element needs to be a string or list type object')
 
         if config:
-            LOG.debug(f'__init__: frr library initiated with initial config')
-            for i, e in enumerate(self.config):
-                LOG.debug(f'__init__: initial              {i:3} {e}')
+            LOG.debug('__init__: frr library initiated with initial config')
+            _log_lines('__init__: initial             ', self.original_config)
+
+    @property
+    def config(self):
+        '''The configuration as list of lines'''
+        return [line for slot in self._slots for line in slot]
+
+    @config.setter
+    def config(self, lines):
+        self._slots = []
+        self._keys = []
+        self._index = {}
+        for line in lines:
+            if not self._slots or not line[:1].isspace():
+                self._slots.append([])
+            self._slots[-1].append(line)
+        for slot in range(len(self._slots)):
+            self._keys.append(set())
+            self._reindex(slot)
+
+    def _reindex(self, slot):
+        keys = {_keyword(line) for line in self._slots[slot] if not line[:1].isspace()}
+        for key in self._keys[slot] - keys:
+            self._index[key].discard(slot)
+        for key in keys - self._keys[slot]:
+            self._index.setdefault(key, set()).add(slot)
+        self._keys[slot] = keys
+
+    def _candidates(self, pattern):
+        '''Sorted slots which can contain a line matching pattern'''
+        literal = _literal_prefix(pattern)
+        if not literal or literal[0].isspace():
+            return range(len(self._slots))
+        word, space, _ = literal.partition(' ')
+        keys = [word] if space else [k for k in self._index if k.startswith(word)]
+        return sorted(set().union(*(self._index.get(k, ()) for k in keys)))
+
+    def _find(self, regex, candidates, slot=0, line=0):
+        '''First (slot, line) at or after the given position matching regex'''
+        for index in range(bisect_left(candidates, slot), len(candidates)):
+            s = candidates[index]
+            lines = self._slots[s]
+            for i in range(line if s == slot else 0, len(lines)):
+                if regex.match(lines[i]):
+                    return s, i
+        return None
+
+    def _next(self, slot, line):
+        '''Position of the line following (slot, line)'''
+        if line + 1 < len(self._slots[slot]):
+            return slot, line + 1
+        return slot + 1, 0
+
+    def _splice(self, start, end, lines):
+        '''Replace the lines from start up to (excluding) end'''
+        (s, i), (e, j) = start, end
+        if s == e:
+            self._slots[s][i:j] = lines
+        else:
+            self._slots[s][i:] = lines
+            for slot in range(s + 1, min(e + 1, len(self._slots))):
+                del self._slots[slot][:j if slot == e else None]
+                self._reindex(slot)
+        self._reindex(s)
 
     def load_configuration(self, daemon=None):
         '''Load the running configuration from FRR into the config object
@@ -434,17 +480,20 @@ class FRRConfig:
         '''
         init_debugging()
 
-        self.imported_config = get_configuration(daemon=daemon)
+        if _transaction is not None:
+            self.imported_config = _transaction.get_configuration(daemon)
+        else:
+            self.imported_config = get_configuration(daemon=daemon)
+        self.edits = []
         if daemon:
             LOG.debug(f'load_configuration: Configuration loaded from FRR daemon {daemon}')
         else:
             LOG.debug(f'load_configuration: Configuration loaded from FRR integrated config')
 
         self.original_config = self.imported_config.split('\n')
-        self.config = self.original_config.copy()
+        self.config = self.original_config
 
-        for i, e in enumerate(self.imported_config.split('\n')):
-            LOG.debug(f'load_configuration:  loaded    {i:3} {e}')
+        _log_lines('load_configuration:  loaded   ', self.original_config)
         return
 
     def test_configuration(self):
@@ -452,34 +501,34 @@ class FRRConfig:
         This will exception if FRR failes to load the current configuration object
         '''
         LOG.debug('test_configation: Testing configuration')
-        mark_configuration('\n'.join(self.config))
+        mark_configuration(str(self))
 
     def commit_configuration(self, daemon=None):
         '''
         Commit the current configuration to FRR daemon: str with name of the
         FRR daemon to commit to or None to use the consolidated config.
 
-        Configuration is automatically saved after apply
+        Configuration is automatically saved after apply. Nothing is done if
+        the configuration did not change since load_configuration(). While a
+        transaction is active, the changes are only staged, see Transaction.
         '''
         LOG.debug('commit_configuration:  Commiting configuration')
-        for i, e in enumerate(self.config):
-            LOG.debug(f'commit_configuration: new_config {i:3} {e}')
-
-        # https://github.com/FRRouting/frr/issues/10132
-        # https://github.com/FRRouting/frr/issues/10133
-        count = 0
-        count_max = 5
-        while count < count_max:
-            count += 1
-            try:
-                reload_configuration('\n'.join(self.config), daemon=daemon)
-                break
-            except:
-                # we just need to re-try the commit of the configuration
-                # for the listed FRR issues above
-                pass
-        if count >= count_max:
-            raise ConfigurationNotValid(f'Config commit retry counter ({count_max}) exceeded for {daemon} dameon!')
+        _log_lines('commit_configuration: new_config', self.config)
+
+        if self.imported_config and str(self) == self.imported_config:
+            # nothing changed since load_configuration(), e.g. a dependent
+            # script run for a change of another one
+            LOG.debug('commit_configuration: configuration unchanged, not reloaded')
+            return
+
+        if _transaction is not None:
+            # applied when the transaction ends
+            owner = os.path.splitext(os.path.basename(sys._getframe(1).f_code.co_filename))[0]
+            _transaction.stage(daemon, self.edits, owner)
+            self.edits = []
+            return
+
+        reload_with_retry(str(self), daemon)
 
         # Save configuration to /run/frr/config/frr.conf
         save_configuration()
@@ -490,37 +539,38 @@ class FRRConfig:
             replacement = replacement.split('\n')
         elif not isinstance(replacement, list):
             return ValueError("The replacement element needs to be a string or list type object")
-        LOG.debug(f'modify_section: starting search for {repr(start_pattern)} until {repr(stop_pattern)}')
+        self.edits.append(('modify_section', (start_pattern, replacement, stop_pattern,
+                                              remove_stop_mark, count)))
+        LOG.debug('modify_section: starting search for %r until %r', start_pattern, stop_pattern)
+
+        # While searching, always assume that the user wants to search for the exact pattern he entered
+        # To be more specific the user needs a override, eg. a "pattern.*"
+        start_re = re.compile(start_pattern + '$')
+        stop_re = re.compile(stop_pattern)
+        candidates = self._candidates(start_pattern + '$')
 
         _count = 0
-        _next_start = 0
+        position = (0, 0)
         while True:
             if count and count <= _count:
                 # Break out of the loop after specified amount of matches
-                LOG.debug(f'modify_section: reached limit ({_count}), exiting loop at line {_next_start}')
+                LOG.debug('modify_section: reached limit (%d), exiting loop', _count)
                 break
-            # While searching, always assume that the user wants to search for the exact pattern he entered
-            # To be more specific the user needs a override, eg. a "pattern.*"
-            _w = _find_first_block(
-                self.config, start_pattern+'$', stop_pattern, start_at=_next_start)
-            if not _w:
+            start = self._find(start_re, candidates, *position)
+            stop = None
+            if start:
+                stop = self._find(stop_re, range(len(self._slots)), *self._next(*start))
+            if not stop:
                 # Reached the end, no more elements to remove
-                LOG.debug(f'modify_section: No more config sections found, exiting')
+                LOG.debug('modify_section: No more config sections found, exiting')
                 break
-            start_element, end_element = _w
-            LOG.debug(f'modify_section:   found match between {start_element} and {end_element}')
-            for i, e in enumerate(self.config[start_element:end_element+1 if remove_stop_mark else end_element],
-                                  start=start_element):
-                LOG.debug(f'modify_section:   remove       {i:3} {e}')
-            del self.config[start_element:end_element +
-                            1 if remove_stop_mark else end_element]
-            if replacement:
-                # Append the replacement config at the current position
-                for i, e in enumerate(replacement, start=start_element):
-                    LOG.debug(f'modify_section:   add          {i:3} {e}')
-                self.config[start_element:start_element] = replacement
+            end = self._next(*stop) if remove_stop_mark else stop
+            if LOG.isEnabledFor(logging.DEBUG):
+                LOG.debug('modify_section:   found match between %s and %s', start, stop)
+                _log_lines('modify_section:   add         ', replacement)
+            self._splice(start, end, replacement)
             _count += 1
-            _next_start = start_element + len(replacement)
+            position = (start[0], start[1] + len(replacement))
 
         return _count
 
@@ -530,13 +580,14 @@ class FRRConfig:
             addition = addition.split('\n')
         elif not isinstance(addition, list):
             return ValueError("The replacement element needs to be a string or list type object")
+        self.edits.append(('add_before', (before_pattern, addition)))
 
-        start = _find_first_element(self.config, before_pattern)
-        if start < 0:
+        start = self._find(re.compile(before_pattern + '$'),
+                           self._candidates(before_pattern + '$'))
+        if not start:
             return False
-        for i, e in enumerate(addition, start=start):
-            LOG.debug(f'add_before:   add          {i:3} {e}')
-        self.config[start:start] = addition
+        _log_lines('add_before:   add         ', addition)
+        self._splice(start, start, addition)
         return True
 
     def __str__(self):
@@ -544,3 +595,163 @@ class FRRConfig:
 
     def __repr__(self):
         return f'frr({repr(str(self))})'
+
+
+
+class Transaction:
+    """
+    Commit scoped staging of FRR configuration changes.
+
+    While a transaction is active, FRRConfig.commit_configuration() only
+    records the section edits done since load_configuration() together with
+    the script staging them, and load_configuration() returns the running
+    configuration with all staged edits applied. apply() replays the edits
+    on the running configuration of every daemon, runs frr-reload once per
+    changed daemon and saves the configuration once, instead of once per
+    script. Replaying the edits keeps changes done to FRR by other means in
+    the meantime, e.g. by vtysh, as a script reloading FRR would.
+
+    Should the reload of a daemon fail, the configuration after the edits of
+    every script is checked by vtysh to find the script whose changes FRR
+    does not accept. The daemon is reloaded with the edits of the scripts
+    preceding it, as if the scripts had been committed one by one.
+    """
+    def __init__(self):
+        self._lock = Lock()
+        # daemon: [(owner, edits), ...]
+        self._staged = {}
+
+    @staticmethod
+    def _replay(config, edits):
+        for method, args in edits:
+            getattr(config, method)(*args)
+
+    def get_configuration(self, daemon=None):
+        """ Running configuration of daemon with the staged edits applied """
+        if daemon is None:
+            # the integrated configuration must contain all staged changes
+            errors = self.apply()
+            if errors:
+                raise errors[0][1]
+            return get_configuration()
+
+        with self._lock:
+            staged = list(self._staged.get(daemon, []))
+        config = get_configuration(daemon=daemon)
+        if not staged:
+            return config
+        config = FRRConfig(config)
+        for _, edits in staged:
+            self._replay(config, edits)
+        return str(config)
+
+    def stage(self, daemon, edits, owner):
+        with self._lock:
+            self._staged.setdefault(daemon, []).append((owner, list(edits)))
+        LOG.debug(f'transaction: {owner} staged {len(edits)} edits of {daemon}')
+
+    def discard(self, owner):
+        """ Drop the staged edits of owner, e.g. of a failed script """
+        with self._lock:
+            for daemon in list(self._staged):
+                staged = [s for s in self._staged[daemon] if s[0] != owner]
+                if staged:
+                    self._staged[daemon] = staged
+                else:
+                    del self._staged[daemon]
+
+    def owners(self):
+        """ Scripts with staged edits, by daemon """
+        with self._lock:
+            return {daemon: [owner for owner, _ in staged]
+                    for daemon, staged in self._staged.items()}
+
+    @staticmethod
+    def _blame(steps):
+        """ Index of the first step vtysh rejects, or None """
+        for i, (_, step) in enumerate(steps):
+            try:
+                mark_configuration(step)
+            except (ConfigurationNotValid, OSError):
+                return i
+        return None
+
+    def apply(self):
+        """
+        Reload all daemons with staged edits, in the order of their first
+        edit, and save the configuration. Returns the list of (owner,
+        exception) of the edits which could not be applied.
+        """
+        with self._lock:
+            staged = self._staged
+            self._staged = {}
+
+        errors = []
+        reloaded = False
+        for daemon, changes in staged.items():
+            running = get_configuration(daemon=daemon)
+            config = FRRConfig(running)
+            # configuration after the edits of every script
+            steps = []
+            for owner, edits in changes:
+                self._replay(config, edits)
+                steps.append((owner, str(config)))
+
+            if steps[-1][1] == running:
+                LOG.debug(f'transaction: configuration of {daemon} unchanged')
+                continue
+            try:
+                reload_with_retry(steps[-1][1], daemon)
+                reloaded = True
+                continue
+            except FrrError as e:
+                error = e
+
+            failed = self._blame(steps)
+            if failed is None:
+                # valid syntax, FRR rejected the changes as a whole
+                owners = dict.fromkeys(owner for owner, _ in steps)
+                errors.append((', '.join(owners), error))
+                previous = running
+            else:
+                errors.append((steps[failed][0], error))
+                errors += [(owner, CommitError('not applied, as a preceding '
+                                               'FRR change failed'))
+                           for owner, _ in steps[failed + 1:]]
+                previous = steps[failed - 1][1] if failed else running
+
+            # frr-reload may have applied a part of the changes
+            try:
+                reload_with_retry(previous, daemon)
+                reloaded = reloaded or previous != running
+            except FrrError as e:
+                errors.append((daemon, CommitError(f'previous configuration '
+                                                   f'could not be restored: {e}')))
+
+        if reloaded:
+            # Save configuration to /run/frr/config/frr.conf
+            save_configuration()
+        return errors
+
+_transaction = None
+
+def begin_transaction():
+    """ Stage the edits committed by FRRConfig until end_transaction() """
+    global _transaction
+    _transaction = Transaction()
+
+def end_transaction():
+    """
+    Apply the edits of the current transaction, if any, and return the list
+    of (owner, exception) of the edits which failed
+    """
+    global _transaction
+    transaction, _transaction = _transaction, None
+    if transaction is None:
+        return []
+    return transaction.apply()
+
+def discard_staged(owner):
+    """ Drop the edits staged by owner in the current transaction, if any """
+    if _transaction is not None:
+        _transaction.discard(owner)
@@ -0,0 +1,158 @@
+# Copyright 2023 VyOS maintainers and contributors <maintainers@vyos.io>
+#
+# This library is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License as published by the Free Software Foundation; either
+# version 2.1 of the License, or (at your option) any later version.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with this library.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Streaming reader of FRR routing tables.
+
+The JSON output of FRR for a full table is several hundred megabytes. It is
+decoded one prefix at a time while it is read from FRR, and every route is
+handed to the caller and discarded, so memory use does not depend on the
+size of the table.
+"""
+
+import re
+
+from ipaddress import ip_address
+from ipaddress import ip_network
+from json import JSONDecoder
+from json import JSONDecodeError
+
+from vyos import frr_vty
+
+_whitespace = re.compile(r'\s*')
+_decoder = JSONDecoder()
+
+class _Reader:
+    """ JSON values of a stream of text chunks, read as far as needed """
+    def __init__(self, chunks):
+        self._chunks = iter(chunks)
+        self._buffer = ''
+        self._pos = 0
+
+    def _read(self) -> bool:
+        chunk = next(self._chunks, None)
+        if chunk is None:
+            return False
+        self._buffer = self._buffer[self._pos:] + chunk
+        self._pos = 0
+        return True
+
+    def _error(self, msg):
+        return ValueError(f'{msg} in JSON output of FRR')
+
+    def peek(self) -> str:
+        """ Next character which is not whitespace, '' at the end """
+        while True:
+            self._pos = _whitespace.match(self._buffer, self._pos).end()
+            if self._pos < len(self._buffer):
+                return self._buffer[self._pos]
+            if not self._read():
+                return ''
+
+    def expect(self, char):
+        if self.peek() != char:
+            raise self._error(f'expected {char!r}')
+        self._pos += 1
+
+    def value(self):
+        self.peek()
+        while True:
+            try:
+                value, end = _decoder.raw_decode(self._buffer, self._pos)
+            except JSONDecodeError:
+                if not self._read():
+                    raise self._error('incomplete value')
+                continue
+            # a number may continue in the next chunk
+            if end == len(self._buffer) and isinstance(value, (int, float)) \
+                    and self._read():
+                continue
+            self._pos = end
+            return value
+
+    def items(self, path):
+        self.expect('{')
+        if self.peek() == '}':
+            # e.g. FRR output if the daemon has nothing configured
+            self._pos += 1
+            return
+
+        found = not path
+        while True:
+            key = self.value()
+            self.expect(':')
+            if not path:
+                yield key, self.value()
+            elif key == path[0] and self.peek() == '{':
+                found = True
+                yield from self.items(path[1:])
+            else:
+                self.value()
+            char = self.peek()
+            self._pos += 1
+            if char == '}':
+                break
+            if char != ',':
+                raise self._error("expected ',' or '}'")
+        if not found:
+            raise KeyError(path[0])
+
+def iter_items(chunks, path=()):
+    """
+    Generator of the (key, value) items of the JSON object at path, e.g.
+    ('routes',), in the JSON object read from an iterable of text chunks.
+    Empty input and empty objects have no items, raises KeyError if path does
+    not exist otherwise.
+    """
+    reader = _Reader(chunks)
+    if reader.peek():
+        yield from reader.items(list(path))
+
+def routes(command: str, path=(), save_key_to=None):
+    """
+    Generator of the routes (or BGP paths) in the output of an FRR JSON
+    command, the elements of the per prefix lists in the object at path.
+    The prefix is saved as save_key_to, as done by dict_to_list().
+    """
+    for prefix, value in iter_items(frr_vty.stream(command), path):
+        for route in value if isinstance(value, list) else [value]:
+            if save_key_to is not None:
+                route[save_key_to] = prefix
+            yield route
+
+class NexthopFilter:
+    """
+    Match routes and BGP paths with a nexthop in a prefix, or an address,
+    or via an interface. Raises ValueError for an invalid prefix.
+    """
+    def __init__(self, nexthop: str):
+        self.network = None
+        self.interface = None
+        if re.match(r'^[0-9a-fA-F:.]+(/\d+)?$', nexthop) and \
+                re.search(r'[.:]', nexthop):
+            self.network = ip_network(nexthop, strict=False)
+        else:
+            self.interface = nexthop
+
+    def _match(self, nexthop):
+        if self.interface:
+            return nexthop.get('interfaceName') == self.interface
+        try:
+            return ip_address(nexthop.get('ip', '')) in self.network
+        except ValueError:
+            return False
+
+    def __call__(self, route: dict) -> bool:
+        return any(self._match(nexthop) for nexthop in route.get('nexthops', []))
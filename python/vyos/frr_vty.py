@@ -0,0 +1,329 @@
+# Copyright 2023 VyOS maintainers and contributors <maintainers@vyos.io>
+#
+# This library is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License as published by the Free Software Foundation; either
+# version 2.1 of the License, or (at your option) any later version.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with this library.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Client of the vty sockets of the FRR daemons.
+
+vtysh connects to the socket of every FRR daemon for each invocation. This
+module sends commands directly to /run/frr/<daemon>.vty, using the protocol
+spoken by vtysh, and keeps the connections open for later commands of the
+same process, e.g. the HTTP API server. Output of identical read-only
+commands is cached for a short time.
+
+Commands are sent to the daemon implementing them, see daemon_of(). Commands
+of unknown daemons and daemons whose socket can not be used are run by
+vtysh instead.
+"""
+
+import codecs
+import json
+import os
+import re
+import socket
+import threading
+
+from shlex import quote
+from subprocess import Popen
+from subprocess import PIPE
+from subprocess import DEVNULL
+from time import monotonic
+
+from vyos.utils.process import popen
+from vyos.utils.process import STDOUT
+
+path_vty = '/run/frr'
+path_vtysh = '/usr/bin/vtysh'
+
+# seconds the output of a read-only command is reused
+cache_ttl = 2.0
+# idle connections kept per daemon
+max_idle = 4
+timeout = 60
+chunk_size = 65536
+
+# end of the output of a command: three zero bytes and the status
+_end_mark = b'\0\0\0'
+
+# status of commands not understood: no match, ambiguous, incomplete
+_unknown_command = [2, 3, 4]
+
+# daemons implementing read-only commands, first match wins
+_command_daemons = [
+    (re.compile(r'show (ip |ipv6 )?bgp\b'), 'bgpd'),
+    (re.compile(r'show (ip|ipv6) (route|fib|nht|protocol)\b'), 'zebra'),
+    (re.compile(r'show (interface|vrf|nexthop-group|zebra)\b'), 'zebra'),
+    (re.compile(r'show ip ospf\b'), 'ospfd'),
+    (re.compile(r'show ipv6 ospf6\b'), 'ospf6d'),
+    (re.compile(r'show (ip )?rip\b'), 'ripd'),
+    (re.compile(r'show ipv6 ripng\b'), 'ripngd'),
+    (re.compile(r'show isis\b'), 'isisd'),
+    (re.compile(r'show bfd\b'), 'bfdd'),
+    (re.compile(r'show (ip|ipv6) pim\b'), 'pimd'),
+    (re.compile(r'show babel\b'), 'babeld'),
+]
+
+def daemon_of(command: str):
+    """ FRR daemon implementing a read-only command, None if unknown """
+    for regex, daemon in _command_daemons:
+        if regex.match(command):
+            return daemon
+    return None
+
+class VtyError(OSError):
+    """ A command was rejected by the daemon, errno is the vty status """
+    pass
+
+class Connection:
+    """ A vty session with one daemon, as established by vtysh """
+    def __init__(self, daemon: str):
+        self.daemon = daemon
+        self._socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self._socket.settimeout(timeout)
+        try:
+            self._socket.connect(os.path.join(path_vty, f'{self.daemon}.vty'))
+            # vtysh sessions start in the view node
+            self.execute('enable')
+        except:
+            self._socket.close()
+            raise
+
+    def stream(self, command: str):
+        """
+        Generator of the output of command in chunks as read. The connection
+        can not be used for other commands unless the generator completed.
+        """
+        self._socket.sendall(command.encode() + b'\0')
+        decoder = codecs.getincrementaldecoder('utf-8')('replace')
+        pending = b''
+        while True:
+            data = self._socket.recv(chunk_size)
+            if not data:
+                raise ConnectionError(f'{self.daemon} closed the vty connection')
+            pending += data
+            if len(pending) >= 4 and pending[-4:-1] == _end_mark:
+                break
+            # the last bytes may be the start of the end mark
+            text = decoder.decode(pending[:-4])
+            pending = pending[-4:]
+            if text:
+                yield text
+        status = pending[-1]
+        text = decoder.decode(pending[:-4], final=True)
+        if text:
+            yield text
+        if status:
+            raise VtyError(status, '')
+
+    def execute(self, command: str) -> str:
+        chunks = []
+        try:
+            for text in self.stream(command):
+                chunks.append(text)
+        except VtyError as e:
+            raise VtyError(e.errno, ''.join(chunks))
+        return ''.join(chunks)
+
+    def close(self):
+        self._socket.close()
+
+class Client:
+    """
+    Pool of vty connections by daemon, with a cache of the output of
+    read-only commands. Safe to be used by multiple threads.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._idle = {}
+        self._cache = {}
+
+    def _acquire(self, daemon):
+        with self._lock:
+            idle = self._idle.get(daemon)
+            if idle:
+                return idle.pop(), True
+        return Connection(daemon), False
+
+    def _release(self, connection):
+        with self._lock:
+            idle = self._idle.setdefault(connection.daemon, [])
+            if len(idle) < max_idle:
+                idle.append(connection)
+                return
+        connection.close()
+
+    def _run(self, connection, command):
+        """ Output of command, connection is released or closed afterwards """
+        try:
+            output = connection.execute(command)
+        except VtyError:
+            # the session is still usable
+            self._release(connection)
+            raise
+        except BaseException:
+            connection.close()
+            raise
+        self._release(connection)
+        return output
+
+    def _execute(self, daemon, command):
+        connection, reused = self._acquire(daemon)
+        try:
+            return self._run(connection, command)
+        except VtyError:
+            raise
+        except OSError:
+            if not reused:
+                raise
+        # the daemon was restarted since the connection was opened
+        return self._run(Connection(daemon), command)
+
+    def execute(self, command: str, daemon=None, cache=True) -> str:
+        """
+        Output of command, run by daemon or the daemon implementing it. If
+        cache is True, show commands may return output up to cache_ttl
+        seconds old. Raises OSError if the command failed.
+        """
+        command = command.strip()
+        daemon = daemon or daemon_of(command)
+        cacheable = cache and command.startswith('show ')
+        key = (daemon, command)
+        if cacheable:
+            with self._lock:
+                entry = self._cache.get(key)
+            if entry and entry[0] > monotonic():
+                return entry[1]
+
+        output = None
+        if daemon:
+            try:
+                # same as the output of vtysh, see vyos.utils.process.popen()
+                output = self._execute(daemon, command).replace('\r\n', '\n').strip()
+            except (FileNotFoundError, PermissionError, ConnectionRefusedError):
+                # daemon not running or socket not accessible
+                pass
+            except VtyError as e:
+                # let vtysh find the daemon or report the error
+                if e.errno not in _unknown_command:
+                    raise
+        if output is None:
+            output = vtysh(command, daemon)
+
+        if cacheable:
+            with self._lock:
+                now = monotonic()
+                self._cache = {k: v for k, v in self._cache.items() if v[0] > now}
+                self._cache[key] = (now + cache_ttl, output)
+        return output
+
+    def execute_json(self, command: str, daemon=None, cache=True):
+        """ Output of command, with 'json' appended if missing, parsed """
+        command = command.strip()
+        if not command.endswith(' json'):
+            command += ' json'
+        output = self.execute(command, daemon=daemon, cache=cache).strip()
+        # some commands return nothing instead of an empty object
+        return json.loads(output) if output else {}
+
+    def clear_cache(self):
+        with self._lock:
+            self._cache = {}
+
+    def close(self):
+        """ Close all idle connections """
+        with self._lock:
+            idle, self._idle = self._idle, {}
+        for connections in idle.values():
+            for connection in connections:
+                connection.close()
+
+def vtysh(command: str, daemon=None) -> str:
+    """ Output of command run by vtysh, raises OSError if it failed """
+    command = f'{path_vtysh} -c {quote(command)}'
+    if daemon:
+        command += f' -d {daemon}'
+    output, code = popen(command, stderr=STDOUT)
+    if code:
+        raise OSError(code, output)
+    return output.replace('\r', '')
+
+def vtysh_stream(command: str, daemon=None):
+    """ Generator of the output of command run by vtysh in chunks as read """
+    args = [path_vtysh, '-c', command]
+    if daemon:
+        args += ['-d', daemon]
+    proc = Popen(args, stdout=PIPE, stderr=DEVNULL)
+    decoder = codecs.getincrementaldecoder('utf-8')('replace')
+    complete = False
+    try:
+        for data in iter(lambda: proc.stdout.read1(chunk_size), b''):
+            text = decoder.decode(data)
+            if text:
+                yield text
+        complete = True
+    finally:
+        proc.stdout.close()
+        if not complete:
+            proc.kill()
+        proc.wait()
+    if proc.returncode != 0:
+        raise OSError(proc.returncode, f'vtysh failed to run {command!r}')
+
+def stream(command: str, daemon=None):
+    """
+    Generator of the output of command in chunks as read, for output too
+    large to be kept in memory, e.g. a full routing table. Uses a connection
+    of its own and no cache.
+    """
+    command = command.strip()
+    daemon = daemon or daemon_of(command)
+    connection = None
+    if daemon:
+        try:
+            connection = Connection(daemon)
+        except (FileNotFoundError, PermissionError, ConnectionRefusedError):
+            # daemon not running or socket not accessible
+            pass
+    if connection is None:
+        yield from vtysh_stream(command, daemon)
+        return
+
+    started = False
+    try:
+        for text in connection.stream(command):
+            started = True
+            yield text
+        return
+    except VtyError as e:
+        # let vtysh find the daemon or report the error
+        if started or e.errno not in _unknown_command:
+            raise
+    finally:
+        connection.close()
+    yield from vtysh_stream(command, daemon)
+
+_client = None
+
+def client() -> Client:
+    """ The Client shared by all users of a process """
+    global _client
+    if _client is None:
+        _client = Client()
+    return _client
+
+def execute(command: str, daemon=None, cache=True) -> str:
+    return client().execute(command, daemon=daemon, cache=cache)
+
+def execute_json(command: str, daemon=None, cache=True):
+    return client().execute_json(command, daemon=daemon, cache=cache)
@@ -0,0 +1,203 @@
+# Copyright 2023 VyOS maintainers and contributors <maintainers@vyos.io>
+#
+# This library is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License as published by the Free Software Foundation; either
+# version 2.1 of the License, or (at your option) any later version.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with this library.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Binary per-country index of the GeoIP CSV database.
+
+The index is built once from the gzipped CSV file and stored next to it, or
+in cache_dir if that is not writable, e.g. for op mode users. If neither can
+be written, it is built in memory for every use. It holds the sorted and
+merged IPv4 and IPv6 ranges of every country as fixed size big-endian
+records, so that the ranges of a few countries can be read from a memory
+mapping without parsing the whole database.
+
+Layout: header (magic, source mtime and size, number of countries), one
+directory entry per country (code, offset and count of IPv4 and IPv6
+ranges), followed by the range records.
+"""
+
+import csv
+import gzip
+import mmap
+import os
+import socket
+import struct
+
+from vyos.utils.network import merge_ranges
+
+magic = b'VYOSGEO1'
+
+cache_dir = '/run/vyos-geoip'
+
+_header = struct.Struct('!8sQQI')
+_entry = struct.Struct('!2sQIQI')
+_ipv4 = struct.Struct('!II')
+_ipv6 = struct.Struct('!QQQQ')
+
+def index_path(database: str) -> str:
+    path = database[:-len('.gz')] if database.endswith('.gz') else database
+    return os.path.splitext(path)[0] + '.idx'
+
+def cache_path(database: str) -> str:
+    return os.path.join(cache_dir, os.path.basename(index_path(database)))
+
+def _source_id(database):
+    stat = os.stat(database)
+    return stat.st_mtime_ns, stat.st_size
+
+def address_to_int(address: str):
+    """ Integer value and whether address is IPv6 """
+    if ':' in address:
+        return int.from_bytes(socket.inet_pton(socket.AF_INET6, address), 'big'), True
+    return int.from_bytes(socket.inet_aton(address), 'big'), False
+
+def int_to_address(value: int, ipv6=False) -> str:
+    if ipv6:
+        return socket.inet_ntop(socket.AF_INET6, value.to_bytes(16, 'big'))
+    return socket.inet_ntoa(value.to_bytes(4, 'big'))
+
+def _build(database: str) -> list:
+    """ Chunks of the index of the CSV database """
+    source = _source_id(database)
+    countries = {}
+
+    with gzip.open(database, mode='rt') as csv_fh:
+        for row in csv.reader(csv_fh):
+            if len(row) != 3 or len(row[2]) != 2:
+                continue
+            start, ipv6 = address_to_int(row[0])
+            end, _ = address_to_int(row[1])
+            ranges = countries.setdefault(row[2].lower(), ([], []))
+            ranges[ipv6].append((start, end))
+
+    data_offset = _header.size + _entry.size * len(countries)
+    directory = []
+    data = []
+    for code in sorted(countries):
+        ipv4, ipv6 = (merge_ranges(r) for r in countries[code])
+        v4_offset = data_offset
+        data.append(b''.join(_ipv4.pack(s, e) for s, e in ipv4))
+        data_offset += len(data[-1])
+        v6_offset = data_offset
+        data.append(b''.join(_ipv6.pack(s >> 64, s & (2**64 - 1), e >> 64,
+                                        e & (2**64 - 1)) for s, e in ipv6))
+        data_offset += len(data[-1])
+        directory.append(_entry.pack(code.encode(), v4_offset, len(ipv4),
+                                     v6_offset, len(ipv6)))
+
+    return [_header.pack(magic, *source, len(countries)),
+            b''.join(directory)] + data
+
+def build_index(database: str, path=None):
+    """ Convert the CSV database to an index, written atomically """
+    path = path or index_path(database)
+    return _write(path, _build(database))
+
+def _write(path, chunks):
+    tmp = f'{path}.{os.getpid()}'
+    try:
+        with open(tmp, 'wb') as f:
+            for chunk in chunks:
+                f.write(chunk)
+        os.replace(tmp, path)
+    except OSError:
+        if os.path.exists(tmp):
+            os.unlink(tmp)
+        raise
+    return path
+
+class GeoIPIndex:
+    """ Memory mapped index, or index data given as bytes, use as context
+    manager """
+    def __init__(self, path: str = None, data: bytes = None):
+        self._file = None
+        if data is not None:
+            self._map = data
+        else:
+            self._file = open(path, 'rb')
+            try:
+                self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+            except Exception:
+                self._file.close()
+                raise
+        try:
+            tag, mtime, size, count = _header.unpack_from(self._map)
+            if tag != magic:
+                raise ValueError(f'{path} is not a GeoIP index')
+        except Exception:
+            self.close()
+            raise
+        self.source = (mtime, size)
+        self._countries = {}
+        for i in range(count):
+            code, *entry = _entry.unpack_from(self._map, _header.size + i * _entry.size)
+            self._countries[code.decode()] = entry
+
+    def close(self):
+        if self._file is not None:
+            self._map.close()
+            self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, tb):
+        self.close()
+
+    def codes(self) -> list:
+        return list(self._countries)
+
+    def ranges(self, code: str, ipv6=False) -> list:
+        """ Sorted, non-adjacent (start, end) integer ranges of a country """
+        if code.lower() not in self._countries:
+            return []
+        v4_offset, v4_count, v6_offset, v6_count = self._countries[code.lower()]
+        if not ipv6:
+            return list(_ipv4.iter_unpack(
+                self._map[v4_offset:v4_offset + v4_count * _ipv4.size]))
+        return [((sh << 64) | sl, (eh << 64) | el) for sh, sl, eh, el in
+                _ipv6.iter_unpack(self._map[v6_offset:v6_offset + v6_count * _ipv6.size])]
+
+def _open_current(path, source):
+    try:
+        index = GeoIPIndex(path)
+    except (OSError, ValueError, struct.error):
+        return None
+    if index.source == source:
+        return index
+    index.close()
+    return None
+
+def open_index(database: str) -> GeoIPIndex:
+    """
+    Index of database, (re)built if missing or if the database changed since
+    the index was built
+    """
+    source = _source_id(database)
+    paths = [index_path(database), cache_path(database)]
+    for path in paths:
+        index = _open_current(path, source)
+        if index is not None:
+            return index
+
+    chunks = _build(database)
+    for path in paths:
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            return GeoIPIndex(_write(path, chunks))
+        except OSError:
+            # read-only filesystem or no permission
+            continue
+    return GeoIPIndex(data=b''.join(chunks))
@@ -15,6 +15,7 @@
 
 import os
 
+from contextlib import contextmanager
 from inspect import signature
 from inspect import _empty
 
@@ -23,12 +24,14 @@ from vyos.utils.process import popen
 from vyos.utils.process import cmd
 from vyos.utils.file import read_file
 from vyos.utils.file import write_file
+from vyos.utils.system import SysctlBatch
 from vyos import debug
 
 class Control(Section):
     _command_get = {}
     _command_set = {}
     _signature = {}
+    _sysfs_batch = None
 
     def __init__(self, **kargs):
         # some commands (such as operation comands - show interfaces, etc.)
@@ -46,10 +49,12 @@ class Control(Section):
         return debug.message(message, self.debug)
 
     def _popen(self, command):
+        self._flush_sysfs()
         return popen(command, self.debug)
 
     def _cmd(self, command):
         import re
+        self._flush_sysfs()
         if 'netns' in self.config:
             # This command must be executed from default netns 'ip link set dev X netns X'
             # exclude set netns cmd from netns to avoid:
@@ -124,21 +129,67 @@ class Control(Section):
     _sysfs_get = {}
     _sysfs_set = {}
 
+    @contextmanager
+    def sysfs_batch(self, dry_run=False):
+        """
+        Queue the sysfs/procfs value writes of this interface and apply only
+        the ones changing a value when leaving the block. Queued writes are
+        also flushed before any command is run and before any other sysfs
+        write, e.g. adding a bond member, so they still take effect in the
+        order they were issued. If the block raises, queued writes are
+        discarded.
+        """
+        if self._sysfs_batch is not None:
+            yield self._sysfs_batch
+            return
+        self._sysfs_batch = SysctlBatch(dry_run=dry_run)
+        try:
+            yield self._sysfs_batch
+        except:
+            self._sysfs_batch.discard()
+            raise
+        else:
+            self._flush_sysfs()
+        finally:
+            self._sysfs_batch = None
+
+    def _flush_sysfs(self):
+        batch = self._sysfs_batch
+        if not batch:
+            return
+        start = len(batch.report)
+        if not batch.flush():
+            filename, value = batch.errors[-1]
+            raise OSError(f"Could not write '{value}' to '{filename}'")
+        prefix = 'skip' if batch.dry_run else 'write'
+        for filename, _, value in batch.report[start:]:
+            self._debug_msg(f"{prefix} '{value}' > '{filename}'")
+
     def _read_sysfs(self, filename):
         """
         Provide a single primitive w/ error checking for reading from sysfs.
         """
         value = None
+        if self._sysfs_batch is not None:
+            value = self._sysfs_batch.get_path(filename)
+            if value is not None:
+                return value
         if os.path.exists(filename):
             value = read_file(filename)
             self._debug_msg("read '{}' < '{}'".format(value, filename))
         return value
 
-    def _write_sysfs(self, filename, value):
+    def _write_sysfs(self, filename, value, batch=False):
         """
         Provide a single primitive w/ error checking for writing to sysfs.
+        Only files holding a value may be batched, writes to other files,
+        e.g. adding a bond member, are done immediately.
         """
         if os.path.isfile(filename):
+            if batch and self._sysfs_batch is not None:
+                self._sysfs_batch.set_path(filename, value)
+                return True
+            self._flush_sysfs()
             write_file(filename, str(value))
             self._debug_msg("write '{}' > '{}'".format(value, filename))
             return True
@@ -173,8 +224,10 @@ class Control(Section):
         if convert:
             value = convert(value)
 
+        # writes of 'action' entries must all be done, even with the same value
         commited = self._write_sysfs(
-            self._sysfs_set[name]['location'].format(**config), value)
+            self._sysfs_set[name]['location'].format(**config), value,
+            batch=not self._sysfs_set[name].get('action', False))
         if not commited:
             errmsg = self._sysfs_set.get('errormsg', '')
             if errmsg:
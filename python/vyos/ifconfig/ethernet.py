@@ -19,6 +19,7 @@ from glob import glob
 
 from vyos.base import Warning
 from vyos.ethtool import Ethtool
+from vyos.ethtool import invalidate as invalidate_ethtool
 from vyos.ifconfig.interface import Interface
 from vyos.utils.dict import dict_search
 from vyos.utils.file import read_file
@@ -46,6 +47,7 @@ class EthernetIf(Interface):
     @staticmethod
     def feature(ifname, option, value):
         run(f'ethtool --features {ifname} {option} {value}')
+        invalidate_ethtool(ifname)
         return False
 
     _command_set = {**Interface._command_set, **{
@@ -156,6 +158,7 @@ class EthernetIf(Interface):
             # to change this setting via sysfs
             cmd = f'ethtool --pause {ifname} autoneg {enable} tx {enable} rx {enable}'
             output, code = self._popen(cmd)
+            invalidate_ethtool(ifname)
             if code:
                 Warning(f'could not change "{ifname}" flow control setting!')
             return output
@@ -213,6 +216,7 @@ class EthernetIf(Interface):
                 cmd += ' autoneg on'
             else:
                 cmd += f' speed {speed} duplex {duplex} autoneg off'
+            invalidate_ethtool(ifname)
             return self._cmd(cmd)
         except PermissionError:
             # Some NICs do not tell that they don't suppport settings speed/duplex,
@@ -392,6 +396,7 @@ class EthernetIf(Interface):
         ifname = self.config['ifname']
         cmd = f'ethtool --set-ring {ifname} {rx_tx} {size}'
         output, code = self._popen(cmd)
+        invalidate_ethtool(ifname)
         # ethtool error codes:
         #  80 - value already setted
         #  81 - does not possible to set value
@@ -1487,6 +1487,12 @@ class Interface(Control):
         interface setup code and provide a single point of entry when workin
         on any interface. """
 
+        # sysfs/procfs values are only written if they differ from the current
+        # value, all writes between two commands are applied in one pass
+        with self.sysfs_batch():
+            self._update(config)
+
+    def _update(self, config):
         if self.debug:
             import pprint
             pprint.pprint(config)
@@ -0,0 +1,331 @@
+# Copyright 2023 VyOS maintainers and contributors <maintainers@vyos.io>
+#
+# This library is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License as published by the Free Software Foundation; either
+# version 2.1 of the License, or (at your option) any later version.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with this library.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Incremental updates of rendered nftables rulesets, and counter snapshots.
+
+A ruleset rendered from a template is compared with the ruleset applied
+before, and only chains and sets that differ are changed in the kernel with
+a single atomic 'nft -f' transaction. Rules are matched by their comment
+(e.g. 'ipv4-NAM-foo-10') and the handle the kernel assigned to them, so that
+unchanged rules keep their counters and sets keep their runtime elements.
+
+Snapshot reads the whole ruleset with one 'nft -j' call for op-mode commands
+showing rule counters and rates.
+"""
+
+import re
+import json
+import time
+
+from vyos.utils.process import rc_cmd
+
+_comment = re.compile(r'comment "([^"]*)"$')
+
+def _block(line, keyword):
+    """ Name of a block opened by line, e.g. 'chain NAME_foo {' """
+    words = line.split()
+    if len(words) >= 3 and words[0] == keyword and words[-1] == '{':
+        return words[1:-1]
+    return None
+
+def parse(text: str) -> dict:
+    """
+    Split a rendered ruleset into its tables. Every table maps to a dict of
+    chains (header and rule lines), sets (header lines and elements) and
+    flowtables (all lines). Statements outside tables, except for 'delete
+    table', are kept as 'prologue'.
+    """
+    res = {'prologue': [], 'tables': {}}
+    table = block = kind = None
+    for line in text.splitlines():
+        line = line.strip()
+        if not line or line.startswith('#'):
+            continue
+
+        if table is None:
+            name = _block(line, 'table')
+            if name:
+                family, name = (['ip'] + name)[-2:]
+                table = res['tables'].setdefault((family, name), {
+                    'chain': {}, 'set': {}, 'flowtable': {}})
+            elif not line.startswith('delete table '):
+                res['prologue'].append(line)
+            continue
+
+        if block is None:
+            if line == '}':
+                table = None
+                continue
+            for kind in ['chain', 'set', 'flowtable']:
+                name = _block(line, kind)
+                if name:
+                    block = table[kind][name[0]] = {'header': [], 'rules': [],
+                                                    'elements': None}
+                    break
+            else:
+                raise ValueError(f'Unexpected statement in table: "{line}"')
+            continue
+
+        if line == '}':
+            block = None
+        elif line.startswith('elements = '):
+            block['elements'] = line[len('elements = '):]
+        elif kind == 'chain' and not line.startswith(('type ', 'policy ')):
+            block['rules'].append(line)
+        else:
+            block['header'].append(line)
+    return res
+
+def rule_key(rule: str):
+    tmp = _comment.search(rule)
+    return tmp.group(1) if tmp else None
+
+def _keys(rules: list):
+    """ Comments of all rules, None unless all of them are set and unique """
+    keys = [rule_key(rule) for rule in rules]
+    if None in keys or len(set(keys)) != len(keys):
+        return None
+    return keys
+
+def diff(previous: str, current: str):
+    """
+    Changed chains and sets between two rendered rulesets, as list of
+    ('chain', family, table, name, old rules, new rules) and ('set', family,
+    table, name, elements) tuples. Returns None when the change is structural
+    (tables, chains, sets or flowtables added, removed or redefined), which
+    requires a full reload, or when a ruleset holds statements the parser
+    does not know.
+    """
+    try:
+        old = parse(previous)
+        new = parse(current)
+    except ValueError:
+        return None
+    if old['prologue'] != new['prologue'] or old['tables'].keys() != new['tables'].keys():
+        return None
+
+    changes = []
+    for (family, table), new_table in new['tables'].items():
+        old_table = old['tables'][(family, table)]
+        for kind in ['chain', 'set', 'flowtable']:
+            if old_table[kind].keys() != new_table[kind].keys():
+                return None
+            for name, block in new_table[kind].items():
+                old_block = old_table[kind][name]
+                if old_block == block:
+                    continue
+                if kind == 'flowtable' or old_block['header'] != block['header']:
+                    return None
+                if kind == 'chain':
+                    changes.append(('chain', family, table, name,
+                                    old_block['rules'], block['rules']))
+                else:
+                    changes.append(('set', family, table, name,
+                                    block['elements']))
+    return changes
+
+def live_rules(family: str, table: str):
+    """ Handles and comments of all rules of a table, by chain """
+    rc, out = rc_cmd(f'nft -j list table {family} {table}')
+    if rc != 0:
+        return None
+    res = {}
+    for item in json.loads(out)['nftables']:
+        if 'chain' in item:
+            res.setdefault(item['chain']['name'], [])
+        elif 'rule' in item:
+            rule = item['rule']
+            res.setdefault(rule['chain'], []).append(
+                (rule['handle'], rule.get('comment')))
+    return res
+
+def _chain_commands(prefix, old_rules, new_rules, live):
+    """ Keyed rule updates for one chain, None if a rewrite is required """
+    old_keys = _keys(old_rules)
+    new_keys = _keys(new_rules)
+    if old_keys is None or new_keys is None or len(live) != len(old_rules):
+        return None
+
+    handles = {}
+    for handle, comment in live:
+        if comment in handles:
+            return None
+        handles[comment] = handle
+    if set(handles) != set(old_keys):
+        return None
+
+    old = dict(zip(old_keys, old_rules))
+    current = set(new_keys)
+    if [key for key in new_keys if key in old] != [key for key in old_keys if key in current]:
+        # rules were reordered
+        return None
+
+    res = [f'delete rule {prefix} handle {handles[key]}'
+           for key in old_keys if key not in current]
+    # new rules are inserted in front of the next rule that is kept, walking
+    # backwards gives that rule without rescanning the remaining ones
+    following = None
+    updates = []
+    for key, rule in reversed(list(zip(new_keys, new_rules))):
+        if key in old:
+            if old[key] != rule:
+                updates.append(f'replace rule {prefix} handle {handles[key]} {rule}')
+            following = handles[key]
+        elif following is not None:
+            updates.append(f'insert rule {prefix} position {following} {rule}')
+        else:
+            updates.append(f'add rule {prefix} {rule}')
+    return res + updates[::-1]
+
+def commands(changes: list, live: dict):
+    """
+    nft commands for the changes returned by diff(). 'live' maps (family,
+    table) to the result of live_rules(). Chains whose rules cannot be matched
+    by comment are flushed and re-populated. Returns None if the kernel state
+    does not match the previous ruleset.
+    """
+    res = []
+    for change in changes:
+        kind, family, table, name = change[:4]
+        prefix = f'{family} {table} {name}'
+        chains = live.get((family, table))
+        if chains is None:
+            return None
+
+        if kind == 'set':
+            elements = change[4]
+            res.append(f'flush set {prefix}')
+            if elements:
+                res.append(f'add element {prefix} {elements}')
+            continue
+
+        if name not in chains:
+            return None
+        old_rules, new_rules = change[4:]
+        tmp = _chain_commands(prefix, old_rules, new_rules, chains[name])
+        if tmp is None:
+            tmp = [f'flush chain {prefix}'] + [f'add rule {prefix} {rule}'
+                                               for rule in new_rules]
+        res.extend(tmp)
+    return res
+
+def update(previous: str, current: str):
+    """
+    Apply the difference between two rendered rulesets. Returns the number of
+    commands run, or None if a full reload of the current ruleset is required.
+    Raises OSError if the transaction failed.
+    """
+    changes = diff(previous, current)
+    if changes is None:
+        return None
+
+    live = {}
+    for change in changes:
+        key = change[1:3]
+        if key not in live:
+            live[key] = live_rules(*key)
+
+    script = commands(changes, live)
+    if script is None:
+        return None
+    if script:
+        rc, out = rc_cmd('nft -f -', input='\n'.join(script) + '\n')
+        if rc != 0:
+            raise OSError(rc, out)
+    return len(script)
+
+def _normalise(obj):
+    if isinstance(obj, dict):
+        return {k: (None if k in ['counter', 'packets', 'bytes'] else _normalise(v))
+                for k, v in obj.items() if k != 'handle'}
+    if isinstance(obj, list):
+        return [_normalise(v) for v in obj]
+    return obj
+
+def ruleset(family: str, table: str) -> list:
+    """
+    'nft -j list table' without handles and counter values, to compare the
+    result of an incremental update with a full reload of the same ruleset
+    """
+    rc, out = rc_cmd(f'nft -j list table {family} {table}')
+    if rc != 0:
+        return []
+    return [_normalise(item) for item in json.loads(out)['nftables']
+            if 'metainfo' not in item]
+
+class Snapshot:
+    """
+    One 'nft -j list ruleset' parsed into an index of rules by chain and by
+    (family, table, chain, comment), used by op-mode commands to read all
+    counters with a single nft call. 'nftables' is the parsed 'nftables'
+    list, e.g. for tests, otherwise nft is run.
+    """
+    def __init__(self, nftables=None, timestamp=None):
+        if nftables is None:
+            rc, out = rc_cmd('nft -j list ruleset')
+            nftables = json.loads(out)['nftables'] if rc == 0 else []
+        self.timestamp = time.monotonic() if timestamp is None else timestamp
+        self._chains = {}
+        self._rules = {}
+        for item in nftables:
+            if 'chain' in item:
+                chain = item['chain']
+                self._chains.setdefault((chain['family'], chain['table'], chain['name']), [])
+            elif 'rule' in item:
+                rule = item['rule']
+                key = (rule['family'], rule['table'], rule['chain'])
+                self._chains.setdefault(key, []).append(rule)
+                if 'comment' in rule:
+                    self._rules[key + (rule['comment'],)] = rule
+
+    def has_chain(self, family, table, chain) -> bool:
+        return (family, table, chain) in self._chains
+
+    def rules(self, family, table, chain) -> list:
+        """ Rule objects of a chain in order, as in 'nft -j list chain' """
+        return self._chains.get((family, table, chain), [])
+
+    def rule(self, family, table, chain, comment):
+        return self._rules.get((family, table, chain, comment))
+
+    @staticmethod
+    def counters(rule) -> tuple:
+        """ Packets and bytes of all counter statements of a rule """
+        packets = octets = 0
+        for expr in (rule or {}).get('expr', []):
+            counter = expr.get('counter') if isinstance(expr, dict) else None
+            if isinstance(counter, dict):
+                packets += counter.get('packets', 0)
+                octets += counter.get('bytes', 0)
+        return packets, octets
+
+    def rates(self, previous) -> dict:
+        """
+        Packets and bytes per second of every commented rule since the
+        previous snapshot, by (family, table, chain, comment). Rules which
+        were replaced in between (new handle) start from zero.
+        """
+        elapsed = max(self.timestamp - previous.timestamp, 1e-6)
+        res = {}
+        for key, rule in self._rules.items():
+            packets, octets = self.counters(rule)
+            old = previous._rules.get(key)
+            if old is not None and old.get('handle') == rule.get('handle'):
+                old_packets, old_octets = self.counters(old)
+                packets -= old_packets
+                octets -= old_octets
+            res[key] = (max(packets, 0) / elapsed, max(octets, 0) / elapsed)
+        return res
@@ -16,6 +16,7 @@
 import re
 import sys
 import typing
+from collections.abc import Iterator
 from humps import decamelize
 
 
@@ -263,6 +264,11 @@ def run(module):
         res = func(**args)
         if not args["raw"]:
             return res
+        elif isinstance(res, Iterator):
+            # Streamed raw output, e.g. of large routing tables,
+            # is printed as one JSON object per line (NDJSON)
+            from json import dumps
+            return (dumps(_normalize_field_names(decamelize(item))) for item in res)
         else:
             if not isinstance(res, dict) and not isinstance(res, list):
                 raise InternalError(f"Bare literal is not an acceptable raw output, must be a list or an object.\
@@ -0,0 +1,187 @@
+# Copyright 2023 VyOS maintainers and contributors <maintainers@vyos.io>
+#
+# This library is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License as published by the Free Software Foundation; either
+# version 2.1 of the License, or (at your option) any later version.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with this library.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Commit profiler: records wall and CPU time of nested spans, for example
+conf_mode script phases and the processes they spawn.
+
+Profiling is enabled by the debug flag 'profile', see vyos.debug. Every
+process appends its finished spans to a shared event file, which is turned
+into a Chrome/Perfetto JSON trace and a collapsed-stack file usable with
+flamegraph.pl by write_report().
+"""
+
+import os
+import sys
+import json
+import time
+import resource
+import threading
+
+from contextlib import contextmanager
+
+from vyos import debug
+
+event_file = '/run/vyos-profile.events'
+trace_file = '/run/vyos-boot-profile.json'
+folded_file = '/run/vyos-boot-profile.folded'
+
+# seconds the state of the debug flag is reused; long running processes,
+# e.g. vyos-configd, notice its removal at the end of the boot
+flag_check_interval = 1.0
+
+_local = threading.local()
+_enabled = (False, 0.0)
+
+def enabled() -> bool:
+    """ Check the debug flag, at most once per flag_check_interval, as it
+    is called for every process spawned """
+    global _enabled
+    state, checked = _enabled
+    now = time.monotonic()
+    if checked and now - checked < flag_check_interval:
+        return state
+    state = bool(debug.enabled('profile'))
+    _enabled = (state, now)
+    return state
+
+def refresh():
+    """ Check the debug flag again on the next call of enabled() """
+    global _enabled
+    _enabled = (False, 0.0)
+
+def _stack() -> list:
+    if not hasattr(_local, 'stack'):
+        _local.stack = []
+    return _local.stack
+
+def _usec(seconds: float) -> int:
+    return int(seconds * 1000000)
+
+def _children_cpu() -> float:
+    r = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return r.ru_utime + r.ru_stime
+
+def _write_event(event: dict):
+    try:
+        with open(event_file, 'a') as f:
+            f.write(json.dumps(event) + '\n')
+    except OSError:
+        pass
+
+def _frame_name(name: str) -> str:
+    return name.replace(';', ',').replace('\n', ' ').strip()
+
+def program(command) -> str:
+    """ Name of the program run by a command line or argument list,
+    skipping sudo """
+    words = command.split() if isinstance(command, str) else list(command)
+    while words and (words[0] == 'sudo' or '=' in words[0]):
+        words.pop(0)
+    return os.path.basename(words[0]) if words else str(command)
+
+@contextmanager
+def span(name: str, category: str = 'phase', detail: str = ''):
+    """
+    Record wall and CPU time of the enclosed block as child of the enclosing
+    span of the same thread. CPU time includes the thread itself and all
+    reaped child processes; category 'subprocess' only counts the latter.
+    """
+    if not enabled():
+        yield
+        return
+
+    stack = _stack()
+    if not stack:
+        # root frame per process, e.g. vyos-configd or a conf_mode script
+        stack.append({'name': _frame_name(os.path.basename(sys.argv[0])
+                                          or 'python'), 'children': 0})
+    frame = {'name': _frame_name(name), 'children': 0}
+    stack.append(frame)
+
+    start = time.time()
+    wall_start = time.monotonic()
+    thread_start = time.thread_time()
+    children_start = _children_cpu()
+    try:
+        yield
+    finally:
+        wall = time.monotonic() - wall_start
+        cpu = _children_cpu() - children_start
+        if category != 'subprocess':
+            cpu += time.thread_time() - thread_start
+
+        stack.pop()
+        path = ';'.join(f['name'] for f in stack + [frame])
+        stack[-1]['children'] += wall
+        if len(stack) == 1:
+            stack.pop()
+
+        _write_event({
+            'name': frame['name'],
+            'cat': category,
+            'pid': os.getpid(),
+            'tid': threading.get_native_id(),
+            'ts': _usec(start),
+            'dur': _usec(wall),
+            'cpu': _usec(cpu),
+            'self': _usec(max(wall - frame['children'], 0)),
+            'stack': path,
+            'detail': detail if isinstance(detail, str) else ' '.join(detail),
+        })
+
+def reset():
+    """ Remove events of a previous run """
+    try:
+        os.unlink(event_file)
+    except FileNotFoundError:
+        pass
+
+def read_events() -> list:
+    events = []
+    try:
+        with open(event_file) as f:
+            for line in f:
+                try:
+                    events.append(json.loads(line))
+                except ValueError:
+                    continue
+    except FileNotFoundError:
+        pass
+    return events
+
+def trace(events: list) -> dict:
+    """ Chrome trace event format, as understood by Perfetto """
+    res = []
+    for e in sorted(events, key=lambda e: e['ts']):
+        res.append({'name': e['name'], 'cat': e['cat'], 'ph': 'X',
+                    'ts': e['ts'], 'dur': e['dur'], 'pid': e['pid'],
+                    'tid': e['tid'], 'args': {'cpu_us': e['cpu'],
+                                              'detail': e.get('detail', '')}})
+    return {'traceEvents': res, 'displayTimeUnit': 'ms'}
+
+def collapsed(events: list) -> str:
+    """ Collapsed stacks weighted by exclusive wall time in microseconds """
+    stacks = {}
+    for e in events:
+        stacks[e['stack']] = stacks.get(e['stack'], 0) + e['self']
+    return ''.join(f'{k} {v}\n' for k, v in sorted(stacks.items()) if v)
+
+def write_report(trace_path: str = trace_file, folded_path: str = folded_file):
+    events = read_events()
+    with open(trace_path, 'w') as f:
+        json.dump(trace(events), f)
+    with open(folded_path, 'w') as f:
+        f.write(collapsed(events))
@@ -14,14 +14,173 @@
 # License along with this library.  If not, see <http://www.gnu.org/licenses/>.
 
 import os
+import re
+
+from json import loads
+from subprocess import STDOUT
 
 from vyos.base import Warning
 from vyos.utils.process import cmd
+from vyos.utils.process import popen
 from vyos.utils.dict import dict_search
 from vyos.utils.file import read_file
+from vyos.utils.file import write_file
 
 from vyos.utils.network import get_protocol_by_name
 
+# When this file exists only changed classes are replaced on commit instead
+# of deleting and re-creating all qdiscs of an interface
+incremental_flag = '/config/vyos-qos.incremental'
+
+class TCBatch:
+    """
+    Collects all tc commands for one interface and runs them with a single
+    'tc -force -batch' call. Every command is tagged with a context, e.g. the
+    class and match it was generated for, so errors can be reported against
+    the configuration instead of a batch line number.
+
+    The commands applied last are kept below state_dir and used by apply() in
+    incremental mode to only run 'replace' commands which changed.
+    """
+    state_dir = '/run/vyos-qos'
+
+    def __init__(self, interface):
+        self._interface = interface
+        self._commands = []
+
+    def add(self, command, context=None):
+        if not command.startswith('tc '):
+            raise ValueError(f'Not a tc command: "{command}"')
+        self._commands.append((command[3:].strip(), context))
+        return ''
+
+    def lines(self) -> list:
+        return [line for line, _ in self._commands]
+
+    def _state_file(self):
+        return os.path.join(self.state_dir, f'{self._interface}.batch')
+
+    def _run(self, commands):
+        if not commands:
+            return
+        script = ''.join(f'{line}\n' for line, _ in commands)
+        out, code = popen('tc -force -batch -', input=script, stderr=STDOUT)
+        if code == 0:
+            return
+        errors = []
+        for lineno in re.findall(r'Command failed -:(\d+)', out):
+            line, context = commands[int(lineno) - 1]
+            context = f' ({context})' if context else ''
+            errors.append(f'"tc {line}"{context}')
+        if not errors:
+            errors.append(out)
+        raise OSError(code, f'QoS setup of "{self._interface}" failed: ' +
+                      ', '.join(errors))
+
+    @staticmethod
+    def _idempotent(line) -> bool:
+        """ class/qdisc replace below the root qdisc can be re-run alone """
+        words = line.split()
+        return words[:2] in [['class', 'replace'], ['qdisc', 'replace']] and \
+               'root' not in words
+
+    @staticmethod
+    def _option(line, option):
+        words = line.split()
+        if option in words and words.index(option) + 1 < len(words):
+            return words[words.index(option) + 1]
+        return None
+
+    def _live_matches(self) -> bool:
+        """ Check root/ingress qdisc kinds, e.g. lost when a PPPoE session
+        re-created the interface """
+        expected = {}
+        for line in self.lines():
+            words = line.split()
+            if words[:1] != ['qdisc'] or words[1] not in ['add', 'replace']:
+                continue
+            if 'root' in words:
+                kind = words[words.index('root') + 1:]
+                if kind[:1] == ['handle']:
+                    kind = kind[2:]
+                expected['root'] = kind[0] if kind else None
+            elif 'ingress' in words:
+                expected['ingress'] = 'ingress'
+
+        out, code = popen(f'tc -json qdisc show dev {self._interface}')
+        if code:
+            return False
+        live = {}
+        for qdisc in loads(out or '[]'):
+            if qdisc.get('root'):
+                live['root'] = qdisc.get('kind')
+            elif qdisc.get('kind') == 'ingress':
+                live['ingress'] = 'ingress'
+        return all(live.get(k) == v for k, v in expected.items())
+
+    def _effective(self, commands) -> dict:
+        """ Last replace command per class and per qdisc parent """
+        res = {}
+        for line, context in commands:
+            if self._idempotent(line):
+                if line.startswith('class '):
+                    key = ('class', self._option(line, 'classid'))
+                else:
+                    key = ('qdisc', self._option(line, 'parent'))
+                res.pop(key, None)
+                res[key] = (line, context)
+        return res
+
+    def _diff(self, previous):
+        """
+        Commands required to get from the previous to the current batch, or
+        None if anything but idempotent class/qdisc replace commands changed
+        """
+        if [l for l in previous if not self._idempotent(l)] != \
+           [l for l in self.lines() if not self._idempotent(l)]:
+            return None
+
+        old = self._effective((l, None) for l in previous)
+        new = self._effective(self._commands)
+        commands = [command for key, command in new.items()
+                    if key not in old or old[key][0] != command[0]]
+        for kind, handle in old:
+            if (kind, handle) in new:
+                continue
+            if kind == 'class':
+                commands.append((f'class del dev {self._interface} '
+                                 f'classid {handle}', 'removed class'))
+            elif ('class', handle) in new:
+                commands.append((f'qdisc del dev {self._interface} '
+                                 f'parent {handle}', 'removed qdisc'))
+        return commands
+
+    def remove(self):
+        """ Delete all qdiscs (and thus classes and filters) """
+        # Ignore errors (may have no qdisc)
+        popen(f'tc qdisc del dev {self._interface} parent ffff:')
+        popen(f'tc qdisc del dev {self._interface} root')
+        if os.path.exists(self._state_file()):
+            os.unlink(self._state_file())
+
+    def apply(self, incremental=False):
+        """
+        Run all collected commands. In incremental mode only run commands
+        which changed since the last apply(), if possible.
+        """
+        commands = None
+        if incremental and os.path.exists(self._state_file()):
+            previous = read_file(self._state_file()).splitlines()
+            commands = self._diff(previous)
+            if commands is not None and not self._live_matches():
+                commands = None
+        if commands is None:
+            if incremental:
+                self.remove()
+            commands = self._commands
+
+        self._run(commands)
+        write_file(self._state_file(), ''.join(f'{l}\n' for l in self.lines()))
 
 class QoSBase:
     _debug = False
@@ -63,14 +222,19 @@ class QoSBase:
     }
     qostype = None
 
-    def __init__(self, interface):
+    def __init__(self, interface, batch=None):
         if os.path.exists('/tmp/vyos.qos.debug'):
             self._debug = True
         self._interface = interface
+        # If a TCBatch is passed, commands are collected instead of being run
+        self._batch = batch
+        self._context = None
 
     def _cmd(self, command):
         if self._debug:
             print(f'DEBUG/QoS: {command}')
+        if self._batch is not None:
+            return self._batch.add(command, self._context)
         return cmd(command)
 
     def get_direction(self) -> list:
@@ -202,6 +366,7 @@ class QoSBase:
 
         if 'class' in config:
             for cls, cls_config in config['class'].items():
+                self._context = f'class {cls}'
                 self._build_base_qdisc(cls_config, int(cls))
 
                 # every match criteria has it's tc instance
@@ -217,6 +382,7 @@ class QoSBase:
 
                 if 'match' in cls_config:
                     for index, (match, match_config) in enumerate(cls_config['match'].items(), start=1):
+                        self._context = f'class {cls} match {match}'
                         filter_cmd = filter_cmd_base
                         if self.qostype == 'shaper' and 'prio ' not in filter_cmd:
                             filter_cmd += f' prio {index}'
@@ -354,6 +520,7 @@ class QoSBase:
                 #     filter_cmd += f' burst {burst}'
 
         if 'default' in config:
+            self._context = 'default'
             default_cls_id = 1
             if 'class' in config:
                 class_id_max = self._get_class_max_id(config)
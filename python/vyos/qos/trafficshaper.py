@@ -67,6 +67,7 @@ class TrafficShaper(QoSBase):
 
         if 'class' in config:
             for cls, cls_config in config['class'].items():
+                self._context = f'class {cls}'
                 # class id is used later on and passed as hex, thus this needs to be an int
                 cls = int(cls)
 
@@ -99,6 +100,7 @@ class TrafficShaper(QoSBase):
                 self._cmd(tmp)
 
         if 'default' in config:
+                self._context = 'default'
                 rate = self._rate_convert(config['default']['bandwidth'])
                 burst = config['default']['burst']
                 quantum = config['default']['codel_quantum']
@@ -20,6 +20,7 @@ from jinja2 import Environment
 from jinja2 import FileSystemLoader
 from jinja2 import ChainableUndefined
 from vyos.defaults import directories
+from vyos.utils.cache import save_all as save_caches
 from vyos.utils.dict import dict_search_args
 from vyos.utils.file import makedir
 from vyos.utils.permission import chmod
@@ -147,6 +148,9 @@ def render(
         chown(file.fileno(), user, group)
         file.write(rendered)
 
+    # Persist results of filters like nft_rule for the next commit
+    save_caches()
+
 
 ##################################
 # Custom template filters follow #
@@ -654,6 +658,11 @@ def nft_nested_group(out_list, includes, groups, key):
         add_includes(name)
     return out_list
 
+@register_filter('nft_aggregate')
+def nft_aggregate(addresses):
+    from vyos.utils.network import aggregate_addresses
+    return aggregate_addresses(addresses)
+
 @register_filter('nat_rule')
 def nat_rule(rule_conf, rule_id, nat_type, ipv6=False):
     from vyos.nat import parse_nat_rule
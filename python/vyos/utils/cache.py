@@ -0,0 +1,129 @@
+# Copyright 2023 VyOS maintainers and contributors <maintainers@vyos.io>
+#
+# This library is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License as published by the Free Software Foundation; either
+# version 2.1 of the License, or (at your option) any later version.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with this library.  If not, see <http://www.gnu.org/licenses/>.
+
+import os
+import json
+import hashlib
+import inspect
+import functools
+
+cache_dir = '/run/vyos-cache'
+
+# all caches created by persistent(), see save_all()
+_caches = []
+
+class PersistentCache:
+    """
+    Results of a pure function keyed by a hash of its JSON serialisable
+    arguments. Entries are kept in memory, which covers subsequent commits in
+    vyos-configd, and in a file below cache_dir for other processes. The file
+    is only rewritten by save() after new results were added, at most maxsize
+    least recently used entries are kept.
+
+    The cache is discarded whenever the module defining the function changed.
+    """
+    def __init__(self, func, name=None, maxsize=100000):
+        self._func = func
+        self._path = os.path.join(cache_dir, f'{name or func.__qualname__}.json')
+        self._maxsize = maxsize
+        self._entries = None
+        self._dirty = False
+        try:
+            mtime = os.stat(inspect.getfile(func)).st_mtime_ns
+        except (OSError, TypeError):
+            mtime = 0
+        self._version = f'{func.__module__}.{func.__qualname__}:{mtime}'
+
+    def _load(self):
+        self._entries = {}
+        try:
+            with open(self._path) as f:
+                tmp = json.load(f)
+            if tmp.get('version') == self._version:
+                self._entries = tmp['entries']
+        except (OSError, ValueError, KeyError, AttributeError):
+            pass
+
+    @staticmethod
+    def key(*args) -> str:
+        data = json.dumps(args, sort_keys=True, separators=(',', ':'), default=str)
+        return hashlib.sha1(data.encode()).hexdigest()
+
+    def __call__(self, *args):
+        if self._entries is None:
+            self._load()
+
+        key = self.key(*args)
+        if key in self._entries:
+            # move to the end, dicts keep insertion order
+            value = self._entries[key] = self._entries.pop(key)
+            return value
+
+        value = self._func(*args)
+        self._entries[key] = value
+        self._dirty = True
+        return value
+
+    def __len__(self):
+        return len(self._entries or {})
+
+    def save(self):
+        if not self._dirty:
+            return
+        while len(self._entries) > self._maxsize:
+            del self._entries[next(iter(self._entries))]
+
+        os.makedirs(cache_dir, mode=0o755, exist_ok=True)
+        tmp = f'{self._path}.{os.getpid()}'
+        with open(tmp, 'w') as f:
+            json.dump({'version': self._version, 'entries': self._entries}, f)
+        os.replace(tmp, self._path)
+        self._dirty = False
+
+    def clear(self, persistent=True):
+        """ Drop all entries, including the file unless persistent is False """
+        self._entries = None
+        self._dirty = False
+        if persistent:
+            try:
+                os.unlink(self._path)
+            except FileNotFoundError:
+                pass
+
+def persistent(name=None, maxsize=100000):
+    """
+    Decorator to memoise a pure function with a PersistentCache, which is
+    available as attribute 'cache' of the decorated function
+    """
+    def decorator(func):
+        cache = PersistentCache(func, name, maxsize)
+        _caches.append(cache)
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if kwargs:
+                return func(*args, **kwargs)
+            return cache(*args)
+        wrapper.cache = cache
+        return wrapper
+    return decorator
+
+def save_all():
+    """ Write all caches with new entries, errors are not fatal """
+    for cache in _caches:
+        try:
+            cache.save()
+        except OSError:
+            pass
@@ -58,3 +58,18 @@ def wait_for_commit_lock():
     # Very synchronous approach to multiprocessing
     while commit_in_progress():
         sleep(1)
+
+
+def commit_generation():
+    """
+    Changes whenever a commit completed, for processes which keep a copy of
+    the config, e.g. the HTTP API server. None if there was no commit since
+    the system was started.
+    """
+    from os import stat
+    from vyos.defaults import commit_generation
+
+    try:
+        return stat(commit_generation).st_mtime_ns
+    except FileNotFoundError:
+        return None
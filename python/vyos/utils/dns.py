@@ -0,0 +1,350 @@
+# Copyright 2023 VyOS maintainers and contributors <maintainers@vyos.io>
+#
+# This library is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License as published by the Free Software Foundation; either
+# version 2.1 of the License, or (at your option) any later version.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with this library.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Minimal DNS stub resolver for A and AAAA records which, unlike getaddrinfo(),
+reports record TTLs, and a concurrent resolver re-resolving names only once
+their TTL expired.
+
+As with getaddrinfo(), names in /etc/hosts, e.g. static host mappings, are
+not looked up in DNS, and the search domains of /etc/resolv.conf are used for
+names with less than 'ndots' dots.
+"""
+
+import os
+import socket
+import struct
+import time
+
+from concurrent.futures import ThreadPoolExecutor
+from ipaddress import ip_address
+
+resolv_conf = '/etc/resolv.conf'
+hosts_file = '/etc/hosts'
+
+TYPE_A = 1
+TYPE_CNAME = 5
+TYPE_SOA = 6
+TYPE_AAAA = 28
+CLASS_IN = 1
+
+RCODE_NOERROR = 0
+RCODE_NXDOMAIN = 3
+
+FLAG_TC = 0x0200
+FLAG_RD = 0x0100
+
+# TTL of negative answers without SOA record
+negative_ttl = 60
+# TTL of addresses from the hosts file, as it may change at any time
+hosts_ttl = 0
+
+def read_resolv_conf(path=resolv_conf) -> dict:
+    """ Name servers, search domains and ndots option of resolv.conf """
+    conf = {'nameservers': [], 'search': [], 'ndots': 1}
+    try:
+        with open(path) as f:
+            for line in f:
+                words = line.split()
+                if len(words) < 2:
+                    continue
+                if words[0] == 'nameserver':
+                    conf['nameservers'].append(words[1])
+                elif words[0] in ['search', 'domain']:
+                    # the last of both wins
+                    conf['search'] = words[1:]
+                elif words[0] == 'options':
+                    for option in words[1:]:
+                        if option.startswith('ndots:'):
+                            conf['ndots'] = min(int(option[6:]), 15)
+    except (OSError, ValueError):
+        pass
+    if not conf['nameservers']:
+        conf['nameservers'] = ['127.0.0.1']
+    return conf
+
+def nameservers(path=resolv_conf) -> list:
+    return read_resolv_conf(path)['nameservers']
+
+def hosts_lookup(name: str, ipv6=False, path=None) -> set:
+    """ Addresses of name of the requested family in the hosts file """
+    name = name.rstrip('.').lower()
+    addresses = set()
+    try:
+        with open(path or hosts_file) as f:
+            for line in f:
+                words = line.split('#', 1)[0].split()
+                if len(words) < 2 or name not in (w.lower() for w in words[1:]):
+                    continue
+                try:
+                    address = ip_address(words[0].split('%', 1)[0])
+                except ValueError:
+                    continue
+                if (address.version == 6) == ipv6:
+                    addresses.add(str(address))
+    except OSError:
+        pass
+    return addresses
+
+def search_names(name: str, search: list, ndots=1) -> list:
+    """ Names to query for name in the order used by the libc resolver """
+    if name.endswith('.') or not search:
+        return [name.rstrip('.')]
+    names = [f'{name}.{domain.rstrip(".")}' for domain in search]
+    if name.count('.') >= ndots:
+        return [name] + names
+    return names + [name]
+
+def encode_name(name: str) -> bytes:
+    res = b''
+    for label in name.rstrip('.').split('.'):
+        label = label.encode('idna')
+        if not label or len(label) > 63:
+            raise ValueError(f'Invalid domain name "{name}"')
+        res += bytes([len(label)]) + label
+    return res + b'\0'
+
+def decode_name(data: bytes, offset: int):
+    """ Name at offset with compression pointers resolved, and end offset """
+    labels = []
+    end = None
+    for _ in range(128):
+        length = data[offset]
+        if length & 0xc0 == 0xc0:
+            if end is None:
+                end = offset + 2
+            offset = struct.unpack_from('!H', data, offset)[0] & 0x3fff
+            continue
+        offset += 1
+        if length == 0:
+            return '.'.join(labels).lower(), end if end is not None else offset
+        labels.append(data[offset:offset + length].decode('ascii', 'replace'))
+        offset += length
+    raise ValueError('Compression loop in DNS message')
+
+def build_query(ident: int, name: str, rdtype: int) -> bytes:
+    return (struct.pack('!HHHHHH', ident, FLAG_RD, 1, 0, 0, 0) +
+            encode_name(name) + struct.pack('!HH', rdtype, CLASS_IN))
+
+def parse_response(data: bytes, ident: int, rdtype: int):
+    """
+    Addresses and TTL of a response. The TTL is the minimum of all CNAME and
+    address records, or taken from the SOA record for negative answers.
+    """
+    rid, flags, qdcount, ancount, nscount, _ = struct.unpack_from('!HHHHHH', data)
+    if rid != ident:
+        raise ValueError('DNS response ID mismatch')
+    if flags & FLAG_TC:
+        raise BufferError('DNS response truncated')
+    rcode = flags & 0xf
+    if rcode not in [RCODE_NOERROR, RCODE_NXDOMAIN]:
+        raise OSError(f'DNS server returned rcode {rcode}')
+
+    offset = 12
+    for _ in range(qdcount):
+        _, offset = decode_name(data, offset)
+        offset += 4
+
+    addresses = set()
+    ttl = None
+    negative = None
+    for index in range(ancount + nscount):
+        _, offset = decode_name(data, offset)
+        kind, _, rttl, length = struct.unpack_from('!HHIH', data, offset)
+        offset += 10
+        rdata = data[offset:offset + length]
+        if index < ancount:
+            if kind == rdtype == TYPE_A and length == 4:
+                addresses.add(socket.inet_ntop(socket.AF_INET, rdata))
+            elif kind == rdtype == TYPE_AAAA and length == 16:
+                addresses.add(socket.inet_ntop(socket.AF_INET6, rdata))
+            elif kind != TYPE_CNAME:
+                offset += length
+                continue
+            ttl = rttl if ttl is None else min(ttl, rttl)
+        elif kind == TYPE_SOA:
+            _, end = decode_name(data, offset)
+            _, end = decode_name(data, end)
+            minimum = struct.unpack_from('!I', data, end + 16)[0]
+            negative = min(rttl, minimum)
+        offset += length
+
+    if not addresses:
+        ttl = negative if negative is not None else negative_ttl
+    return addresses, ttl
+
+def _exchange(server, port, message, timeout, tcp=False):
+    family, kind, proto, _, sockaddr = socket.getaddrinfo(
+        server, port, type=socket.SOCK_STREAM if tcp else socket.SOCK_DGRAM,
+        flags=socket.AI_NUMERICHOST)[0]
+    with socket.socket(family, kind, proto) as sock:
+        sock.settimeout(timeout)
+        sock.connect(sockaddr)
+        if not tcp:
+            sock.send(message)
+            deadline = time.monotonic() + timeout
+            while True:
+                data = sock.recv(65535)
+                # replies with another ID, e.g. late answers to an earlier
+                # query, are ignored
+                if data[:2] == message[:2]:
+                    return data
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise socket.timeout('No DNS response with matching ID')
+                sock.settimeout(remaining)
+
+        sock.sendall(struct.pack('!H', len(message)) + message)
+        data = b''
+        while len(data) < 2 or len(data) < 2 + struct.unpack_from('!H', data)[0]:
+            chunk = sock.recv(65535)
+            if not chunk:
+                raise OSError('DNS server closed TCP connection')
+            data += chunk
+        return data[2:]
+
+def _query_servers(name, rdtype, servers, timeout, port):
+    error = None
+    for server in servers:
+        ident = struct.unpack('!H', os.urandom(2))[0]
+        try:
+            message = build_query(ident, name, rdtype)
+            try:
+                return parse_response(_exchange(server, port, message, timeout),
+                                      ident, rdtype)
+            except BufferError:
+                return parse_response(_exchange(server, port, message, timeout,
+                                                tcp=True), ident, rdtype)
+        except (OSError, ValueError, struct.error, IndexError) as e:
+            error = e
+    raise OSError(f'Failed to resolve "{name}": {error}')
+
+def query(name: str, ipv6=False, servers=None, timeout=2.0, port=53,
+          search=None):
+    """
+    Resolve A or AAAA records of name, from the hosts file if it is listed
+    there, else from DNS. Every server is tried in turn with the given
+    timeout per attempt, truncated answers are retried over TCP. The search
+    domains of resolv.conf are used, unless servers are given.
+    Returns (addresses, ttl), raises OSError if no server answered.
+    """
+    addresses = hosts_lookup(name, ipv6)
+    if addresses:
+        return addresses, hosts_ttl
+
+    ndots = 1
+    if servers is None:
+        conf = read_resolv_conf()
+        servers = conf['nameservers']
+        ndots = conf['ndots']
+        if search is None:
+            search = conf['search']
+
+    rdtype = TYPE_AAAA if ipv6 else TYPE_A
+    negative = None
+    error = None
+    for candidate in search_names(name, search or [], ndots):
+        try:
+            addresses, ttl = _query_servers(candidate, rdtype, servers, timeout, port)
+        except OSError as e:
+            error = e
+            continue
+        if addresses:
+            return addresses, ttl
+        negative = ttl if negative is None else min(negative, ttl)
+    if negative is None:
+        raise error
+    return set(), negative
+
+class Resolver:
+    """
+    Resolves (name, ipv6) keys concurrently and keeps their addresses until
+    the record TTL, clamped to [min_ttl, max_ttl], expired. Keys shared by
+    several users are resolved once. Failed lookups are retried after 'retry'
+    seconds. If keep_on_failure is set, failed lookups and negative answers
+    (NXDOMAIN or no records) keep the previous addresses.
+    """
+    def __init__(self, workers=16, timeout=2.0, servers=None, port=53,
+                 min_ttl=10, max_ttl=300, retry=30, keep_on_failure=False,
+                 clock=time.monotonic):
+        self.workers = workers
+        self.timeout = timeout
+        self.servers = servers
+        self.port = port
+        self.min_ttl = min_ttl
+        self.max_ttl = max_ttl
+        self.retry = retry
+        self.keep_on_failure = keep_on_failure
+        self._clock = clock
+        self._state = {}
+
+    def _query(self, key):
+        name, ipv6 = key
+        try:
+            # literal addresses are used as they are
+            address = ip_address(name)
+            if (address.version == 6) == ipv6:
+                return {str(address)}, self.max_ttl
+            return set(), self.max_ttl
+        except ValueError:
+            pass
+        try:
+            addresses, ttl = query(name, ipv6, self.servers, self.timeout, self.port)
+            return addresses, max(self.min_ttl, min(ttl, self.max_ttl))
+        except OSError:
+            return None, self.retry
+
+    def due(self, keys) -> list:
+        now = self._clock()
+        return [key for key in keys
+                if key not in self._state or self._state[key]['expires'] <= now]
+
+    def resolve(self, keys) -> set:
+        """
+        Resolve all keys without valid addresses, drop keys no longer used.
+        Returns the set of keys whose addresses changed.
+        """
+        keys = set(keys)
+        for key in list(self._state):
+            if key not in keys:
+                del self._state[key]
+
+        due = self.due(keys)
+        if not due:
+            return set()
+
+        with ThreadPoolExecutor(max_workers=min(self.workers, len(due))) as pool:
+            results = list(pool.map(self._query, due))
+
+        changed = set()
+        now = self._clock()
+        for key, (addresses, ttl) in zip(due, results):
+            previous = self._state.get(key, {}).get('addresses')
+            if not addresses:
+                addresses = previous if self.keep_on_failure and previous else set()
+            if previous is None or addresses != previous:
+                changed.add(key)
+            self._state[key] = {'addresses': addresses, 'expires': now + ttl}
+        return changed
+
+    def addresses(self, name, ipv6=False) -> set:
+        return self._state.get((name, ipv6), {}).get('addresses', set())
+
+    def next_refresh(self) -> float:
+        """ Seconds until the first key expires """
+        if not self._state:
+            return self.max_ttl
+        expires = min(state['expires'] for state in self._state.values())
+        return max(0.0, expires - self._clock())
@@ -0,0 +1,486 @@
+# Copyright 2023 VyOS maintainers and contributors <maintainers@vyos.io>
+#
+# This library is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License as published by the Free Software Foundation; either
+# version 2.1 of the License, or (at your option) any later version.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with this library.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Minimal rtnetlink client for reading link and address state without forking
+iproute2. Results use the same layout as 'ip --detail --json', restricted to
+the attributes decoded here - see is_complete().
+
+Lookups normally query the kernel directly. Inside a snapshot() block all
+lookups of the calling thread are served from a single dump of links and
+addresses per network namespace, which is taken on first use.
+"""
+
+import os
+import errno
+import socket
+import struct
+import threading
+
+from contextlib import contextmanager
+
+NETLINK_ROUTE = 0
+
+NLMSG_ERROR = 2
+NLMSG_DONE = 3
+
+NLM_F_REQUEST = 0x1
+NLM_F_MULTI = 0x2
+NLM_F_DUMP = 0x300
+
+NLA_TYPE_MASK = 0x3fff
+
+RTM_NEWLINK = 16
+RTM_GETLINK = 18
+RTM_NEWADDR = 20
+RTM_GETADDR = 22
+
+IFLA_ADDRESS = 1
+IFLA_BROADCAST = 2
+IFLA_IFNAME = 3
+IFLA_MTU = 4
+IFLA_LINK = 5
+IFLA_QDISC = 6
+IFLA_MASTER = 10
+IFLA_TXQLEN = 13
+IFLA_OPERSTATE = 16
+IFLA_LINKINFO = 18
+IFLA_IFALIAS = 20
+IFLA_LINK_NETNSID = 37
+IFLA_MIN_MTU = 50
+IFLA_MAX_MTU = 51
+
+IFLA_INFO_KIND = 1
+IFLA_INFO_DATA = 2
+IFLA_INFO_SLAVE_KIND = 4
+IFLA_INFO_SLAVE_DATA = 5
+
+IFLA_VRF_TABLE = 1
+IFLA_VRF_PORT_TABLE = 1
+
+IFLA_VLAN_ID = 1
+IFLA_VLAN_FLAGS = 2
+IFLA_VLAN_EGRESS_QOS = 3
+IFLA_VLAN_INGRESS_QOS = 4
+IFLA_VLAN_PROTOCOL = 5
+
+IFA_ADDRESS = 1
+IFA_LOCAL = 2
+IFA_LABEL = 3
+IFA_BROADCAST = 4
+IFA_CACHEINFO = 6
+IFA_FLAGS = 8
+
+CLONE_NEWNET = 0x40000000
+IFNAMSIZ = 16
+
+_nlmsghdr = struct.Struct('=IHHII')
+_nlattr = struct.Struct('=HH')
+_ifinfomsg = struct.Struct('=BxHiII')
+_ifaddrmsg = struct.Struct('=BBBBI')
+
+# Link kinds and slave kinds whose info_data is fully decoded below, for any
+# other kind the caller has to ask iproute2 if it needs the details
+native_kinds = [None, 'dummy', 'ifb', 'veth', 'vlan', 'vrf', 'wireguard']
+native_slave_kinds = [None, 'vrf']
+
+_link_flags = [
+    ('LOOPBACK', 0x8), ('BROADCAST', 0x2), ('POINTOPOINT', 0x10),
+    ('MULTICAST', 0x1000), ('NOARP', 0x80), ('ALLMULTI', 0x200),
+    ('PROMISC', 0x100), ('NOTRAILERS', 0x20), ('DEBUG', 0x4),
+    ('DYNAMIC', 0x8000), ('AUTOMEDIA', 0x4000), ('PORTSEL', 0x2000),
+    ('MASTER', 0x400), ('SLAVE', 0x800), ('UP', 0x1), ('LOWER_UP', 0x10000),
+    ('DORMANT', 0x20000), ('ECHO', 0x40000),
+]
+IFF_UP = 0x1
+IFF_RUNNING = 0x40
+
+_operstates = ['UNKNOWN', 'NOTPRESENT', 'DOWN', 'LOWERLAYERDOWN', 'TESTING',
+               'DORMANT', 'UP']
+
+_link_types = {1: 'ether', 512: 'ppp', 768: 'ipip', 769: 'tunnel6',
+               772: 'loopback', 776: 'sit', 778: 'gre', 801: 'ieee802.11',
+               823: 'gre6', 65534: 'none'}
+
+_vlan_protocols = {0x8100: '802.1Q', 0x88a8: '802.1ad'}
+_vlan_flags = [('REORDER_HDR', 0x1), ('GVRP', 0x2), ('LOOSE_BINDING', 0x4),
+               ('MVRP', 0x8), ('BRIDGE_BINDING', 0x10)]
+
+_addr_families = {socket.AF_INET: 'inet', socket.AF_INET6: 'inet6'}
+_addr_scopes = {0: 'global', 200: 'site', 253: 'link', 254: 'host',
+                255: 'nowhere'}
+# IFA_F_SECONDARY is shown as 'temporary' for IPv6
+_addr_flags = [('secondary', 0x1), ('nodad', 0x2), ('optimistic', 0x4),
+               ('dadfailed', 0x8), ('home', 0x10), ('deprecated', 0x20),
+               ('tentative', 0x40), ('mngtmpaddr', 0x100),
+               ('noprefixroute', 0x200), ('autojoin', 0x400),
+               ('stable-privacy', 0x800)]
+IFA_F_SECONDARY = 0x1
+IFA_F_PERMANENT = 0x80
+
+_local = threading.local()
+
+def attributes(data: bytes, offset: int = 0) -> list:
+    """ List of (type, payload) of all netlink attributes in data """
+    attrs = []
+    while offset + _nlattr.size <= len(data):
+        length, kind = _nlattr.unpack_from(data, offset)
+        if length < _nlattr.size:
+            break
+        attrs.append((kind & NLA_TYPE_MASK,
+                      data[offset + _nlattr.size:offset + length]))
+        offset += (length + 3) & ~3
+    return attrs
+
+def _attr(kind: int, payload: bytes) -> bytes:
+    length = _nlattr.size + len(payload)
+    return _nlattr.pack(length, kind) + payload + b'\0' * (-length % 4)
+
+def _u32(data: bytes) -> int:
+    return struct.unpack('=I', data[:4])[0]
+
+def _string(data: bytes) -> str:
+    return data.split(b'\0', 1)[0].decode(errors='replace')
+
+def _lladdr(data: bytes) -> str:
+    if len(data) == 4:
+        return socket.inet_ntop(socket.AF_INET, data)
+    if len(data) == 16:
+        return socket.inet_ntop(socket.AF_INET6, data)
+    return ':'.join(f'{b:02x}' for b in data)
+
+def _setns(fd: int):
+    import ctypes
+    libc = ctypes.CDLL(None, use_errno=True)
+    if libc.setns(fd, CLONE_NEWNET) != 0:
+        error = ctypes.get_errno()
+        raise OSError(error, os.strerror(error))
+
+@contextmanager
+def _namespace(netns: str = None):
+    """ Enter a named network namespace with the calling thread """
+    if not netns:
+        yield
+        return
+    target = os.open(f'/run/netns/{netns}', os.O_RDONLY)
+    current = os.open('/proc/thread-self/ns/net', os.O_RDONLY)
+    try:
+        _setns(target)
+        try:
+            yield
+        finally:
+            _setns(current)
+    finally:
+        os.close(target)
+        os.close(current)
+
+def request(msg_type: int, payload: bytes, dump: bool = False,
+            netns: str = None) -> list:
+    """
+    Send a single rtnetlink request and return the payloads of all response
+    messages. A missing object results in FileNotFoundError (ENODEV).
+    """
+    with _namespace(netns):
+        sock = socket.socket(socket.AF_NETLINK, socket.SOCK_RAW, NETLINK_ROUTE)
+    with sock:
+        sock.bind((0, 0))
+        flags = NLM_F_REQUEST | (NLM_F_DUMP if dump else 0)
+        sock.send(_nlmsghdr.pack(_nlmsghdr.size + len(payload), msg_type,
+                                 flags, 1, 0) + payload)
+        messages = []
+        while True:
+            data = sock.recv(1 << 16)
+            offset = 0
+            while offset + _nlmsghdr.size <= len(data):
+                length, kind, flags, seq, pid = _nlmsghdr.unpack_from(data, offset)
+                body = data[offset + _nlmsghdr.size:offset + length]
+                offset += (length + 3) & ~3
+                if kind == NLMSG_DONE:
+                    return messages
+                if kind == NLMSG_ERROR:
+                    error = -struct.unpack_from('=i', body)[0]
+                    if error == 0:
+                        return messages
+                    if error == errno.ENODEV:
+                        raise FileNotFoundError(error, os.strerror(error))
+                    raise OSError(error, os.strerror(error))
+                messages.append(body)
+                if not flags & NLM_F_MULTI:
+                    return messages
+
+class Link:
+    """ Decoded RTM_NEWLINK message """
+    def __init__(self, data: bytes):
+        _, self.type, self.index, self.flags, _ = _ifinfomsg.unpack_from(data)
+        self.attrs = dict(attributes(data, _ifinfomsg.size))
+        self.name = _string(self.attrs.get(IFLA_IFNAME, b''))
+        self.master = self._int(IFLA_MASTER)
+        self.link = self._int(IFLA_LINK)
+
+        info = dict(attributes(self.attrs.get(IFLA_LINKINFO, b'')))
+        self.kind = _string(info[IFLA_INFO_KIND]) if IFLA_INFO_KIND in info else None
+        self.slave_kind = (_string(info[IFLA_INFO_SLAVE_KIND])
+                           if IFLA_INFO_SLAVE_KIND in info else None)
+        self.info_data = info.get(IFLA_INFO_DATA)
+        self.info_slave_data = info.get(IFLA_INFO_SLAVE_DATA)
+
+    def _int(self, attr):
+        return _u32(self.attrs[attr]) if attr in self.attrs else None
+
+    def is_complete(self) -> bool:
+        return (self.kind in native_kinds and
+                self.slave_kind in native_slave_kinds)
+
+    def _decode_info_data(self) -> dict:
+        attrs = attributes(self.info_data or b'')
+        data = {}
+        if self.kind == 'vrf':
+            for kind, value in attrs:
+                if kind == IFLA_VRF_TABLE:
+                    data['table'] = _u32(value)
+        elif self.kind == 'vlan':
+            attrs = dict(attrs)
+            if IFLA_VLAN_PROTOCOL in attrs:
+                proto = struct.unpack('!H', attrs[IFLA_VLAN_PROTOCOL][:2])[0]
+                data['protocol'] = _vlan_protocols.get(proto, f'{proto:#06x}')
+            if IFLA_VLAN_ID in attrs:
+                data['id'] = struct.unpack('=H', attrs[IFLA_VLAN_ID][:2])[0]
+            if IFLA_VLAN_FLAGS in attrs:
+                flags = _u32(attrs[IFLA_VLAN_FLAGS])
+                data['flags'] = [n for n, v in _vlan_flags if flags & v]
+            for name, attr in [('ingress_qos', IFLA_VLAN_INGRESS_QOS),
+                               ('egress_qos', IFLA_VLAN_EGRESS_QOS)]:
+                if attr not in attrs:
+                    continue
+                data[name] = []
+                for _, value in attributes(attrs[attr]):
+                    qos_from, qos_to = struct.unpack('=II', value[:8])
+                    data[name].append({'from': qos_from, 'to': qos_to})
+        return data
+
+    def _decode_info_slave_data(self) -> dict:
+        data = {}
+        if self.slave_kind == 'vrf':
+            for kind, value in attributes(self.info_slave_data or b''):
+                if kind == IFLA_VRF_PORT_TABLE:
+                    data['table'] = _u32(value)
+        return data
+
+    def to_dict(self, names: dict) -> dict:
+        """ Layout of 'ip --detail --json link show', names maps ifindex to
+        interface name for resolving master and lower link """
+        flags = self.flags
+        res = {'ifindex': self.index}
+        if self.link and self.link != self.index:
+            if IFLA_LINK_NETNSID in self.attrs or self.link not in names:
+                res['link_index'] = self.link
+            else:
+                res['link'] = names[self.link]
+        res['ifname'] = self.name
+        res['flags'] = ['NO-CARRIER'] if flags & IFF_UP and not flags & IFF_RUNNING else []
+        res['flags'] += [name for name, value in _link_flags if flags & value]
+        if IFLA_MTU in self.attrs:
+            res['mtu'] = self._int(IFLA_MTU)
+        if IFLA_QDISC in self.attrs:
+            res['qdisc'] = _string(self.attrs[IFLA_QDISC])
+        if self.master and self.master in names:
+            res['master'] = names[self.master]
+        if IFLA_OPERSTATE in self.attrs:
+            state = self.attrs[IFLA_OPERSTATE][0]
+            res['operstate'] = (_operstates[state] if state < len(_operstates)
+                                else str(state))
+        if IFLA_TXQLEN in self.attrs:
+            res['txqlen'] = self._int(IFLA_TXQLEN)
+        res['link_type'] = _link_types.get(self.type, str(self.type))
+        if IFLA_ADDRESS in self.attrs:
+            res['address'] = _lladdr(self.attrs[IFLA_ADDRESS])
+        if IFLA_BROADCAST in self.attrs:
+            res['broadcast'] = _lladdr(self.attrs[IFLA_BROADCAST])
+        if IFLA_MIN_MTU in self.attrs:
+            res['min_mtu'] = self._int(IFLA_MIN_MTU)
+        if IFLA_MAX_MTU in self.attrs:
+            res['max_mtu'] = self._int(IFLA_MAX_MTU)
+        if self.kind or self.slave_kind:
+            linkinfo = {}
+            if self.kind:
+                linkinfo['info_kind'] = self.kind
+                data = self._decode_info_data()
+                if data:
+                    linkinfo['info_data'] = data
+            if self.slave_kind:
+                linkinfo['info_slave_kind'] = self.slave_kind
+                data = self._decode_info_slave_data()
+                if data:
+                    linkinfo['info_slave_data'] = data
+            res['linkinfo'] = linkinfo
+        if IFLA_IFALIAS in self.attrs:
+            res['ifalias'] = _string(self.attrs[IFLA_IFALIAS])
+        return res
+
+class Address:
+    """ Decoded RTM_NEWADDR message """
+    def __init__(self, data: bytes):
+        (self.family, self.prefixlen, self.flags, self.scope,
+         self.index) = _ifaddrmsg.unpack_from(data)
+        self.attrs = dict(attributes(data, _ifaddrmsg.size))
+        if IFA_FLAGS in self.attrs:
+            self.flags = _u32(self.attrs[IFA_FLAGS])
+
+    def to_dict(self) -> dict:
+        """ Layout of an 'addr_info' entry of 'ip --json addr show' """
+        attrs = self.attrs
+        local = attrs.get(IFA_LOCAL, attrs.get(IFA_ADDRESS))
+        res = {'family': _addr_families.get(self.family, str(self.family))}
+        if local is not None:
+            res['local'] = _lladdr(local)
+        if IFA_ADDRESS in attrs and IFA_LOCAL in attrs and \
+           attrs[IFA_ADDRESS] != attrs[IFA_LOCAL]:
+            res['address'] = _lladdr(attrs[IFA_ADDRESS])
+        res['prefixlen'] = self.prefixlen
+        if IFA_BROADCAST in attrs:
+            res['broadcast'] = _lladdr(attrs[IFA_BROADCAST])
+        res['scope'] = _addr_scopes.get(self.scope, str(self.scope))
+        if not self.flags & IFA_F_PERMANENT:
+            res['dynamic'] = True
+        for name, value in _addr_flags:
+            if self.flags & value:
+                if value == IFA_F_SECONDARY and self.family == socket.AF_INET6:
+                    name = 'temporary'
+                res[name] = True
+        if IFA_LABEL in attrs:
+            res['label'] = _string(attrs[IFA_LABEL])
+        if IFA_CACHEINFO in attrs:
+            preferred, valid = struct.unpack('=II', attrs[IFA_CACHEINFO][:8])
+            res['valid_life_time'] = valid
+            res['preferred_life_time'] = preferred
+        return res
+
+def dump_links(netns: str = None) -> list:
+    return [Link(m) for m in request(RTM_GETLINK,
+                                     _ifinfomsg.pack(0, 0, 0, 0, 0),
+                                     dump=True, netns=netns)]
+
+def dump_addresses(netns: str = None) -> list:
+    return [Address(m) for m in request(RTM_GETADDR,
+                                        _ifaddrmsg.pack(0, 0, 0, 0, 0),
+                                        dump=True, netns=netns)]
+
+def query_link(name: str = None, index: int = 0, netns: str = None):
+    """ Single link by name or index, None if it does not exist """
+    if name and len(name.encode()) >= IFNAMSIZ:
+        return None
+    payload = _ifinfomsg.pack(0, 0, index, 0, 0)
+    if name:
+        payload += _attr(IFLA_IFNAME, name.encode() + b'\0')
+    try:
+        return Link(request(RTM_GETLINK, payload, netns=netns)[0])
+    except (FileNotFoundError, IndexError):
+        return None
+
+class Snapshot:
+    """ All links and addresses of a network namespace at one point in time,
+    addresses are only dumped on first use """
+    def __init__(self, netns: str = None):
+        self.netns = netns
+        self.links = dump_links(netns)
+        self.by_name = {l.name: l for l in self.links}
+        self.names = {l.index: l.name for l in self.links}
+        self._addresses = None
+
+    def link(self, name: str):
+        return self.by_name.get(name)
+
+    def addresses(self, index: int) -> list:
+        if self._addresses is None:
+            self._addresses = {}
+            for addr in dump_addresses(self.netns):
+                self._addresses.setdefault(addr.index, []).append(addr)
+        return self._addresses.get(index, [])
+
+def _snapshots():
+    return getattr(_local, 'snapshots', None)
+
+@contextmanager
+def snapshot():
+    """
+    Serve all lookups of the calling thread from one dump per namespace
+    until the block is left. Only use around code which does not change
+    interfaces itself, or call invalidate() after doing so.
+    """
+    outer = _snapshots() is not None
+    if not outer:
+        _local.snapshots = {}
+    try:
+        yield
+    finally:
+        if not outer:
+            _local.snapshots = None
+
+def invalidate():
+    """ Drop cached snapshots of the calling thread """
+    if _snapshots():
+        _snapshots().clear()
+
+def get_snapshot(netns: str = None) -> Snapshot:
+    """ Cached snapshot inside a snapshot() block, a new one otherwise """
+    snapshots = _snapshots()
+    if snapshots is None:
+        return Snapshot(netns)
+    if netns not in snapshots:
+        snapshots[netns] = Snapshot(netns)
+    return snapshots[netns]
+
+def lookup(name: str, netns: str = None):
+    """ Return (Link, ifindex to name map) with the link being None if it
+    does not exist. The map covers at least the link, its master and its
+    lower interface. """
+    if _snapshots() is not None:
+        snap = get_snapshot(netns)
+        return snap.link(name), snap.names
+
+    link = query_link(name, netns=netns)
+    names = {}
+    if link:
+        names[link.index] = link.name
+        for index in [link.master, link.link]:
+            if index and index not in names:
+                tmp = query_link(index=index, netns=netns)
+                if tmp:
+                    names[index] = tmp.name
+    return link, names
+
+def link_exists(name: str, netns: str = None) -> bool:
+    if _snapshots() is not None:
+        return get_snapshot(netns).link(name) is not None
+    return query_link(name, netns=netns) is not None
+
+def link_config(name: str, netns: str = None):
+    """ Link in 'ip --detail --json link show' layout or None """
+    link, names = lookup(name, netns)
+    return link.to_dict(names) if link else None
+
+def addresses(link: Link, netns: str = None) -> list:
+    """ All addresses assigned to link """
+    if _snapshots() is not None:
+        return get_snapshot(netns).addresses(link.index)
+    return [a for a in dump_addresses(netns) if a.index == link.index]
+
+def master_members(master: str, netns: str = None) -> list:
+    """ Names of all interfaces enslaved to master, in ifindex order """
+    snap = get_snapshot(netns)
+    link = snap.link(master)
+    if not link:
+        return []
+    return [l.name for l in snap.links if l.master == link.index]
@@ -41,6 +41,12 @@ def interface_exists(interface) -> bool:
     return os.path.exists(f'/sys/class/net/{interface}')
 
 def is_netns_interface(interface, netns):
+    from vyos.utils import netlink
+    try:
+        return netlink.link_exists(interface, netns=netns)
+    except OSError:
+        # entering a netns requires CAP_SYS_ADMIN, e.g. op-mode
+        pass
     from vyos.utils.process import rc_cmd
     rc, out = rc_cmd(f'sudo ip netns exec {netns} ip link show dev {interface}')
     if rc == 0:
@@ -59,33 +65,30 @@ def get_vrf_members(vrf: str) -> list:
     :param vrf: str
     :return: list
     """
-    import json
-    from vyos.utils.process import cmd
+    from vyos.utils import netlink
     if not interface_exists(vrf):
         raise ValueError(f'VRF "{vrf}" does not exist!')
-    output = cmd(f'ip --json --brief link show master {vrf}')
-    answer = json.loads(output)
-    interfaces = []
-    for data in answer:
-        if 'ifname' in data:
-            interfaces.append(data.get('ifname'))
-    return interfaces
+    return netlink.master_members(vrf)
 
 def get_interface_vrf(interface):
     """ Returns VRF of given interface """
-    from vyos.utils.dict import dict_search
-    from vyos.utils.network import get_interface_config
-    tmp = get_interface_config(interface)
-    if dict_search('linkinfo.info_slave_kind', tmp) == 'vrf':
-        return tmp['master']
+    from vyos.utils import netlink
+    link, names = netlink.lookup(interface)
+    if link and link.slave_kind == 'vrf' and link.master in names:
+        return names[link.master]
     return 'default'
 
 def get_interface_config(interface):
     """ Returns the used encapsulation protocol for given interface.
         If interface does not exist, None is returned.
     """
-    if not interface_exists(interface):
+    from vyos.utils import netlink
+    link, names = netlink.lookup(interface)
+    if not link:
         return None
+    if link.is_complete():
+        return link.to_dict(names)
+    # info_data of this interface type is not decoded by vyos.utils.netlink
     from json import loads
     from vyos.utils.process import cmd
     tmp = loads(cmd(f'ip --detail --json link show dev {interface}'))[0]
@@ -95,8 +98,14 @@ def get_interface_address(interface):
     """ Returns the used encapsulation protocol for given interface.
         If interface does not exist, None is returned.
     """
-    if not interface_exists(interface):
+    from vyos.utils import netlink
+    link, names = netlink.lookup(interface)
+    if not link:
         return None
+    if link.is_complete():
+        tmp = link.to_dict(names)
+        tmp['addr_info'] = [a.to_dict() for a in netlink.addresses(link)]
+        return tmp
     from json import loads
     from vyos.utils.process import cmd
     tmp = loads(cmd(f'ip --detail --json addr show dev {interface}'))[0]
@@ -106,20 +115,16 @@ def get_interface_namespace(interface: str):
     """
        Returns wich netns the interface belongs to
     """
-    from json import loads
-    from vyos.utils.process import cmd
+    import os
 
     # Bail out early if netns does not exist
-    tmp = cmd(f'ip --json netns ls')
-    if not tmp: return None
+    if not os.path.isdir('/run/netns'):
+        return None
 
-    for ns in loads(tmp):
-        netns = f'{ns["name"]}'
+    for netns in os.listdir('/run/netns'):
         # Search interface in each netns
-        data = loads(cmd(f'ip netns exec {netns} ip --json link show'))
-        for tmp in data:
-            if interface == tmp["ifname"]:
-                return netns
+        if is_netns_interface(interface, netns):
+            return netns
 
 def is_ipv6_tentative(iface: str, ipv6_address: str) -> bool:
     """Check if IPv6 address is in tentative state.
@@ -483,3 +488,79 @@ def get_vxlan_vlan_tunnels(interface: str) -> list:
             os_configured_vlan_ids.append(str(vlanStart))
 
     return os_configured_vlan_ids
+
+def merge_ranges(ranges: list) -> list:
+    """ Sort integer (start, end) ranges and merge overlapping and adjacent ones """
+    res = []
+    for start, end in sorted(ranges):
+        if res and start <= res[-1][1] + 1:
+            if end > res[-1][1]:
+                res[-1][1] = end
+        else:
+            res.append([start, end])
+    return [tuple(r) for r in res]
+
+def range_to_cidrs(start: int, end: int, bits: int=32) -> list:
+    """
+    Minimal list of (network, prefix length) covering exactly the integer
+    address range start-end of an address family with the given bit width
+    """
+    res = []
+    while start <= end:
+        # largest block aligned at start which does not exceed end
+        size = start & -start if start else 1 << bits
+        while size > end - start + 1:
+            size >>= 1
+        res.append((start, bits - size.bit_length() + 1))
+        start += size
+    return res
+
+def format_ranges(ranges: list, ipv6: bool=False) -> list:
+    """
+    nftables set elements for integer (start, end) ranges: an address, a
+    prefix if the range is one CIDR block, otherwise an address range
+    """
+    from socket import AF_INET
+    from socket import AF_INET6
+    from socket import inet_ntop
+    family, bits = (AF_INET6, 128) if ipv6 else (AF_INET, 32)
+    address = lambda value: inet_ntop(family, value.to_bytes(bits // 8, 'big'))
+
+    res = []
+    for start, end in ranges:
+        if start == end:
+            res.append(address(start))
+            continue
+        cidrs = range_to_cidrs(start, end, bits)
+        if len(cidrs) == 1:
+            res.append(f'{address(start)}/{cidrs[0][1]}')
+        else:
+            res.append(f'{address(start)}-{address(end)}')
+    return res
+
+def aggregate_addresses(entries: list) -> list:
+    """
+    Merge overlapping and adjacent addresses, prefixes and 'start-end' ranges
+    into the minimal number of nftables interval set elements, IPv4 before
+    IPv6. Entries which are no address, e.g. negations, are returned as given.
+    """
+    from ipaddress import ip_address
+    from ipaddress import ip_network
+    ranges = {4: [], 6: []}
+    for entry in entries:
+        try:
+            if '-' in entry:
+                start, end = (ip_address(a) for a in entry.split('-', 1))
+            elif '/' in entry:
+                network = ip_network(entry, strict=False)
+                start, end = network.network_address, network.broadcast_address
+            else:
+                start = end = ip_address(entry)
+        except ValueError:
+            return entries
+        if start.version != end.version or end < start:
+            return entries
+        ranges[start.version].append((int(start), int(end)))
+
+    return (format_ranges(merge_ranges(ranges[4])) +
+            format_ranges(merge_ranges(ranges[6]), ipv6=True))
@@ -15,6 +15,7 @@
 
 import os
 
+from time import monotonic
 from subprocess import Popen
 from subprocess import PIPE
 from subprocess import STDOUT
@@ -55,6 +56,7 @@ def popen(command, flag='', shell=None, input=None, timeout=None, env=None,
     # a circual import dependency
     from vyos import debug
     from vyos import airbag
+    from vyos import profiler
 
     # log if the flag is set, otherwise log if command is set
     if not debug.enabled(flag):
@@ -76,10 +78,15 @@ def popen(command, flag='', shell=None, input=None, timeout=None, env=None,
         stdin = PIPE
         input = input.encode() if type(input) is str else input
 
-    p = Popen(command, stdin=stdin, stdout=stdout, stderr=stderr,
-              env=env, shell=use_shell)
+    start = monotonic()
+    # the span is only recorded, and needs a name, when profiling
+    name = profiler.program(command) if profiler.enabled() else ''
+    with profiler.span(name, 'subprocess', command):
+        p = Popen(command, stdin=stdin, stdout=stdout, stderr=stderr,
+                  env=env, shell=use_shell)
 
-    pipe = p.communicate(input, timeout)
+        pipe = p.communicate(input, timeout)
+    debug.account_process(command, monotonic() - start)
 
     pipe_out = b''
     if stdout == PIPE:
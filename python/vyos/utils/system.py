@@ -14,7 +14,35 @@
 # License along with this library.  If not, see <http://www.gnu.org/licenses/>.
 
 import os
-from subprocess import run
+
+def sysctl_path(name: str) -> str:
+    """Return the /proc/sys location of a sysctl() option
+
+    Like sysctl(8) a '/' inside a key is taken as literal '.', e.g. the
+    VLAN interface eth0.10 is written as net.ipv4.conf.eth0/10.forwarding
+
+    Args:
+        name (str): sysctl key name
+
+    Returns:
+        str: path below /proc/sys
+    """
+    return '/proc/sys/' + name.translate(str.maketrans('./', '/.'))
+
+def _read_proc(path: str) -> str | None:
+    try:
+        with open(path) as f:
+            return f.read().rstrip('\n')
+    except OSError:
+        return None
+
+def _write_proc(path: str, value: str) -> bool:
+    try:
+        with open(path, 'w') as f:
+            f.write(value)
+    except OSError:
+        return False
+    return True
 
 def sysctl_read(name: str) -> str:
     """Read and return current value of sysctl() option
@@ -25,8 +53,8 @@ def sysctl_read(name: str) -> str:
     Returns:
         str: sysctl key value
     """
-    tmp = run(['sysctl', '-nb', name], capture_output=True)
-    return tmp.stdout.decode()
+    tmp = _read_proc(sysctl_path(name))
+    return '' if tmp is None else tmp
 
 def sysctl_write(name: str, value: str | int) -> bool:
     """Change value via sysctl()
@@ -44,8 +72,8 @@ def sysctl_write(name: str, value: str | int) -> bool:
     # do not change anything if a value is already configured
     if sysctl_read(name) == value:
         return True
-    # return False if sysctl call failed
-    if run(['sysctl', '-wq', f'{name}={value}']).returncode != 0:
+    # return False if the write failed
+    if not _write_proc(sysctl_path(name), value):
         return False
     # compare old and new values
     # sysctl may apply value, but its actual value will be
@@ -55,6 +83,75 @@ def sysctl_write(name: str, value: str | int) -> bool:
     # False in other cases
     return False
 
+class SysctlBatch:
+    """Collect sysctl and sysfs writes and apply them in one pass
+
+    Writes are queued in order with the last value per file winning, so only
+    files holding a value may be queued, not files triggering an action on
+    every write. On flush() the current value of every file is read back and
+    only files with a different value are written. All applied (or in dry-run
+    mode: due) changes are recorded in report as (path, old value, new value),
+    failed writes in errors as (path, value). Leaving the context with an
+    exception discards the queued writes.
+
+    Args:
+        dry_run (bool, optional): only fill the report, do not write.
+        Defaults to False.
+    """
+    def __init__(self, dry_run: bool = False):
+        self.dry_run = dry_run
+        self.report = []
+        self.errors = []
+        self._pending = {}
+
+    def __len__(self):
+        return len(self._pending)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.flush()
+        else:
+            self.discard()
+
+    def set(self, name: str, value: str | int):
+        """Queue write of a sysctl key"""
+        self.set_path(sysctl_path(name), value)
+
+    def set_path(self, path: str, value: str | int):
+        """Queue write of a file below /proc/sys or /sys"""
+        self._pending.pop(path, None)
+        self._pending[path] = str(value)
+
+    def get_path(self, path: str) -> str | None:
+        """Return queued value of a file, None if nothing is queued"""
+        return self._pending.get(path)
+
+    def discard(self):
+        """Drop all queued writes"""
+        self._pending = {}
+
+    def flush(self) -> bool:
+        """Apply all queued writes
+
+        Returns:
+            bool: True if all values were written, False otherwise
+        """
+        pending, self._pending = self._pending, {}
+        result = True
+        for path, value in pending.items():
+            current = _read_proc(path)
+            if current == value:
+                continue
+            if not self.dry_run and not _write_proc(path, value):
+                self.errors.append((path, value))
+                result = False
+                continue
+            self.report.append((path, current, value))
+        return result
+
 def sysctl_apply(sysctl_dict: dict[str, str], revert: bool = True) -> bool:
     """Apply sysctl values.
 
@@ -59,6 +59,12 @@ def cli_defined(path: list, node: str, non_local=False) -> bool:
 def component_version() -> dict:
     return load_reference().component_version()
 
+def owners() -> dict:
+    return load_reference().owners()
+
+def priorities() -> dict:
+    return load_reference().priorities()
+
 def default_value(path: list) -> Optional[Union[str, list]]:
     return load_reference().default_value(path)
 
@@ -13,6 +13,7 @@
 # You should have received a copy of the GNU Lesser General Public License
 # along with this library.  If not, see <http://www.gnu.org/licenses/>.
 
+from os.path import basename
 from typing import Optional, Union, Any, TYPE_CHECKING
 
 # https://peps.python.org/pep-0484/#forward-references
@@ -160,6 +161,77 @@ class Xml:
         d = self._dict_get(self.ref, path)
         return self._dict_find(d, node, non_local=non_local)
 
+    def owners(self) -> dict:
+        """Return dict mapping conf_mode script names to the config paths
+        owned by them, as list of tuples (path, tag)
+
+        tag is True if the path ends in a tag node; the script is then run
+        per tag node value. Paths below a tag node are cut at the tag node,
+        as the tag node value is not known.
+        """
+        res: dict = {}
+
+        def walk(d: dict, path: list, cut: Optional[list]):
+            for k in list(d):
+                if k in ('node_data', 'component_version'):
+                    continue
+                node = d[k]
+                if not isinstance(node, dict):
+                    continue
+                node_data = node.get('node_data', {})
+                node_path = path + [k]
+                is_tag = node_data.get('node_type') == 'tag'
+                owner = node_data.get('owner')
+                if owner:
+                    script = basename(owner.split()[0])
+                    script = script.removesuffix('.py')
+                    if cut is None:
+                        entry = (node_path, is_tag)
+                    else:
+                        entry = (cut, False)
+                    if entry not in res.setdefault(script, []):
+                        res[script].append(entry)
+                if node_data.get('node_type') == 'leaf':
+                    continue
+                if cut is None and is_tag:
+                    walk(node, node_path, node_path)
+                else:
+                    walk(node, node_path, cut)
+
+        walk(self.ref, [], None)
+        return res
+
+    def priorities(self) -> dict:
+        """Return dict mapping conf_mode script names to the lowest commit
+        priority of the nodes owned by them; scripts owning nodes without
+        priority are not included
+        """
+        res: dict = {}
+        unset: set = set()
+
+        def walk(d: dict):
+            for k in list(d):
+                if k in ('node_data', 'component_version'):
+                    continue
+                node = d[k]
+                if not isinstance(node, dict):
+                    continue
+                node_data = node.get('node_data', {})
+                owner = node_data.get('owner')
+                if owner:
+                    script = basename(owner.split()[0]).removesuffix('.py')
+                    priority = node_data.get('priority')
+                    if priority is None:
+                        unset.add(script)
+                    else:
+                        res[script] = min(int(priority),
+                                          res.get(script, int(priority)))
+                if node_data.get('node_type') != 'leaf':
+                    walk(node)
+
+        walk(self.ref)
+        return {k: v for k, v in res.items() if k not in unset}
+
     def component_version(self) -> dict:
         d = {}
         for k, v in self.ref['component_version'].items():
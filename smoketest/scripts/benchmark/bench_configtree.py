@@ -0,0 +1,67 @@
+#!/usr/bin/env python3
+#
+# Copyright (C) 2023 VyOS maintainers and contributors
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License version 2 or later as
+# published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+# Microbenchmark for the shared libvyosconfig binding used by ConfigTree.
+#
+# "legacy" emulates the previous behavior where every ConfigTree loaded the
+# library and declared all ctypes prototypes on its own, "shared" uses the
+# process-wide binding from vyos.configtree.get_library().
+
+import argparse
+
+from ctypes import cdll
+from timeit import timeit
+
+from vyos.configtree import ConfigTree
+from vyos.configtree import LibVyOSConfig
+from vyos.configtree import LIBPATH
+
+def legacy_binding():
+    lib = cdll.LoadLibrary(LIBPATH)
+    for name, (argtypes, restype) in LibVyOSConfig.prototypes.items():
+        func = getattr(lib, name)
+        func.argtypes = argtypes
+        func.restype = restype
+
+def report(name, count, legacy, shared):
+    print(f'{name:<14} {count / legacy:>12.0f}/s {count / shared:>12.0f}/s '
+          f'{legacy / shared:>8.2f}x')
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--count', type=int, default=10000,
+                        help='Number of iterations per benchmark')
+    parser.add_argument('--config', default='/opt/vyatta/etc/config/config.boot',
+                        help='Config file used for the get_subtree benchmark')
+    args = parser.parse_args()
+
+    with open(args.config) as f:
+        config_string = f.read()
+
+    tree = ConfigTree(config_string)
+    path = ['interfaces'] if tree.exists(['interfaces']) else []
+
+    print(f'{"benchmark":<14} {"legacy":>14} {"shared":>14} {"speedup":>9}')
+
+    shared = timeit(lambda: ConfigTree('\n'), number=args.count)
+    legacy = timeit(lambda: (legacy_binding(), ConfigTree('\n')),
+                    number=args.count)
+    report('construction', args.count, legacy, shared)
+
+    shared = timeit(lambda: tree.get_subtree(path), number=args.count)
+    legacy = timeit(lambda: (legacy_binding(), tree.get_subtree(path)),
+                    number=args.count)
+    report('get_subtree', args.count, legacy, shared)
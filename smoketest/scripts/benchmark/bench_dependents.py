@@ -0,0 +1,118 @@
+#!/usr/bin/env python3
+#
+# Copyright (C) 2023 VyOS maintainers and contributors
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License version 2 or later as
+# published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+# Benchmark for the parallel run of dependents (vyos-configd.parallel).
+#
+# Runs the dependents called by qos (one interfaces-ethernet run per
+# interface with a policy) and by pki (the scripts using a changed
+# certificate) serially, as call_dependents() does by default, and level by
+# level as call_dependents_parallel() does. Every dependent spends
+# --verify-ms of CPU time in get_config/verify and waits --apply-ms for a
+# process in apply, as the tc/ip/ethtool calls of the interface scripts do.
+
+import argparse
+import os
+import subprocess
+
+from concurrent.futures import ThreadPoolExecutor
+from time import perf_counter
+
+from vyos.configdep import dependent_levels
+from vyos.configdep import read_dependency_dict
+from vyos.configdep import run_concurrently
+
+# commit priorities of the dependents, as in interface-definitions, used
+# without the xml reference cache of an installed system
+default_priorities = {
+    'interfaces_ethernet': 318, 'interfaces_bonding': 320,
+    'interfaces_openvpn': 460, 'https': 1001, 'vpn_ipsec': 901,
+    'vpn_sstp': 901,
+}
+
+def priorities():
+    try:
+        from vyos.xml_ref import priorities
+        return priorities()
+    except ImportError:
+        return default_priorities
+
+def dependency_dict():
+    path = os.path.join(os.path.dirname(__file__),
+                        '../../../data/config-mode-dependencies')
+    return read_dependency_dict(dependency_dir=os.path.normpath(path))
+
+def scenarios(interfaces):
+    return {
+        'qos': [('interfaces-ethernet', f'eth{i}') for i in range(interfaces)],
+        'pki': [('interfaces-ethernet', 'eth0'), ('interfaces-ethernet', 'eth1'),
+                ('interfaces-openvpn', 'vtun0'), ('https', None),
+                ('vpn_ipsec', None), ('vpn_sstp', None)],
+    }
+
+def dependent(verify_ms, apply_ms):
+    def verify():
+        end = perf_counter() + verify_ms / 1000
+        while perf_counter() < end:
+            pass
+    def apply():
+        subprocess.run(['sleep', str(apply_ms / 1000)], check=True)
+    def func(defer=False):
+        verify()
+        if defer:
+            return apply
+        apply()
+    return func
+
+def serial(runs, func):
+    start = perf_counter()
+    for _ in runs:
+        func()
+    return perf_counter() - start
+
+def parallel(runs, func, levels, workers):
+    start = perf_counter()
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        for level in levels:
+            funcs = [(runs[i][0], func(defer=True)) for i in level]
+            errors = run_concurrently(executor, funcs)
+            if errors:
+                raise errors[0][1]
+    return perf_counter() - start
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--interfaces', type=int, default=16,
+                        help='Number of interfaces with a QoS policy')
+    parser.add_argument('--workers', type=int, default=4,
+                        help='Number of workers, as parallel_workers of vyos-configd')
+    parser.add_argument('--verify-ms', type=float, default=5,
+                        help='CPU time of get_config/verify per dependent')
+    parser.add_argument('--apply-ms', type=float, default=50,
+                        help='Time waited for processes in apply per dependent')
+    args = parser.parse_args()
+
+    d = dependency_dict()
+    p = priorities()
+    func = dependent(args.verify_ms, args.apply_ms)
+
+    print(f'{"fan-out":<8} {"runs":>5} {"levels":>7} {"serial":>9} '
+          f'{"parallel":>9} {"speedup":>8}')
+    for name, runs in scenarios(args.interfaces).items():
+        levels = dependent_levels(runs, d, p)
+        s = serial(runs, func)
+        t = parallel(runs, func, levels, args.workers)
+        print(f'{name:<8} {len(runs):>5} {len(levels):>7} {s:>8.3f}s '
+              f'{t:>8.3f}s {s / t:>7.2f}x')
@@ -0,0 +1,70 @@
+#!/usr/bin/env python3
+#
+# Copyright (C) 2023 VyOS maintainers and contributors
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License version 2 or later as
+# published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+# Benchmark for FRR queries as polled by dashboards through the HTTP API.
+#
+# Runs every --command --count times with a vtysh process per query, as done
+# before, and over the pooled vty socket connections of vyos.frr_vty, once
+# without and once with the cache of read-only commands. FRR must be running,
+# BGP and the routing table may be empty.
+
+import argparse
+
+from time import perf_counter
+
+from vyos import frr_vty
+
+default_commands = ['show bgp summary json',
+                    'show ip route summary json',
+                    'show interface lo json']
+
+def vtysh_query(command):
+    frr_vty.vtysh(command)
+
+def socket_query(command):
+    frr_vty.execute(command, cache=False)
+
+def cached_query(command):
+    frr_vty.execute(command)
+
+def measure(func, command, count):
+    start = perf_counter()
+    for _ in range(count):
+        func(command)
+    return perf_counter() - start
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--count', type=int, default=200,
+                        help='Number of queries per command and backend')
+    parser.add_argument('--command', action='append',
+                        help='FRR command to run, may be given multiple times')
+    args = parser.parse_args()
+
+    print(f'{"command":<32} {"backend":<8} {"total":>10} {"per query":>12}')
+    for command in args.command or default_commands:
+        # output must be identical, apart from whitespace
+        expected = frr_vty.vtysh(command).split()
+        if frr_vty.execute(command, cache=False).split() != expected:
+            print(f'{command}: output of vtysh and vty socket differs')
+
+        for name, func in [('vtysh', vtysh_query),
+                           ('socket', socket_query),
+                           ('cached', cached_query)]:
+            duration = measure(func, command, args.count)
+            print(f'{command:<32} {name:<8} {duration:>9.3f}s '
+                  f'{duration / args.count * 1000000:>10.0f}us')
+    frr_vty.client().close()
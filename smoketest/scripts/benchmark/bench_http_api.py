@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+#
+# Copyright (C) 2023 VyOS maintainers and contributors
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License version 2 or later as
+# published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+# Load test of read-only /retrieve requests, as sent by polling clients.
+#
+# Sends --count requests from --clients concurrent clients to the unix socket
+# of the HTTP API server and reports requests per second. The HTTP API must
+# be configured, the API key is passed with --key.
+#
+# "before" marks a new commit ahead of every request, as done by the commit
+# post-hook, so the server builds a new Config for each request as it did
+# before. "after" reuses the config snapshot of the server.
+
+import argparse
+import os
+import json
+import socket
+
+from concurrent.futures import ThreadPoolExecutor
+from http.client import HTTPConnection
+from time import perf_counter
+
+from vyos.defaults import commit_generation
+
+class UnixHTTPConnection(HTTPConnection):
+    def __init__(self, path):
+        super().__init__('localhost')
+        self.path = path
+
+    def connect(self):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.connect(self.path)
+
+def post(connection, endpoint, data):
+    connection.request('POST', endpoint, body=json.dumps(data),
+                       headers={'Content-Type': 'application/json'})
+    response = connection.getresponse()
+    result = json.loads(response.read())
+    if not result['success']:
+        raise RuntimeError(f'{endpoint}: {result["error"]}')
+    return result['data']
+
+def client(args, count, invalidate):
+    connection = UnixHTTPConnection(args.socket)
+    retrieve = {'key': args.key, 'op': args.op, 'path': args.path.split()}
+    duration = 0.0
+    for _ in range(count):
+        if invalidate:
+            os.utime(commit_generation)
+        start = perf_counter()
+        post(connection, '/retrieve', retrieve)
+        duration += perf_counter() - start
+    connection.close()
+    return duration
+
+def measure(args, invalidate):
+    per_client = args.count // args.clients
+    with ThreadPoolExecutor(args.clients) as pool:
+        durations = list(pool.map(lambda _: client(args, per_client, invalidate),
+                                  range(args.clients)))
+    requests = per_client * args.clients
+    # time spent in requests, per client
+    busy = sum(durations) / args.clients
+    return requests, requests / busy, busy / per_client
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--key', required=True, help='API key')
+    parser.add_argument('--socket', default='/run/api.sock',
+                        help='Unix socket of the HTTP API server')
+    parser.add_argument('--count', type=int, default=500,
+                        help='Number of /retrieve requests per benchmark')
+    parser.add_argument('--clients', type=int, default=4,
+                        help='Number of concurrent clients')
+    parser.add_argument('--op', default='returnValue',
+                        choices=['returnValue', 'returnValues', 'exists'])
+    parser.add_argument('--path', default='system host-name',
+                        help='Config path to retrieve')
+    args = parser.parse_args()
+
+    # missing if there was no commit since the system was started
+    open(commit_generation, 'a').close()
+
+    print(f'{"benchmark":<10} {"requests":>10} {"rate":>12} {"latency":>12}')
+    results = {}
+    for name, invalidate in [('before', True), ('after', False)]:
+        requests, rate, latency = measure(args, invalidate)
+        results[name] = rate
+        print(f'{name:<10} {requests:>10} {rate:>10.1f}/s {latency * 1000:>10.2f}ms')
+    print(f'speedup {results["after"] / results["before"]:.2f}x')
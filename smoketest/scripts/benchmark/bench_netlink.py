@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+#
+# Copyright (C) 2023 VyOS maintainers and contributors
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License version 2 or later as
+# published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+# Benchmark for interface state lookups on a system with many interfaces.
+#
+# Creates --count dummy interfaces enslaved to a VRF and looks each of them up
+# with the previous 'ip --json' implementation, with direct netlink queries
+# and from a netlink snapshot as used by vyos-configd during get_config() and
+# verify(). Must be run as root, all interfaces are removed afterwards.
+
+import os
+import argparse
+
+from json import loads
+from time import perf_counter
+
+from vyos.utils import netlink
+from vyos.utils.dict import dict_search
+from vyos.utils.network import get_interface_config
+from vyos.utils.network import get_interface_vrf
+from vyos.utils.process import cmd
+
+vrf = 'vrf-bench'
+prefix = 'dum-bench'
+batch = '/tmp/bench-netlink.batch'
+
+def legacy_interface_vrf(interface):
+    tmp = loads(cmd(f'ip --detail --json link show dev {interface}'))[0]
+    if dict_search('linkinfo.info_slave_kind', tmp) == 'vrf':
+        return tmp['master']
+    return 'default'
+
+def netlink_lookup(interfaces):
+    for interface in interfaces:
+        get_interface_config(interface)
+        get_interface_vrf(interface)
+
+def legacy_lookup(interfaces):
+    for interface in interfaces:
+        loads(cmd(f'ip --detail --json link show dev {interface}'))
+        legacy_interface_vrf(interface)
+
+def snapshot_lookup(interfaces):
+    with netlink.snapshot():
+        netlink_lookup(interfaces)
+
+def measure(func, interfaces):
+    start = perf_counter()
+    func(interfaces)
+    return perf_counter() - start
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--count', type=int, default=1000,
+                        help='Number of dummy interfaces to look up')
+    args = parser.parse_args()
+
+    interfaces = [f'{prefix}{i}' for i in range(args.count)]
+    with open(batch, 'w') as f:
+        f.write(f'link add {vrf} type vrf table 4000\n')
+        for interface in interfaces:
+            f.write(f'link add {interface} master {vrf} type dummy\n')
+    cmd(f'ip -batch {batch}')
+    try:
+        print(f'{"backend":<10} {"total":>10} {"per lookup":>12}')
+        for name, func in [('ip --json', legacy_lookup),
+                           ('netlink', netlink_lookup),
+                           ('snapshot', snapshot_lookup)]:
+            duration = measure(func, interfaces)
+            print(f'{name:<10} {duration:>9.3f}s '
+                  f'{duration / len(interfaces) * 1000000:>10.0f}us')
+    finally:
+        with open(batch, 'w') as f:
+            for interface in interfaces + [vrf]:
+                f.write(f'link del {interface}\n')
+        cmd(f'ip -force -batch {batch}')
+        os.unlink(batch)
@@ -0,0 +1,74 @@
+#!/usr/bin/env python3
+#
+# Copyright (C) 2023 VyOS maintainers and contributors
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License version 2 or later as
+# published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+# Benchmark for the firewall rule cache.
+#
+# Renders the firewall ruleset of a synthetic configuration with --count rules
+# without any cached rules (cold), with all rules cached in memory as during
+# subsequent commits in vyos-configd (warm) and with the rules loaded from the
+# cache file below /run as for a conf_mode script run outside of vyos-configd.
+
+import argparse
+
+from time import perf_counter
+
+from vyos.firewall import parse_rule
+from vyos.template import render_to_string
+from vyos.utils.cache import save_all
+
+def firewall_config(count, per_chain=1000):
+    names = {}
+    for i in range(count):
+        name = names.setdefault(f'bench{i // per_chain}', {
+            'default_action': 'drop', 'rule': {}})
+        rule = name['rule'][str(i % per_chain + 1)] = {
+            'action': 'accept' if i % 3 else 'drop',
+            'protocol': 'tcp',
+            'state': ['established', 'new'] if i % 2 else ['new'],
+            'source': {'address': f'10.{i // 65536 % 256}.{i // 256 % 256}.{i % 256}'},
+            'destination': {'port': str(1024 + i % 60000)},
+        }
+        if i % 10 == 0:
+            rule['log'] = {}
+    return {'ipv4': {'name': names}, 'ip_fqdn': {}, 'ip6_fqdn': {},
+            'geoip_updated': False, 'global_options': {}, 'first_install': True}
+
+def measure(firewall):
+    start = perf_counter()
+    render_to_string('firewall/nftables.j2', firewall)
+    return perf_counter() - start
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--count', type=int, default=50000,
+                        help='Number of firewall rules to render')
+    args = parser.parse_args()
+
+    firewall = firewall_config(args.count)
+    cache = parse_rule.cache
+
+    cache.clear()
+    cold = measure(firewall)
+    warm = measure(firewall)
+    save_all()
+    cache.clear(persistent=False)
+    from_file = measure(firewall)
+    cache.clear()
+
+    print(f'{"cache":<10} {"total":>10} {"per rule":>12}')
+    for name, duration in [('cold', cold), ('warm', warm), ('file', from_file)]:
+        print(f'{name:<10} {duration:>9.3f}s '
+              f'{duration / args.count * 1000000:>10.1f}us')
@@ -14,6 +14,7 @@
 # You should have received a copy of the GNU General Public License
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
+import os
 import unittest
 
 from glob import glob
@@ -22,6 +23,7 @@ from time import sleep
 from base_vyostest_shim import VyOSUnitTestSHIM
 
 from vyos.configsession import ConfigSessionError
+from vyos.nftables import ruleset
 from vyos.utils.process import cmd
 from vyos.utils.process import run
 
@@ -723,5 +725,46 @@ class TestFirewall(VyOSUnitTestSHIM.TestCase):
         self.verify_nftables_chain([['accept']], 'ip vyos_conntrack', 'FW_CONNTRACK')
         self.verify_nftables_chain([['accept']], 'ip6 vyos_conntrack', 'FW_CONNTRACK')
 
+    def test_incremental_update(self):
+        name = 'smoketest'
+        incremental_flag = '/config/vyos-firewall.incremental'
+        tables = [('ip', 'vyos_filter'), ('ip6', 'vyos_filter')]
+
+        self.cli_set(['firewall', 'group', 'network-group', name, 'network', '192.0.2.0/24'])
+        self.cli_set(['firewall', 'ipv4', 'name', name, 'default-action', 'drop'])
+        for rule in ['10', '20', '30']:
+            self.cli_set(['firewall', 'ipv4', 'name', name, 'rule', rule, 'action', 'accept'])
+            self.cli_set(['firewall', 'ipv4', 'name', name, 'rule', rule, 'protocol', 'tcp'])
+            self.cli_set(['firewall', 'ipv4', 'name', name, 'rule', rule, 'destination', 'port', rule])
+        self.cli_set(['firewall', 'ipv4', 'input', 'filter', 'rule', '10', 'action', 'jump'])
+        self.cli_set(['firewall', 'ipv4', 'input', 'filter', 'rule', '10', 'jump-target', name])
+        self.cli_commit()
+
+        with open(incremental_flag, 'w'):
+            pass
+        try:
+            self.cli_set(['firewall', 'group', 'network-group', name, 'network', '198.51.100.0/24'])
+            self.cli_delete(['firewall', 'ipv4', 'name', name, 'rule', '10'])
+            self.cli_set(['firewall', 'ipv4', 'name', name, 'rule', '20', 'action', 'drop'])
+            self.cli_set(['firewall', 'ipv4', 'name', name, 'rule', '25', 'action', 'accept'])
+            self.cli_set(['firewall', 'ipv4', 'name', name, 'rule', '25', 'source', 'group', 'network-group', name])
+            self.cli_set(['firewall', 'ipv4', 'name', name, 'rule', '40', 'action', 'reject'])
+            self.cli_commit()
+        finally:
+            os.unlink(incremental_flag)
+
+        nftables_search = [
+            ['tcp dport 20', 'drop'],
+            ['ip saddr @N_smoketest', 'accept'],
+            ['elements = { 192.0.2.0/24, 198.51.100.0/24 }'],
+        ]
+        self.verify_nftables(nftables_search, 'ip vyos_filter')
+        self.verify_nftables([['tcp dport 10']], 'ip vyos_filter', inverse=True)
+
+        # Result must be identical to a full reload of the same ruleset
+        incremental = [ruleset(*table) for table in tables]
+        cmd('sudo nft -f /run/nftables.conf')
+        self.assertEqual(incremental, [ruleset(*table) for table in tables])
+
 if __name__ == '__main__':
     unittest.main(verbosity=2)
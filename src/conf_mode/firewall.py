@@ -30,11 +30,14 @@ from vyos.configverify import verify_interface_exists
 from vyos.ethtool import Ethtool
 from vyos.firewall import fqdn_config_parse
 from vyos.firewall import geoip_update
+from vyos.nftables import update as nftables_update
 from vyos.template import render
 from vyos.utils.process import call
 from vyos.utils.process import cmd
 from vyos.utils.dict import dict_search_args
 from vyos.utils.dict import dict_search_recursive
+from vyos.utils.file import read_file
+from vyos.utils.file import write_file
 from vyos.utils.process import process_named_running
 from vyos.utils.process import rc_cmd
 from vyos import ConfigError
@@ -46,6 +49,15 @@ nat_conf_script = 'nat.py'
 policy_route_conf_script = 'policy-route.py'
 
 nftables_conf = '/run/nftables.conf'
+# Ruleset loaded by the last successful commit
+nftables_applied = '/run/nftables.conf.applied'
+
+# When this file exists only changed chains and sets are updated on commit
+# instead of reloading the whole ruleset
+incremental_flag = '/config/vyos-firewall.incremental'
+
+# Changes below these nodes always require a full reload
+structural_nodes = [['flowtable'], ['zone']]
 
 sysfs_config = {
     'all_ping': {'sysfs': '/proc/sys/net/ipv4/icmp_echo_ignore_all', 'enable': '0', 'disable': '1'},
@@ -120,6 +132,16 @@ def geoip_updated(conf, firewall):
 
     return False
 
+def incremental_update(conf, base):
+    if not os.path.exists(incremental_flag) or not os.path.exists(nftables_applied):
+        return False
+
+    diff = get_config_diff(conf)
+    for path in structural_nodes:
+        if diff.is_node_changed(base + path):
+            return False
+    return True
+
 def get_config(config=None):
     if config:
         conf = config
@@ -140,6 +162,8 @@ def get_config(config=None):
 
     firewall['geoip_updated'] = geoip_updated(conf, firewall)
 
+    firewall['incremental'] = incremental_update(conf, base)
+
     fqdn_config_parse(firewall)
 
     set_dependents('conntrack', conf)
@@ -472,10 +496,25 @@ def apply_sysfs(firewall):
                 with open(path, 'w') as f:
                     f.write(value)
 
-def apply(firewall):
+def apply_ruleset(firewall):
+    ruleset = read_file(nftables_conf)
+    if firewall['incremental']:
+        # Only update chains and sets that changed, anything else but rules
+        # and set elements requires a full reload
+        try:
+            if nftables_update(read_file(nftables_applied), ruleset) is not None:
+                write_file(nftables_applied, ruleset)
+                return
+        except (OSError, ValueError) as e:
+            Warning(f'Incremental firewall update failed, reloading: {e}')
+
     install_result, output = rc_cmd(f'nft -f {nftables_conf}')
     if install_result == 1:
         raise ConfigError(f'Failed to apply firewall: {output}')
+    write_file(nftables_applied, ruleset)
+
+def apply(firewall):
+    apply_ruleset(firewall)
 
     apply_sysfs(firewall)
 
@@ -36,7 +36,8 @@ from vyos.qos import RateLimiter
 from vyos.qos import RoundRobin
 from vyos.qos import TrafficShaper
 from vyos.qos import TrafficShaperHFSC
-from vyos.utils.process import call
+from vyos.qos import TCBatch
+from vyos.qos.base import incremental_flag
 from vyos.utils.dict import dict_search_recursive
 from vyos import ConfigError
 from vyos import airbag
@@ -202,11 +203,15 @@ def generate(qos):
     return None
 
 def apply(qos):
-    # Always delete "old" shapers first
+    incremental = os.path.exists(incremental_flag)
+    configured = qos.get('interface', {}) if qos else {}
+
+    # Always delete "old" shapers first - in incremental mode only from
+    # interfaces without QoS, the others are updated in place if possible
     for interface in interfaces():
-        # Ignore errors (may have no qdisc)
-        call(f'tc qdisc del dev {interface} parent ffff:')
-        call(f'tc qdisc del dev {interface} root')
+        if incremental and interface in configured:
+            continue
+        TCBatch(interface).remove()
 
     call_dependents()
 
@@ -221,14 +226,17 @@ def apply(qos):
             Warning(f'Interface "{interface}" does not exist!')
             continue
 
+        # all tc commands of an interface are run in one batch
+        batch = TCBatch(interface)
         for direction in ['egress', 'ingress']:
             # bail out early if shaper for given direction is not used at all
             if direction not in interface_config:
                 continue
 
             shaper_type, shaper_config = get_shaper(qos, interface_config, direction)
-            tmp = shaper_type(interface)
+            tmp = shaper_type(interface, batch=batch)
             tmp.update(shaper_config, direction)
+        batch.apply(incremental=incremental)
 
     return None
 
@@ -23,6 +23,7 @@ import grp
 import traceback
 from datetime import datetime
 
+from vyos import profiler
 from vyos.defaults import directories, config_status
 from vyos.configsession import ConfigSession, ConfigSessionError
 from vyos.configtree import ConfigTree
@@ -30,10 +31,12 @@ from vyos.utils.process import cmd
 
 STATUS_FILE = config_status
 TRACE_FILE = '/tmp/boot-config-trace'
+PROFILE_FLAG = '/tmp/vyos.profile.debug'
 
 CFG_GROUP = 'vyattacfg'
 
 trace_config = False
+profile_config = False
 
 if 'log' in directories:
     LOG_DIR = directories['log']
@@ -50,6 +53,10 @@ try:
     if 'vyos-config-debug' in cmdline:
         os.environ['VYOS_DEBUG'] = 'yes'
         trace_config = True
+    if 'vyos-config-profile' in cmdline:
+        # a flag file, as vyos-configd does not inherit our environment
+        open(PROFILE_FLAG, 'a').close()
+        profile_config = True
 except Exception as e:
     print('{0}'.format(e))
 
@@ -60,6 +67,23 @@ def write_config_status(status):
     except Exception as e:
         print('{0}'.format(e))
 
+def finish_profile():
+    """ Write the profile of the boot config load; profiling enabled on the
+    kernel command line stops here, else events of every later commit would
+    be collected """
+    if not profiler.enabled():
+        return
+    try:
+        profiler.write_report()
+    except Exception as e:
+        print('{0}'.format(e))
+    if profile_config:
+        try:
+            os.unlink(PROFILE_FLAG)
+        except FileNotFoundError:
+            pass
+        profiler.reset()
+
 def trace_to_file(trace_file_name):
     try:
         with open(trace_file_name, 'w') as trace_file:
@@ -135,23 +159,31 @@ if __name__ == '__main__':
             trace_to_file(TRACE_FILE)
         sys.exit(1)
 
+    if profiler.enabled():
+        profiler.reset()
+
     try:
         time_begin_load = datetime.now()
-        load_out = session.load_config(file_name)
+        with profiler.span('load'):
+            load_out = session.load_config(file_name)
         time_end_load = datetime.now()
         time_begin_commit = datetime.now()
-        commit_out = session.commit()
+        with profiler.span('commit'):
+            commit_out = session.commit()
         time_end_commit = datetime.now()
         write_config_status(0)
     except ConfigSessionError:
         # If here, there is no use doing session.discard, as we have no
         # recoverable config environment, and will only throw an error
         write_config_status(1)
+        finish_profile()
         if trace_config:
             failsafe(default_file_name)
             trace_to_file(TRACE_FILE)
         sys.exit(1)
 
+    finish_profile()
+
     time_elapsed_load = time_end_load - time_begin_load
     time_elapsed_commit = time_end_commit - time_begin_commit
 
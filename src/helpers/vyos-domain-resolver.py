@@ -21,9 +21,9 @@ import time
 from vyos.configdict import dict_merge
 from vyos.configquery import ConfigTreeQuery
 from vyos.firewall import fqdn_config_parse
-from vyos.firewall import fqdn_resolve
 from vyos.utils.commit import commit_in_progress
 from vyos.utils.dict import dict_search_args
+from vyos.utils.dns import Resolver
 from vyos.utils.process import cmd
 from vyos.utils.process import run
 from vyos.xml_ref import get_defaults
@@ -32,7 +32,13 @@ base = ['firewall']
 timeout = 300
 cache = False
 
-domain_state = {}
+# Names are only re-resolved once their record TTL expired, but at least
+# every resolver-interval (timeout) seconds
+resolver = None
+
+# Contents and handle of every set as applied by the last update()
+applied = {}
+last_check = 0.0
 
 ipv4_tables = {
     'ip vyos_mangle',
@@ -68,33 +74,42 @@ def get_config(conf):
     return firewall
 
 def resolve(domains, ipv6=False):
-    global domain_state
-
     ip_list = set()
-
     for domain in domains:
-        resolved = fqdn_resolve(domain, ipv6=ipv6)
-
-        if resolved and cache:
-            domain_state[domain] = resolved
-        elif not resolved:
-            if domain not in domain_state:
-                continue
-            resolved = domain_state[domain]
-
-        ip_list = ip_list | resolved
+        ip_list |= resolver.addresses(domain, ipv6)
     return ip_list
 
-def nft_output(table, set_name, ip_list):
-    output = [f'flush set {table} {set_name}']
-    if ip_list:
-        ip_str = ','.join(ip_list)
-        output.append(f'add element {table} {set_name} {{ {ip_str} }}')
+def domains(firewall):
+    """ All (domain, ipv6) pairs to resolve, every pair only once """
+    keys = set()
+    domain_groups = dict_search_args(firewall, 'group', 'domain_group')
+    if domain_groups:
+        for domain_config in domain_groups.values():
+            for domain in domain_config.get('address', []):
+                keys.update([(domain, False), (domain, True)])
+    keys.update((domain, False) for domain in firewall['ip_fqdn'].values())
+    keys.update((domain, True) for domain in firewall['ip6_fqdn'].values())
+    return keys
+
+def nft_output(table, set_name, ip_list, previous=None):
+    """ Commands to change set contents from previous to ip_list """
+    if previous is None:
+        output = [f'flush set {table} {set_name}']
+        previous = set()
+    else:
+        output = []
+    removed = previous - ip_list
+    added = ip_list - previous
+    if removed:
+        output.append(f'delete element {table} {set_name} {{ {",".join(sorted(removed))} }}')
+    if added:
+        output.append(f'add element {table} {set_name} {{ {",".join(sorted(added))} }}')
     return output
 
 def nft_valid_sets():
+    """ Handles of all nftables sets by (table, set name) """
     try:
-        valid_sets = []
+        valid_sets = {}
         sets_json = cmd('nft -j list sets')
         sets_obj = json.loads(sets_json)
 
@@ -103,17 +118,15 @@ def nft_valid_sets():
                 family = obj['set']['family']
                 table = obj['set']['table']
                 name = obj['set']['name']
-                valid_sets.append((f'{family} {table}', name))
+                valid_sets[(f'{family} {table}', name)] = obj['set']['handle']
 
         return valid_sets
     except:
-        return []
-
-def update(firewall):
-    conf_lines = []
-    count = 0
+        return {}
 
-    valid_sets = nft_valid_sets()
+def wanted_sets(firewall):
+    """ Resolved addresses of all sets which may exist, by (table, set name) """
+    wanted = {}
 
     domain_groups = dict_search_args(firewall, 'group', 'domain_group')
     if domain_groups:
@@ -126,41 +139,77 @@ def update(firewall):
 
             ip_list = resolve(domains, ipv6=False)
             for table in ipv4_tables:
-                if (table, nft_set_name) in valid_sets:
-                    conf_lines += nft_output(table, nft_set_name, ip_list)
+                wanted[(table, nft_set_name)] = ip_list
 
             ip6_list = resolve(domains, ipv6=True)
             for table in ipv6_tables:
-                if (table, nft_set_name) in valid_sets:
-                    conf_lines += nft_output(table, nft_set_name, ip6_list)
-            count += 1
+                wanted[(table, nft_set_name)] = ip6_list
 
     for set_name, domain in firewall['ip_fqdn'].items():
-        table = 'ip vyos_filter'
-        nft_set_name = f'FQDN_{set_name}'
-
-        ip_list = resolve([domain], ipv6=False)
-
-        if (table, nft_set_name) in valid_sets:
-            conf_lines += nft_output(table, nft_set_name, ip_list)
-        count += 1
+        wanted[('ip vyos_filter', f'FQDN_{set_name}')] = resolve([domain], ipv6=False)
 
     for set_name, domain in firewall['ip6_fqdn'].items():
-        table = 'ip6 vyos_filter'
-        nft_set_name = f'FQDN_{set_name}'
+        wanted[('ip6 vyos_filter', f'FQDN_{set_name}')] = resolve([domain], ipv6=True)
 
-        ip_list = resolve([domain], ipv6=True)
-        if (table, nft_set_name) in valid_sets:
-            conf_lines += nft_output(table, nft_set_name, ip_list)
-        count += 1
+    return wanted
 
-    nft_conf_str = "\n".join(conf_lines) + "\n"
-    code = run(f'nft -f -', input=nft_conf_str)
+def update(firewall):
+    """
+    Apply resolved addresses as delta to the contents applied before. nft is
+    not called at all if nothing changed, unless the sets were not checked
+    for resolver-interval seconds: sets re-created by a commit (e.g. of NAT or
+    policy route) have a new handle and are filled again completely.
+    """
+    global last_check
+
+    wanted = wanted_sets(firewall)
+    pending = {key for key, ip_list in wanted.items()
+               if key not in applied or applied[key]['addresses'] != ip_list}
+    if not pending and time.monotonic() - last_check < timeout:
+        return
 
-    print(f'Updated {count} sets - result: {code}')
+    valid_sets = nft_valid_sets()
+    last_check = time.monotonic()
+    for key in list(applied):
+        if key not in wanted or applied[key]['handle'] != valid_sets.get(key):
+            del applied[key]
+            pending.add(key)
+
+    for key in list(pending):
+        if key not in wanted:
+            pending.remove(key)
+        elif key not in valid_sets:
+            # Remember missing sets to not list sets again on every cycle
+            applied[key] = {'handle': None, 'addresses': wanted[key]}
+            pending.remove(key)
+    if not pending:
+        return
+
+    conf_lines = []
+    for key in pending:
+        previous = applied[key]['addresses'] if key in applied else None
+        conf_lines += nft_output(*key, wanted[key], previous)
+
+    code = 0
+    if conf_lines:
+        code = run('nft -f -', input='\n'.join(conf_lines) + '\n')
+        if code != 0:
+            # Elements were changed by someone else, replace all contents
+            conf_lines = []
+            for key in pending:
+                conf_lines += nft_output(*key, wanted[key])
+            code = run('nft -f -', input='\n'.join(conf_lines) + '\n')
+
+    for key in pending:
+        if code == 0:
+            applied[key] = {'handle': valid_sets[key], 'addresses': wanted[key]}
+        else:
+            applied.pop(key, None)
+
+    print(f'Updated {len(pending)} sets - result: {code}')
 
 if __name__ == '__main__':
-    print(f'VyOS domain resolver')
+    print('VyOS domain resolver')
 
     count = 1
     while commit_in_progress():
@@ -174,6 +223,13 @@ if __name__ == '__main__':
 
     print(f'interval: {timeout}s - cache: {cache}')
 
+    resolver = Resolver(max_ttl=timeout, retry=min(timeout, 30),
+                        keep_on_failure=cache)
+    keys = domains(firewall)
     while True:
+        resolved = resolver.due(keys)
+        changed = resolver.resolve(keys)
+        if changed:
+            print(f'Resolved {len(resolved)} names - {len(changed)} changed')
         update(firewall)
-        time.sleep(timeout)
+        time.sleep(max(resolver.next_refresh(), 1))
@@ -24,6 +24,7 @@ import typing
 from jinja2 import Template
 
 import vyos.opmode
+from vyos import frr_vty
 
 frr_command_template = Template("""
 show bgp
@@ -70,6 +71,11 @@ show bgp
     regex {{regex}}
 {% endif %}
 
+{# Community #}
+{% if community %}
+    community {{community}}
+{% endif %}
+
 {## Raw modifier ##}
 
 {% if raw %}
@@ -81,34 +87,42 @@ ArgFamily = typing.Literal['inet', 'inet6', 'l2vpn']
 ArgFamilyModifier = typing.Literal['unicast', 'labeled_unicast', 'multicast', 'vpn', 'flowspec']
 
 def show_summary(raw: bool):
-    from vyos.utils.process import cmd
-
     if raw:
-        from json import loads
-
-        output = cmd(f"vtysh -c 'show bgp summary json'").strip()
-
         # FRR 8.5 correctly returns an empty object when BGP is not running,
         # we don't need to do anything special here
-        return loads(output)
+        return frr_vty.execute_json('show bgp summary json')
     else:
-        output = cmd(f"vtysh -c 'show bgp summary'")
+        output = frr_vty.execute('show bgp summary')
         return output
 
 def show_neighbors(raw: bool):
-    from vyos.utils.process import cmd
     from vyos.utils.dict import dict_to_list
 
     if raw:
-        from json import loads
-
-        output = cmd(f"vtysh -c 'show bgp neighbors json'").strip()
-        d = loads(output)
+        d = frr_vty.execute_json('show bgp neighbors json')
         return dict_to_list(d, save_key_to="neighbor")
     else:
-        output = cmd(f"vtysh -c 'show bgp neighbors'")
+        output = frr_vty.execute('show bgp neighbors')
         return output
 
+def _get_raw_routes(frr_command, nexthop, offset, limit):
+    from itertools import islice
+    from vyos.frr_routes import NexthopFilter
+    from vyos.frr_routes import routes
+
+    def paths():
+        # paths are read from FRR one prefix at a time
+        try:
+            yield from routes(frr_command, path=['routes'], save_key_to='route_key')
+        except KeyError:
+            raise vyos.opmode.InternalError("FRR returned a BGP table with no routes field")
+
+    paths = paths()
+    if nexthop:
+        paths = filter(NexthopFilter(nexthop), paths)
+    offset = offset or 0
+    return islice(paths, offset, offset + limit if limit else None)
+
 def show(raw: bool,
          family: ArgFamily,
          family_modifier: ArgFamilyModifier,
@@ -116,11 +130,18 @@ def show(raw: bool,
          longer_prefixes: typing.Optional[bool],
          best_path: typing.Optional[bool],
          regex: typing.Optional[str],
-         vrf: typing.Optional[str]):
-    from vyos.utils.dict import dict_to_list
-
+         community: typing.Optional[str],
+         vrf: typing.Optional[str],
+         nexthop: typing.Optional[str],
+         offset: typing.Optional[int],
+         limit: typing.Optional[int],
+         stream: typing.Optional[bool]):
     if (longer_prefixes or best_path) and (prefix is None):
         raise ValueError("longer_prefixes and best_path can only be used when prefix is given")
+    elif len([x for x in [prefix, regex, community] if x]) > 1:
+        raise ValueError("prefix, regex and community are mutually exclusive")
+    elif (nexthop or offset or limit or stream) and not raw:
+        raise ValueError("nexthop, offset, limit and stream require raw output")
     elif (family == "l2vpn") and (family_modifier is not None):
         raise ValueError("l2vpn family does not accept any modifiers")
     else:
@@ -129,25 +150,25 @@ def show(raw: bool,
         frr_command = frr_command_template.render(kwargs)
         frr_command = re.sub(r'\s+', ' ', frr_command)
 
-        from vyos.utils.process import cmd
-        output = cmd(f"vtysh -c '{frr_command}'")
-
         if raw:
-            from json import loads
-            d = loads(output)
-            if not ("routes" in d):
-                raise vyos.opmode.InternalError("FRR returned a BGP table with no routes field")
-            d = d["routes"]
-            routes = dict_to_list(d, save_key_to="route_key")
-            return routes
+            routes = _get_raw_routes(frr_command, nexthop, offset, limit)
+            # NDJSON output of vyos.opmode for the whole table, a list of
+            # (a page of) the paths otherwise
+            return routes if stream else list(routes)
         else:
-            return output
+            return frr_vty.execute(frr_command)
 
 if __name__ == '__main__':
     try:
         res = vyos.opmode.run(sys.modules[__name__])
-        if res:
+        if isinstance(res, str):
             print(res)
-    except (ValueError, vyos.opmode.Error) as e:
+        elif res:
+            # streamed paths are printed while they are read
+            for line in res:
+                print(line)
+    except BrokenPipeError:
+        sys.stderr.close()
+    except (OSError, ValueError, vyos.opmode.Error) as e:
         print(e)
         sys.exit(1)
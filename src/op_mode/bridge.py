@@ -24,10 +24,10 @@ from tabulate import tabulate
 
 from vyos.utils.process import cmd
 from vyos.utils.process import rc_cmd
-from vyos.utils.process	import call
 from vyos.utils.dict import dict_search
 
 import vyos.opmode
+from vyos import frr_vty
 
 def _get_json_data():
     """
@@ -194,20 +194,19 @@ def _get_formatted_output_mdb(data):
 
 def _get_bridge_detail(iface):
     """Get interface detail statistics"""
-    return call(f'vtysh -c "show interface {iface}"')
+    return frr_vty.execute(f'show interface {iface}')
 
 def _get_bridge_detail_nexthop_group(iface):
     """Get interface detail nexthop_group statistics"""
-    return call(f'vtysh -c "show interface {iface} nexthop-group"')
+    return frr_vty.execute(f'show interface {iface} nexthop-group')
 
 def _get_bridge_detail_nexthop_group_raw(iface):
-    out = cmd(f'vtysh -c "show interface {iface} nexthop-group"')
+    out = frr_vty.execute(f'show interface {iface} nexthop-group')
     return out
 
 def _get_bridge_detail_raw(iface):
     """Get interface detail json statistics"""
-    data =  cmd(f'vtysh -c "show interface {iface} json"')
-    data_dict = json.loads(data)
+    data_dict = frr_vty.execute_json(f'show interface {iface} json')
     return data_dict
 
 def show(raw: bool):
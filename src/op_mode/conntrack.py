@@ -16,49 +16,50 @@
 
 import sys
 import typing
-import xmltodict
 
+from itertools import chain
+from itertools import islice
 from tabulate import tabulate
+
+from vyos import conntrack
 from vyos.utils.process import cmd
-from vyos.utils.process import run
 
 import vyos.opmode
 
 ArgFamily = typing.Literal['inet', 'inet6']
+ArgSort = typing.Literal['bytes', 'packets']
+
+headers = ["Id", "Original src", "Original dst", "Reply src", "Reply dst", "Protocol",
+           "State", "Timeout", "Mark", "Zone"]
 
-def _get_xml_data(family):
+def _get_flows(family, flow_filter, raw=False, top=None, sort='bytes',
+               offset=None, limit=None):
     """
-    Get conntrack XML output
+    Generator of (info, flow) tuples of the conntrack entries matching
+    flow_filter, flow is the dictionary of the raw output and only set if
+    requested. Entries are read one by one and never held all in memory.
     """
-    return cmd(f'sudo conntrack --dump --family {family} --output xml')
+    flows = conntrack.dump(family, flow_filter.args())
+    items = ((conntrack.flow_info(flow), flow) for flow in flows)
+    items = ((info, conntrack.flow_dict(flow) if raw else None)
+             for info, flow in items if flow_filter(info))
+    if top:
+        items = conntrack.top(items, top, sort)
+    start = offset or 0
+    return islice(items, start, start + limit if limit else None)
 
 
-def _xml_to_dict(xml):
-    """
-    Convert XML to dictionary
-    Return: dictionary
-    """
-    parse = xmltodict.parse(xml, attr_prefix='')
-    # If only one conntrack entry we must change dict
-    if 'meta' in parse['conntrack']['flow']:
-        return dict(conntrack={'flow': [parse['conntrack']['flow']]})
-    return parse
+def _address(address, port):
+    return f'{address}:{port}' if port else address
 
 
-def _get_raw_data(family):
-    """
-    Return: dictionary
-    """
-    xml = _get_xml_data(family)
-    if len(xml) == 0:
-        output = {'conntrack':
-            {
-                'error': True,
-                'reason': 'entries not found'
-            }
-        }
-        return output
-    return _xml_to_dict(xml)
+def _get_row(info):
+    return [info['id'],
+            _address(info.get('orig_src', ''), info.get('orig_sport')),
+            _address(info.get('orig_dst', ''), info.get('orig_dport')),
+            _address(info.get('reply_src', ''), info.get('reply_sport')),
+            _address(info.get('reply_dst', ''), info.get('reply_dport')),
+            info['protocol'], info['state'], info['timeout'], info['mark'], info['zone']]
 
 
 def _get_raw_statistics():
@@ -76,65 +77,41 @@ def get_formatted_statistics(entries):
     return output
 
 
-def get_formatted_output(dict_data):
+def get_formatted_output(items, family):
     """
-    :param xml:
-    :return: formatted output
+    :param items: (info, flow) tuples
+    :return: generator of output lines, rows are formatted as they are read
     """
-    data_entries = []
-    if 'error' in dict_data['conntrack']:
-        return 'Entries not found'
-    for entry in dict_data['conntrack']['flow']:
-        orig_src, orig_dst, orig_sport, orig_dport = {}, {}, {}, {}
-        reply_src, reply_dst, reply_sport, reply_dport = {}, {}, {}, {}
-        proto = {}
-        for meta in entry['meta']:
-            direction = meta['direction']
-            if direction in ['original']:
-                if 'layer3' in meta:
-                    orig_src = meta['layer3']['src']
-                    orig_dst = meta['layer3']['dst']
-                if 'layer4' in meta:
-                    if meta.get('layer4').get('sport'):
-                        orig_sport = meta['layer4']['sport']
-                    if meta.get('layer4').get('dport'):
-                        orig_dport = meta['layer4']['dport']
-                    proto = meta['layer4']['protoname']
-            if direction in ['reply']:
-                if 'layer3' in meta:
-                    reply_src = meta['layer3']['src']
-                    reply_dst = meta['layer3']['dst']
-                if 'layer4' in meta:
-                    if meta.get('layer4').get('sport'):
-                        reply_sport = meta['layer4']['sport']
-                    if meta.get('layer4').get('dport'):
-                        reply_dport = meta['layer4']['dport']
-                    proto = meta['layer4']['protoname']
-            if direction == 'independent':
-                conn_id = meta['id']
-                timeout = meta['timeout']
-                orig_src = f'{orig_src}:{orig_sport}' if orig_sport else orig_src
-                orig_dst = f'{orig_dst}:{orig_dport}' if orig_dport else orig_dst
-                reply_src = f'{reply_src}:{reply_sport}' if reply_sport else reply_src
-                reply_dst = f'{reply_dst}:{reply_dport}' if reply_dport else reply_dst
-                state = meta['state'] if 'state' in meta else ''
-                mark = meta['mark'] if 'mark' in meta else ''
-                zone = meta['zone'] if 'zone' in meta else ''
-                data_entries.append(
-                    [conn_id, orig_src, orig_dst, reply_src, reply_dst, proto, state, timeout, mark, zone])
-    headers = ["Id", "Original src", "Original dst", "Reply src", "Reply dst", "Protocol", "State", "Timeout", "Mark",
-               "Zone"]
-    output = tabulate(data_entries, headers, numalign="left")
-    return output
-
-
-def show(raw: bool, family: ArgFamily):
+    items = iter(items)
+    first = next(items, None)
+    if first is None:
+        yield 'Entries not found'
+        return
+    address = 21 if family == 'ipv4' else 47
+    widths = [10, address, address, address, address, 8, 11, 7, 10, 4]
+    rows = (_get_row(info) for info, _ in chain([first], items))
+    yield from conntrack.format_table(headers, widths, rows)
+
+
+def show(raw: bool, family: ArgFamily,
+         source: typing.Optional[str], destination: typing.Optional[str],
+         protocol: typing.Optional[str], zone: typing.Optional[int],
+         mark: typing.Optional[str], count: typing.Optional[bool],
+         top: typing.Optional[int], sort: typing.Optional[ArgSort],
+         offset: typing.Optional[int], limit: typing.Optional[int]):
     family = 'ipv6' if family == 'inet6' else 'ipv4'
-    conntrack_data = _get_raw_data(family)
+    flow_filter = conntrack.FlowFilter(source, destination, protocol, zone, mark)
+    if count:
+        total = sum(1 for _ in _get_flows(family, flow_filter))
+        return {'count': total} if raw else f'Entries: {total}'
+
+    items = _get_flows(family, flow_filter, raw=raw, top=top, sort=sort or 'bytes',
+                       offset=offset, limit=limit)
     if raw:
-        return conntrack_data
-    else:
-        return get_formatted_output(conntrack_data)
+        # streamed as one flow per line by vyos.opmode, without holding the
+        # table in memory
+        return (flow for _, flow in items)
+    return get_formatted_output(items, family)
 
 
 def show_statistics(raw: bool):
@@ -148,8 +125,14 @@ def show_statistics(raw: bool):
 if __name__ == '__main__':
     try:
         res = vyos.opmode.run(sys.modules[__name__])
-        if res:
+        if isinstance(res, str):
             print(res)
-    except (ValueError, vyos.opmode.Error) as e:
+        elif res:
+            # table rows are printed while conntrack entries are read
+            for line in res:
+                print(line)
+    except BrokenPipeError:
+        sys.stderr.close()
+    except (OSError, ValueError, vyos.opmode.Error) as e:
         print(e)
         sys.exit(1)
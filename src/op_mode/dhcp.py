@@ -18,16 +18,19 @@ import os
 import sys
 import typing
 
+from collections import Counter
 from datetime import datetime
+from datetime import timedelta
 from glob import glob
 from ipaddress import ip_address
-from isc_dhcp_leases import IscDhcpLeases
 from tabulate import tabulate
+from time import time
 
 import vyos.opmode
 
 from vyos.base import Warning
 from vyos.configquery import ConfigTreeQuery
+from vyos.dhcp_leases import lease_file
 
 from vyos.utils.dict import dict_search
 from vyos.utils.file import read_file
@@ -45,7 +48,8 @@ ArgFamily = typing.Literal['inet', 'inet6']
 ArgState = typing.Literal['all', 'active', 'free', 'expired', 'released', 'abandoned', 'reset', 'backup']
 
 def _utc_to_local(utc_dt):
-    return datetime.fromtimestamp((datetime.fromtimestamp(utc_dt) - datetime(1970, 1, 1)).total_seconds())
+    # lease times are UNIX timestamps, see vyos.dhcp_leases.parse_time()
+    return datetime.fromtimestamp(utc_dt)
 
 
 def _format_hex_string(in_str):
@@ -59,80 +63,60 @@ def _format_hex_string(in_str):
     return out_str
 
 
-def _find_list_of_dict_index(lst, key='ip', value='') -> int:
+def _get_raw_server_leases(family='inet', pool=None, sorted=None, state=None) -> list:
     """
-    Find the index entry of list of dict matching the dict value
-    Exampe:
-        % lst = [{'ip': '192.0.2.1'}, {'ip': '192.0.2.2'}]
-        % _find_list_of_dict_index(lst, key='ip', value='192.0.2.2')
-        % 1
-    """
-    idx = next((index for (index, d) in enumerate(lst) if d[key] == value), None)
-    return idx
-
-
-def _get_raw_server_leases(family='inet', pool=None, sorted=None, state=[]) -> list:
-    """
-    Get DHCP server leases
+    Get DHCP server leases, the lease file is only read from where it was
+    read last time and the last entry of an address wins
     :return list
     """
-    lease_file = '/config/dhcpdv6.leases' if family == 'inet6' else '/config/dhcpd.leases'
+    lease_path = '/config/dhcpdv6.leases' if family == 'inet6' else '/config/dhcpd.leases'
     data = []
-    leases = IscDhcpLeases(lease_file).get()
+    now = time()
 
     if pool is None:
         pool = _get_dhcp_pools(family=family)
-    else:
+    elif isinstance(pool, str):
         pool = [pool]
+    pool = set(pool)
+
+    lease_types_long = {'na': 'non-temporary', 'ta': 'temporary', 'pd': 'prefix delegation'}
+    for lease in lease_file(lease_path).leases().values():
+        # Do not add old leases
+        if lease['pool'] not in pool or lease['state'] == 'free':
+            continue
+        if state and state != 'all' and lease['state'] != state:
+            continue
 
-    for lease in leases:
         data_lease = {}
-        data_lease['ip'] = lease.ip
-        data_lease['state'] = lease.binding_state
-        data_lease['pool'] = lease.sets.get('shared-networkname', '')
-        data_lease['end'] = lease.end.timestamp() if lease.end else None
+        data_lease['ip'] = lease['ip']
+        data_lease['state'] = lease['state']
+        data_lease['pool'] = lease['pool']
+        data_lease['end'] = lease['end']
 
         if family == 'inet':
-            data_lease['mac'] = lease.ethernet
-            data_lease['start'] = lease.start.timestamp()
-            data_lease['hostname'] = lease.hostname
+            # backup leases of a failover peer are not bound to a client
+            data_lease['mac'] = lease['mac'] or '-'
+            data_lease['start'] = lease['start']
+            data_lease['hostname'] = lease['hostname']
 
         if family == 'inet6':
-            data_lease['last_communication'] = lease.last_communication.timestamp()
-            data_lease['iaid_duid'] = _format_hex_string(lease.host_identifier_string)
-            lease_types_long = {'na': 'non-temporary', 'ta': 'temporary', 'pd': 'prefix delegation'}
-            data_lease['type'] = lease_types_long[lease.type]
+            data_lease['last_communication'] = lease['last_communication']
+            data_lease['iaid_duid'] = _format_hex_string(lease['iaid_duid'])
+            data_lease['type'] = lease_types_long[lease['type']]
 
         data_lease['remaining'] = '-'
+        if lease['end'] and lease['end'] >= now:
+            # timedelta gives the same format as the subtraction of datetimes
+            data_lease['remaining'] = str(timedelta(seconds=int(lease['end'] - now)))
 
-        if lease.end:
-            data_lease['remaining'] = lease.end - datetime.utcnow()
-
-            if data_lease['remaining'].days >= 0:
-                # substraction gives us a timedelta object which can't be formatted with strftime
-                # so we use str(), split gets rid of the microseconds
-                data_lease['remaining'] = str(data_lease["remaining"]).split('.')[0]
-
-        # Do not add old leases
-        if data_lease['remaining'] != '' and data_lease['pool'] in pool and data_lease['state'] != 'free':
-            if not state or data_lease['state'] in state:
-                data.append(data_lease)
-
-        # deduplicate
-        checked = []
-        for entry in data:
-            addr = entry.get('ip')
-            if addr not in checked:
-                checked.append(addr)
-            else:
-                idx = _find_list_of_dict_index(data, key='ip', value=addr)
-                data.pop(idx)
+        data.append(data_lease)
 
     if sorted:
         if sorted == 'ip':
-            data.sort(key = lambda x:ip_address(x['ip']))
+            data.sort(key = lambda x:ip_address(x['ip'].split('/')[0]))
         else:
-            data.sort(key = lambda x:x[sorted])
+            # times may be missing, e.g. the start of backup leases
+            data.sort(key = lambda x:(x[sorted] is None, x[sorted]))
     return data
 
 
@@ -144,7 +128,7 @@ def _get_formatted_server_leases(raw_data, family='inet'):
             hw_addr = lease.get('mac')
             state = lease.get('state')
             start = lease.get('start')
-            start =  _utc_to_local(start).strftime('%Y/%m/%d %H:%M:%S')
+            start =  _utc_to_local(start).strftime('%Y/%m/%d %H:%M:%S') if start else '-'
             end = lease.get('end')
             end =  _utc_to_local(end).strftime('%Y/%m/%d %H:%M:%S') if end else '-'
             remain = lease.get('remaining')
@@ -211,11 +195,14 @@ def _get_raw_pool_statistics(family='inet', pool=None):
         pool = [pool]
 
     v = 'v6' if family == 'inet6' else ''
+    # lease counts of all pools from a single pass over the leases
+    lease_count = Counter(lease['pool'] for lease in
+                          _get_raw_server_leases(family=family, pool=pool))
     stats = []
     for p in pool:
         subnet = config.list_nodes(f'service dhcp{v}-server shared-network-name {p} subnet')
         size = _get_pool_size(family=family, pool=p)
-        leases = len(_get_raw_server_leases(family=family, pool=p))
+        leases = lease_count[p]
         use_percentage = round(leases / size * 100) if size != 0 else 0
         pool_stats = {'pool': p, 'size': size, 'leases': leases,
                       'available': (size - leases), 'use_percentage': use_percentage, 'subnet': subnet}
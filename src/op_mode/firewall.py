@@ -17,13 +17,21 @@
 import argparse
 import ipaddress
 import json
+import os
 import re
 import tabulate
+import time
 
 from vyos.config import Config
-from vyos.utils.process import cmd
+from vyos.nftables import parse
+from vyos.nftables import rule_key
+from vyos.nftables import Snapshot
 from vyos.utils.dict import dict_search_args
 
+nftables_conf = '/run/nftables.conf'
+# (mtime of nftables_conf, rule text index), see get_rendered_rules()
+rendered_rules = (None, {})
+
 def get_config_node(conf, node=None, family=None, hook=None, priority=None):
     if node == 'nat':
         if family == 'ipv6':
@@ -47,7 +55,29 @@ def get_config_node(conf, node=None, family=None, hook=None, priority=None):
 
     return node_config
 
-def get_nftables_details(family, hook, priority):
+def get_rendered_rules():
+    """ Rule text by (family, chain, comment) as rendered by conf_mode,
+    parsed again when a commit rewrote the ruleset, e.g. in watch mode """
+    global rendered_rules
+    try:
+        mtime = os.stat(nftables_conf).st_mtime_ns
+    except OSError:
+        return {}
+    if rendered_rules[0] != mtime:
+        rules = {}
+        try:
+            with open(nftables_conf) as f:
+                tables = parse(f.read())['tables']
+        except (OSError, ValueError):
+            tables = {}
+        for (family, _), table in tables.items():
+            for chain, chain_conf in table['chain'].items():
+                for rule in chain_conf['rules']:
+                    rules[(family, chain, rule_key(rule))] = rule
+        rendered_rules = (mtime, rules)
+    return rendered_rules[1]
+
+def get_nftables_details(family, hook, priority, nft, rates=None):
     if family == 'ipv6':
         suffix = 'ip6'
         name_prefix = 'NAME6_'
@@ -62,37 +92,38 @@ def get_nftables_details(family, hook, priority):
         aux=''
 
     if hook == 'name' or hook == 'ipv6-name':
-        command = f'sudo nft list chain {suffix} vyos_filter {name_prefix}{priority}'
+        chain = f'{name_prefix}{priority}'
     else:
         up_hook = hook.upper()
-        command = f'sudo nft list chain {suffix} vyos_filter VYOS_{aux}{up_hook}_{priority}'
+        chain = f'VYOS_{aux}{up_hook}_{priority}'
 
-    try:
-        results = cmd(command)
-    except:
+    # All counters of an op-mode call are read from one snapshot 'nft'
+    if not nft.has_chain(suffix, 'vyos_filter', chain):
         return {}
 
     out = {}
-    for line in results.split('\n'):
-        comment_search = re.search(rf'{priority}[\- ](\d+|default-action)', line)
+    rendered = get_rendered_rules()
+    for nft_rule in nft.rules(suffix, 'vyos_filter', chain):
+        comment = nft_rule.get('comment', '')
+        comment_search = re.search(rf'{priority}[\- ](\d+|default-action)', comment)
         if not comment_search:
             continue
 
         rule = {}
         rule_id = comment_search[1]
-        counter_search = re.search(r'counter packets (\d+) bytes (\d+)', line)
-        if counter_search:
-            rule['packets'] = counter_search[1]
-            rule['bytes'] = counter_search[2]
+        rule['packets'], rule['bytes'] = nft.counters(nft_rule)
+        if rates is not None:
+            rule['pps'], rule['bps'] = rates.get((suffix, 'vyos_filter', chain, comment), (0, 0))
 
-        rule['conditions'] = re.sub(r'(\b(counter packets \d+ bytes \d+|drop|reject|return|log)\b|comment "[\w\-]+")', '', line).strip()
+        line = rendered.get((suffix, chain, comment), '')
+        rule['conditions'] = re.sub(r'(\b(counter( packets \d+ bytes \d+)?|drop|reject|return|log)\b|comment "[\w\-]+")', '', line).strip()
         out[rule_id] = rule
     return out
 
-def output_firewall_name(family, hook, priority, firewall_conf, single_rule_id=None):
+def output_firewall_name(family, hook, priority, firewall_conf, nft, single_rule_id=None):
     print(f'\n---------------------------------\n{family} Firewall "{hook} {priority}"\n')
 
-    details = get_nftables_details(family, hook, priority)
+    details = get_nftables_details(family, hook, priority, nft)
     rows = []
 
     if 'rule' in firewall_conf:
@@ -131,10 +162,17 @@ def output_firewall_name(family, hook, priority, firewall_conf, single_rule_id=N
         header = ['Rule', 'Action', 'Protocol', 'Packets', 'Bytes', 'Conditions']
         print(tabulate.tabulate(rows, header) + '\n')
 
-def output_firewall_name_statistics(family, hook, prior, prior_conf, single_rule_id=None):
+def rate_columns(details, rule_id, rates):
+    """ Packets and bytes per second columns in --watch mode """
+    if rates is None:
+        return []
+    rule_details = details.get(rule_id, {})
+    return [f"{rule_details.get('pps', 0):.1f}", f"{rule_details.get('bps', 0):.0f}"]
+
+def output_firewall_name_statistics(family, hook, prior, prior_conf, nft, single_rule_id=None, rates=None):
     print(f'\n---------------------------------\n{family} Firewall "{hook} {prior}"\n')
 
-    details = get_nftables_details(family, hook, prior)
+    details = get_nftables_details(family, hook, prior, nft, rates)
     rows = []
 
     if 'rule' in prior_conf:
@@ -205,6 +243,7 @@ def output_firewall_name_statistics(family, hook, prior, prior_conf, single_rule
             else:
                 row.append('0')
                 row.append('0')
+            row += rate_columns(details, rule_id, rates)
             row.append(rule_conf['action'])
             row.append(source_addr)
             row.append(dest_addr)
@@ -218,6 +257,7 @@ def output_firewall_name_statistics(family, hook, prior, prior_conf, single_rule
         rule_details = details['default-action']
         row.append(rule_details.get('packets', 0))
         row.append(rule_details.get('bytes', 0))
+        row += rate_columns(details, 'default-action', rates)
         if 'default_action' in prior_conf:
             row.append(prior_conf['default_action'])
         else:
@@ -237,6 +277,7 @@ def output_firewall_name_statistics(family, hook, prior, prior_conf, single_rule
         else:
             row.append('0')
             row.append('0')
+        row += rate_columns(details, 'default-action', rates)
         row.append(prior_conf['default_action'])
         row.append('any')   # Source
         row.append('any')   # Dest
@@ -246,6 +287,8 @@ def output_firewall_name_statistics(family, hook, prior, prior_conf, single_rule
 
     if rows:
         header = ['Rule', 'Packets', 'Bytes', 'Action', 'Source', 'Destination', 'Inbound-Interface', 'Outbound-interface']
+        if rates is not None:
+            header[3:3] = ['Packets/s', 'Bytes/s']
         print(tabulate.tabulate(rows, header) + '\n')
 
 def show_firewall():
@@ -257,11 +300,12 @@ def show_firewall():
     if not firewall:
         return
 
+    nft = Snapshot()
     for family in ['ipv4', 'ipv6', 'bridge']:
         if family in firewall:
             for hook, hook_conf in firewall[family].items():
                 for prior, prior_conf in firewall[family][hook].items():
-                    output_firewall_name(family, hook, prior, prior_conf)
+                    output_firewall_name(family, hook, prior, prior_conf, nft)
 
 def show_firewall_family(family):
     print(f'Rulesets {family} Information')
@@ -272,9 +316,10 @@ def show_firewall_family(family):
     if not firewall or family not in firewall:
         return
 
+    nft = Snapshot()
     for hook, hook_conf in firewall[family].items():
         for prior, prior_conf in firewall[family][hook].items():
-            output_firewall_name(family, hook, prior, prior_conf)
+            output_firewall_name(family, hook, prior, prior_conf, nft)
 
 def show_firewall_name(family, hook, priority):
     print('Ruleset Information')
@@ -282,7 +327,7 @@ def show_firewall_name(family, hook, priority):
     conf = Config()
     firewall = get_config_node(conf, 'firewall', family, hook, priority)
     if firewall:
-        output_firewall_name(family, hook, priority, firewall)
+        output_firewall_name(family, hook, priority, firewall, Snapshot())
 
 def show_firewall_rule(family, hook, priority, rule_id):
     print('Rule Information')
@@ -290,7 +335,7 @@ def show_firewall_rule(family, hook, priority, rule_id):
     conf = Config()
     firewall = get_config_node(conf, 'firewall', family, hook, priority)
     if firewall:
-        output_firewall_name(family, hook, priority, firewall, rule_id)
+        output_firewall_name(family, hook, priority, firewall, Snapshot(), rule_id)
 
 def show_firewall_group(name=None):
     conf = Config()
@@ -499,7 +544,7 @@ def show_summary():
 
     show_firewall_group()
 
-def show_statistics():
+def show_statistics(watch=None):
     print('Rulesets Statistics')
 
     conf = Config()
@@ -508,11 +553,23 @@ def show_statistics():
     if not firewall:
         return
 
-    for family in ['ipv4', 'ipv6', 'bridge']:
-        if family in firewall:
-            for hook, hook_conf in firewall[family].items():
-                for prior, prior_conf in firewall[family][hook].items():
-                    output_firewall_name_statistics(family, hook,prior, prior_conf)
+    nft = Snapshot()
+    rates = None
+    while True:
+        for family in ['ipv4', 'ipv6', 'bridge']:
+            if family in firewall:
+                for hook, hook_conf in firewall[family].items():
+                    for prior, prior_conf in firewall[family][hook].items():
+                        output_firewall_name_statistics(family, hook,prior, prior_conf, nft, rates=rates)
+        if not watch:
+            return
+
+        # Rates of all rules between two snapshots
+        previous = nft
+        time.sleep(watch)
+        nft = Snapshot()
+        rates = nft.rates(previous)
+        print(f'\n=== {time.strftime("%H:%M:%S")} - rates over the last {watch}s ===')
 
 if __name__ == '__main__':
     parser = argparse.ArgumentParser()
@@ -523,6 +580,8 @@ if __name__ == '__main__':
     parser.add_argument('--priority', help='Firewall priority', required=False, action='store', nargs='?', default='')
     parser.add_argument('--rule', help='Firewall Rule ID', required=False)
     parser.add_argument('--ipv6', help='IPv6 toggle', action='store_true')
+    parser.add_argument('--watch', help='Show rates, refreshed every WATCH seconds',
+                        type=float, nargs='?', const=2.0, default=None)
 
     args = parser.parse_args()
 
@@ -538,6 +597,9 @@ if __name__ == '__main__':
     elif args.action == 'show_group':
         show_firewall_group(args.name)
     elif args.action == 'show_statistics':
-        show_statistics()
+        try:
+            show_statistics(args.watch)
+        except KeyboardInterrupt:
+            pass
     elif args.action == 'show_summary':
         show_summary()
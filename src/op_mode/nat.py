@@ -15,17 +15,17 @@
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
 import jmespath
-import json
 import sys
-import xmltodict
 import typing
 
+from itertools import chain
 from tabulate import tabulate
 
 import vyos.opmode
 
+from vyos import conntrack
 from vyos.configquery import ConfigTreeQuery
-from vyos.utils.process import cmd
+from vyos.nftables import Snapshot
 from vyos.utils.dict import dict_search
 
 base = 'nat'
@@ -33,55 +33,42 @@ unconf_message = 'NAT is not configured'
 
 ArgDirection = typing.Literal['source', 'destination']
 ArgFamily = typing.Literal['inet', 'inet6']
+ArgAggregate = typing.Literal['inside', 'public', 'block']
 
-def _get_xml_translation(direction, family, address=None):
+def _get_translations(direction, family, address=None):
     """
-    Get conntrack XML output --src-nat|--dst-nat
+    Generator of (info, element) tuples of the conntrack entries translated
+    in direction, read one by one from conntrack
     """
-    if direction == 'source':
-        opt = '--src-nat'
-    if direction == 'destination':
-        opt = '--dst-nat'
-    tmp = f'conntrack --dump --family {family} {opt} --output xml'
-    if address:
-        tmp += f' --src {address}'
-    return cmd(tmp)
-
-
-def _xml_to_dict(xml):
-    """
-    Convert XML to dictionary
-    Return: dictionary
-    """
-    parse = xmltodict.parse(xml, attr_prefix='')
-    # If only one conntrack entry we must change dict
-    if 'meta' in parse['conntrack']['flow']:
-        return dict(conntrack={'flow': [parse['conntrack']['flow']]})
-    return parse
+    opt = '--src-nat' if direction == 'source' else '--dst-nat'
+    flow_filter = conntrack.FlowFilter(source=address)
+    for flow in conntrack.dump(family, [opt] + flow_filter.args()):
+        info = conntrack.flow_info(flow)
+        if flow_filter(info):
+            yield info, flow
 
 
-def _get_json_data(direction, family):
+def _get_nat_chain(direction, family):
     """
-    Get NAT format JSON
+    Get NAT table family and chain
     """
     if direction == 'source':
         chain = 'POSTROUTING'
     if direction == 'destination':
         chain = 'PREROUTING'
     family = 'ip6' if family == 'inet6' else 'ip'
-    return cmd(f'nft --json list chain {family} vyos_nat {chain}')
+    return family, chain
 
 
 def _get_raw_data_rules(direction, family):
-    """Get interested rules
+    """Get interested rules from a new nftables snapshot
     :returns dict
     """
-    data = _get_json_data(direction, family)
-    data_dict = json.loads(data)
+    family, chain = _get_nat_chain(direction, family)
     rules = []
-    for rule in data_dict['nftables']:
-        if 'rule' in rule and 'comment' in rule['rule']:
-            rules.append(rule)
+    for rule in Snapshot().rules(family, 'vyos_nat', chain):
+        if 'comment' in rule:
+            rules.append({'rule': rule})
     return rules
 
 
@@ -89,8 +76,9 @@ def _get_raw_translation(direction, family, address=None):
     """
     Return: dictionary
     """
-    xml = _get_xml_translation(direction, family, address)
-    if len(xml) == 0:
+    flows = [conntrack.flow_dict(flow) for _, flow in
+             _get_translations(direction, family, address)]
+    if not flows:
         output = {'conntrack':
             {
                 'error': True,
@@ -98,7 +86,16 @@ def _get_raw_translation(direction, family, address=None):
             }
         }
         return output
-    return _xml_to_dict(xml)
+    return {'conntrack': {'flow': flows}}
+
+
+def _get_raw_aggregate(direction, family, address, aggregate, block_size):
+    infos = (info for info, _ in _get_translations(direction, family, address))
+    data = conntrack.nat_aggregate(infos, direction, aggregate, block_size)
+    if aggregate == 'block':
+        return [{'public': public, 'port_block': f'{port}-{port + block_size - 1}',
+                 'translations': count} for (public, port), count in data]
+    return [{aggregate: key, 'translations': count} for key, count in data]
 
 
 def _get_formatted_output_rules(data, direction, family):
@@ -234,56 +231,51 @@ def _get_formatted_output_statistics(data, direction):
     return output
 
 
-def _get_formatted_translation(dict_data, nat_direction, family, verbose):
-    data_entries = []
-    if 'error' in dict_data['conntrack']:
-        return 'Entries not found'
-    for entry in dict_data['conntrack']['flow']:
-        orig_src, orig_dst, orig_sport, orig_dport = {}, {}, {}, {}
-        reply_src, reply_dst, reply_sport, reply_dport = {}, {}, {}, {}
-        proto = {}
-        for meta in entry['meta']:
-            direction = meta['direction']
-            if direction in ['original']:
-                if 'layer3' in meta:
-                    orig_src = meta['layer3']['src']
-                    orig_dst = meta['layer3']['dst']
-                if 'layer4' in meta:
-                    if meta.get('layer4').get('sport'):
-                        orig_sport = meta['layer4']['sport']
-                    if meta.get('layer4').get('dport'):
-                        orig_dport = meta['layer4']['dport']
-                    proto = meta['layer4']['protoname']
-            if direction in ['reply']:
-                if 'layer3' in meta:
-                    reply_src = meta['layer3']['src']
-                    reply_dst = meta['layer3']['dst']
-                if 'layer4' in meta:
-                    if meta.get('layer4').get('sport'):
-                        reply_sport = meta['layer4']['sport']
-                    if meta.get('layer4').get('dport'):
-                        reply_dport = meta['layer4']['dport']
-                    proto = meta['layer4']['protoname']
-            if direction == 'independent':
-                conn_id = meta['id']
-                timeout = meta['timeout']
-                orig_src = f'{orig_src}:{orig_sport}' if orig_sport else orig_src
-                orig_dst = f'{orig_dst}:{orig_dport}' if orig_dport else orig_dst
-                reply_src = f'{reply_src}:{reply_sport}' if reply_sport else reply_src
-                reply_dst = f'{reply_dst}:{reply_dport}' if reply_dport else reply_dst
-                state = meta['state'] if 'state' in meta else ''
-                mark = meta.get('mark', '')
-                zone = meta['zone'] if 'zone' in meta else ''
-                if nat_direction == 'source':
-                    tmp = [orig_src, reply_dst, proto, timeout, mark, zone]
-                    data_entries.append(tmp)
-                elif nat_direction == 'destination':
-                    tmp = [orig_dst, reply_src, proto, timeout, mark, zone]
-                    data_entries.append(tmp)
+def _address(address, port):
+    return f'{address}:{port}' if port else address
+
 
+def _get_translation_row(info, nat_direction):
+    if nat_direction == 'source':
+        pre_nat = _address(info.get('orig_src'), info.get('orig_sport'))
+        post_nat = _address(info.get('reply_dst'), info.get('reply_dport'))
+    else:
+        pre_nat = _address(info.get('orig_dst'), info.get('orig_dport'))
+        post_nat = _address(info.get('reply_src'), info.get('reply_sport'))
+    return [pre_nat, post_nat, info['protocol'], info['timeout'], info['mark'], info['zone']]
+
+
+def _get_formatted_translation(items, nat_direction, family, verbose):
+    """
+    Generator of output lines, rows are formatted while translations are read
+    """
+    items = iter(items)
+    first = next(items, None)
+    if first is None:
+        yield 'Entries not found'
+        return
+
+    address = 21 if family == 'ipv4' else 47
     headers = ["Pre-NAT", "Post-NAT", "Proto", "Timeout", "Mark", "Zone"]
-    output = tabulate(data_entries, headers, numalign="left")
-    return output
+    rows = (_get_translation_row(info, nat_direction)
+            for info, _ in chain([first], items))
+    yield from conntrack.format_table(headers, [address, address, 5, 7, 10, 4], rows)
+
+
+def _get_formatted_aggregate(data, nat_direction, aggregate):
+    if not data:
+        return 'Entries not found'
+    if aggregate == 'block':
+        headers = ["Public address", "Port block", "Translations"]
+        entries = [[e['public'], e['port_block'], e['translations']] for e in data]
+    else:
+        if aggregate == 'inside':
+            header = 'Inside address' if nat_direction == 'source' else 'Internal address'
+        else:
+            header = 'Public address'
+        headers = [header, "Translations"]
+        entries = [[e[aggregate], e['translations']] for e in data]
+    return tabulate(entries, headers, numalign="left")
 
 
 def _verify(func):
@@ -321,24 +313,37 @@ def show_statistics(raw: bool, direction: ArgDirection, family: ArgFamily):
 def show_translations(raw: bool, direction: ArgDirection,
                       family: ArgFamily,
                       address: typing.Optional[str],
-                      verbose: typing.Optional[bool]):
+                      verbose: typing.Optional[bool],
+                      aggregate: typing.Optional[ArgAggregate],
+                      block_size: typing.Optional[int]):
     family = 'ipv6' if family == 'inet6' else 'ipv4'
-    nat_translation = _get_raw_translation(direction,
-                                           family=family,
-                                           address=address)
+    if aggregate:
+        block_size = block_size or 1024
+        if block_size < 1:
+            raise ValueError('Port block size must be a positive number')
+        data = _get_raw_aggregate(direction, family, address, aggregate, block_size)
+        if raw:
+            return data
+        return _get_formatted_aggregate(data, direction, aggregate)
 
     if raw:
-        return nat_translation
+        return _get_raw_translation(direction, family=family, address=address)
     else:
-        return _get_formatted_translation(nat_translation, direction, family,
-                                          verbose)
+        return _get_formatted_translation(_get_translations(direction, family, address),
+                                          direction, family, verbose)
 
 
 if __name__ == '__main__':
     try:
         res = vyos.opmode.run(sys.modules[__name__])
-        if res:
+        if isinstance(res, str):
             print(res)
-    except (ValueError, vyos.opmode.Error) as e:
+        elif res:
+            # translations are printed while conntrack entries are read
+            for line in res:
+                print(line)
+    except BrokenPipeError:
+        sys.stderr.close()
+    except (OSError, ValueError, vyos.opmode.Error) as e:
         print(e)
         sys.exit(1)
@@ -25,6 +25,7 @@ import typing
 from jinja2 import Template
 
 import vyos.opmode
+from vyos import frr_vty
 
 frr_command_template = Template("""
 {% if family == "inet" %}
@@ -45,6 +46,9 @@ frr_command_template = Template("""
     tag {{tag}}
 {% elif net %}
     {{net}}
+    {% if longer_prefixes %}
+      longer-prefixes
+    {% endif %}
 {% elif protocol %}
     {{protocol}}
 {% endif %}
@@ -57,8 +61,6 @@ frr_command_template = Template("""
 ArgFamily = typing.Literal['inet', 'inet6']
 
 def show_summary(raw: bool, family: ArgFamily, table: typing.Optional[int], vrf: typing.Optional[str]):
-    from vyos.utils.process import cmd
-
     if family == 'inet':
         family_cmd = 'ip'
     elif family == 'inet6':
@@ -80,29 +82,44 @@ def show_summary(raw: bool, family: ArgFamily, table: typing.Optional[int], vrf:
     else:
         vrf_cmd = ""
 
+    frr_command = re.sub(r'\s+', ' ', f'show {family_cmd} route {vrf_cmd} summary {table_cmd}')
     if raw:
-        from json import loads
-
-        output = cmd(f"vtysh -c 'show {family_cmd} route {vrf_cmd} summary {table_cmd} json'").strip()
-
         # If there are no routes in a table, its "JSON" output is an empty string,
-        # as of FRR 8.4.1
-        if output:
-            return loads(output)
-        else:
-            return {}
+        # as of FRR 8.4.1, execute_json() returns an empty object then
+        return frr_vty.execute_json(frr_command)
     else:
-        output = cmd(f"vtysh -c 'show {family_cmd} route {vrf_cmd} summary {table_cmd}'")
+        output = frr_vty.execute(frr_command)
         return output
 
+def _get_raw_routes(frr_command, nexthop, offset, limit):
+    from itertools import islice
+    from vyos.frr_routes import NexthopFilter
+    from vyos.frr_routes import routes
+
+    # routes are read from FRR one prefix at a time
+    routes = routes(frr_command)
+    if nexthop:
+        routes = filter(NexthopFilter(nexthop), routes)
+    offset = offset or 0
+    return islice(routes, offset, offset + limit if limit else None)
+
 def show(raw: bool,
          family: ArgFamily,
          net: typing.Optional[str],
+         longer_prefixes: typing.Optional[bool],
          table: typing.Optional[int],
          protocol: typing.Optional[str],
          vrf: typing.Optional[str],
-         tag: typing.Optional[str]):
-    if net and protocol:
+         tag: typing.Optional[str],
+         nexthop: typing.Optional[str],
+         offset: typing.Optional[int],
+         limit: typing.Optional[int],
+         stream: typing.Optional[bool]):
+    if longer_prefixes and (net is None):
+        raise ValueError("longer_prefixes can only be used when net is given")
+    elif (nexthop or offset or limit or stream) and not raw:
+        raise ValueError("nexthop, offset, limit and stream require raw output")
+    elif net and protocol:
         raise ValueError("net and protocol are mutually exclusive")
     elif table and vrf:
         raise ValueError("table and vrf are mutually exclusive")
@@ -119,26 +136,26 @@ def show(raw: bool,
         frr_command = frr_command_template.render(kwargs)
         frr_command = re.sub(r'\s+', ' ', frr_command)
 
-        from vyos.utils.process import cmd
-        output = cmd(f"vtysh -c '{frr_command}'")
-
         if raw:
-            from json import loads
-            d = loads(output)
-            collect = []
-            for k,_ in d.items():
-                for l in d[k]:
-                    collect.append(l)
-            return collect
+            routes = _get_raw_routes(frr_command, nexthop, offset, limit)
+            # NDJSON output of vyos.opmode for the whole table, a list of
+            # (a page of) the routes otherwise
+            return routes if stream else list(routes)
         else:
-            return output
+            return frr_vty.execute(frr_command)
 
 if __name__ == '__main__':
     try:
         res = vyos.opmode.run(sys.modules[__name__])
-        if res:
+        if isinstance(res, str):
             print(res)
-    except (ValueError, vyos.opmode.Error) as e:
+        elif res:
+            # streamed routes are printed while they are read
+            for line in res:
+                print(line)
+    except BrokenPipeError:
+        sys.stderr.close()
+    except (OSError, ValueError, vyos.opmode.Error) as e:
         print(e)
         sys.exit(1)
 
@@ -98,4 +98,7 @@ def map_type_name(type_name: type, enums: Optional[dict] = None, optional: bool
     return 'Generic'
 
 def normalize_output(result: Union[dict, list]) -> Union[dict, list]:
+    if not isinstance(result, (dict, list)):
+        # streamed raw output of op-mode functions
+        result = list(result)
     return _normalize_field_names(decamelize(result))
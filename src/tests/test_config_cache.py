@@ -0,0 +1,65 @@
+#!/usr/bin/env python3
+#
+# Copyright (C) 2023 VyOS maintainers and contributors
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License version 2 or later as
+# published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import json
+
+from unittest import TestCase
+from unittest.mock import patch
+
+from vyos.config import Config
+from vyos.configsource import ConfigSourceString
+from vyos.configsource import ConfigTreeCache
+
+class FakeTree:
+    """ ConfigTree of a config given as JSON """
+    def __init__(self, config_text):
+        self.config_text = config_text
+
+    def to_json(self):
+        return self.config_text
+
+running = json.dumps({'system': {'name-server': ['192.0.2.1', '192.0.2.2']}})
+session = json.dumps({'system': {'name-server': ['192.0.2.1']}})
+
+class TestConfigTreeCache(TestCase):
+    def setUp(self):
+        patcher = patch('vyos.configsource.ConfigTree', FakeTree)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.cache = ConfigTreeCache()
+
+    def config(self):
+        return Config(config_source=ConfigSourceString(running, session,
+                                                       cache=self.cache))
+
+    def test_reuse(self):
+        first = self.config()
+        second = self.config()
+        self.assertIs(first.get_config_tree(), second.get_config_tree())
+        self.assertEqual(self.cache.stats()['misses'], 2)
+        self.assertEqual(self.cache.stats()['hits'], 2)
+
+    def test_modified_result(self):
+        conf = self.config().get_config_dict(['system'], no_multi_convert=True)
+        conf['system']['name-server'].append('192.0.2.3')
+        conf['system']['domain-name'] = 'example.com'
+
+        # a later commit with the same config
+        conf = self.config().get_config_dict(['system'], no_multi_convert=True)
+        self.assertEqual(conf, {'system': {'name-server': ['192.0.2.1']}})
+        conf = self.config().get_config_dict(['system'], effective=True,
+                                             no_multi_convert=True)
+        self.assertEqual(conf['system']['name-server'], ['192.0.2.1', '192.0.2.2'])
@@ -0,0 +1,116 @@
+#!/usr/bin/env python3
+#
+# Copyright (C) 2023 VyOS maintainers and contributors
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License version 2 or later as
+# published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import importlib.util
+import json
+import os
+import tempfile
+
+from importlib.machinery import SourceFileLoader
+from unittest import TestCase
+from unittest.mock import MagicMock
+from unittest.mock import patch
+
+import vyos.defaults
+
+configd = os.path.join(os.path.dirname(__file__), '..', 'services', 'vyos-configd')
+
+script = '''
+calls = []
+
+def get_config(config=None):
+    calls.append('get_config')
+    return {}
+
+def verify(c):
+    calls.append('verify')
+
+def generate(c):
+    calls.append('generate')
+
+def apply(c):
+    calls.append('apply')
+'''
+
+class Socket:
+    """ zmq REP socket stand-in, replaying the messages of vyshim """
+    def __init__(self, *messages):
+        self.messages = list(messages)
+        self.sent = []
+
+    def recv(self):
+        return self.messages.pop(0).encode()
+
+    def send(self, msg):
+        self.sent.append(msg.decode())
+
+class TestConfigd(TestCase):
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        data = os.path.join(tmp.name, 'data')
+        conf_mode = os.path.join(tmp.name, 'conf_mode')
+        os.mkdir(data)
+        os.mkdir(conf_mode)
+        with open(os.path.join(data, 'configd-include.json'), 'w') as f:
+            json.dump(['service_dummy.py'], f)
+        with open(os.path.join(conf_mode, 'service_dummy.py'), 'w') as f:
+            f.write(script)
+
+        with patch.dict(vyos.defaults.directories, {'data': data, 'conf_mode': conf_mode}):
+            loader = SourceFileLoader('vyos_configd', configd)
+            self.configd = importlib.util.module_from_spec(
+                importlib.util.spec_from_loader('vyos_configd', loader))
+            loader.exec_module(self.configd)
+        self.configd.script_stdout_log = os.path.join(tmp.name, 'stdout')
+
+        patches = [patch.object(self.configd, 'ConfigSourceString'),
+                   patch.object(self.configd, 'Config'),
+                   patch.object(self.configd, 'configd_option', lambda option: False)]
+        for p in patches:
+            p.start()
+            self.addCleanup(p.stop)
+
+    def test_commit(self):
+        socket = Socket('system { host-name a }', 'system { host-name b }',
+                        str(os.getpid()))
+        config = self.configd.initialization(socket)
+        self.assertEqual(socket.sent, ['active', 'session', 'pid'])
+        self.assertIs(config, self.configd.Config.return_value)
+
+        res = self.configd.run_node(config, 'service_dummy', None, ['service_dummy.py'])
+        self.assertEqual(res, self.configd.R_SUCCESS)
+        self.assertEqual(self.configd.conf_mode_scripts['service_dummy'].calls,
+                         ['get_config', 'verify', 'generate', 'apply'])
+
+    def test_frr_transaction(self):
+        node = '/usr/libexec/vyos/conf_mode/service_dummy.py'
+        socket = Socket('system { host-name a }', 'system { host-name b }',
+                        str(os.getpid()))
+        with patch.object(self.configd, 'configd_option', lambda option: option == 'frr_transaction'):
+            config = self.configd.initialization(socket)
+        self.assertTrue(self.configd.frr_transaction)
+        self.addCleanup(self.configd.vyos.frr.end_transaction)
+
+        # the FRR changes are applied on the last run of the commit
+        runs = [('service_dummy', 'a'), ('service_dummy', None)]
+        errors = [('service_dummy', Exception('rejected'))]
+        with patch.object(self.configd, 'predict_runs', lambda config: runs), \
+             patch('vyos.frr.end_transaction', MagicMock(return_value=errors)) as end:
+            res = self.configd.process_node_data(config, f'VYOS_TAGNODE_VALUE=a{node}')
+            self.assertEqual((res, end.call_count), (self.configd.R_SUCCESS, 0))
+            res = self.configd.process_node_data(config, node)
+            self.assertEqual((res, end.call_count), (self.configd.R_ERROR_COMMIT, 1))
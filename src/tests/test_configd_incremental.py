@@ -0,0 +1,143 @@
+#!/usr/bin/env python3
+#
+# Copyright (C) 2023 VyOS maintainers and contributors
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License version 2 or later as
+# published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import os
+
+from unittest import TestCase
+from unittest.mock import patch
+
+from vyos.configdep import commit_runs
+from vyos.configdep import configd_option
+from vyos.configdep import script_config_changed
+from vyos.xml_ref.definition import Xml
+
+conf_mode = '${vyos_conf_scripts_dir}'
+
+reference = {
+    'service': {
+        'node_data': {'node_type': 'node'},
+        'ntp': {
+            'node_data': {'node_type': 'node', 'priority': '400',
+                          'owner': f'{conf_mode}/service_ntp.py'},
+            'server': {
+                'node_data': {'node_type': 'tag'},
+                'prefer': {'node_data': {'node_type': 'leaf'}}}}},
+    'interfaces': {
+        'node_data': {'node_type': 'node'},
+        'ethernet': {
+            'node_data': {'node_type': 'tag', 'priority': '318',
+                          'owner': f'{conf_mode}/interfaces_ethernet.py'},
+            'mtu': {'node_data': {'node_type': 'leaf'}}}},
+    'qos': {
+        'node_data': {'node_type': 'node', 'owner': f'{conf_mode}/qos.py'}},
+}
+
+# as returned by load_script_ownership(): qos may call interfaces_ethernet
+ownership = ({'service_ntp': [(['service', 'ntp'], False)],
+              'interfaces_ethernet': [(['interfaces', 'ethernet'], True)],
+              'qos': [(['qos'], False)]},
+             {'interfaces_ethernet': {'qos'}})
+
+class Diff:
+    """ ConfigDiff stand-in, changed are the paths of changed leaf nodes,
+    deleted those of them no longer in the session config """
+    def __init__(self, *changed, deleted=()):
+        self.changed = changed
+        self.session = {}
+        for path in changed:
+            if path not in deleted:
+                node = self.session
+                for key in path:
+                    node = node.setdefault(key, {})
+
+    def is_node_changed(self, path):
+        return any(c[:len(path)] == path for c in self.changed)
+
+    def get_child_nodes_diff(self, path):
+        node = self.session
+        for key in path:
+            node = node.get(key, {})
+        return {'merge': list(node)}
+
+class TestConfigdIncremental(TestCase):
+    def changed(self, diff, script, tagnode=None):
+        return script_config_changed(diff, script, tagnode, ownership)
+
+    def test_owners(self):
+        xml = Xml()
+        xml.define(reference)
+        self.assertEqual(xml.owners(), ownership[0])
+        # qos owns a node without priority
+        self.assertEqual(xml.priorities(), {'service_ntp': 400,
+                                            'interfaces_ethernet': 318})
+
+    def test_changed_path(self):
+        diff = Diff(['service', 'ntp', 'server', 'time1.vyos.net', 'prefer'])
+        self.assertTrue(self.changed(diff, 'service_ntp'))
+        self.assertFalse(self.changed(diff, 'qos'))
+
+    def test_unchanged_path(self):
+        diff = Diff(['system', 'host-name'])
+        self.assertFalse(self.changed(diff, 'service_ntp'))
+        self.assertFalse(self.changed(diff, 'interfaces-ethernet', 'eth0'))
+        # scripts without known owned paths always run
+        self.assertTrue(self.changed(diff, 'system_host-name'))
+
+    def test_tagnode(self):
+        diff = Diff(['interfaces', 'ethernet', 'eth1', 'mtu'])
+        self.assertFalse(self.changed(diff, 'interfaces-ethernet', 'eth0'))
+        self.assertTrue(self.changed(diff, 'interfaces-ethernet', 'eth1'))
+        self.assertTrue(self.changed(diff, 'interfaces-ethernet'))
+
+        # the paths of callers are not scoped to the tagnode
+        diff = Diff(['qos', 'policy', 'shaper', 'foo'])
+        self.assertTrue(self.changed(diff, 'interfaces-ethernet', 'eth0'))
+
+    def test_commit_runs(self):
+        def is_tag(path):
+            return path == ['interfaces', 'ethernet']
+
+        diff = Diff(['service', 'ntp', 'server', 'time1.vyos.net'],
+                    ['interfaces', 'ethernet', 'eth0', 'mtu'],
+                    ['interfaces', 'ethernet', 'eth2', 'mtu'],
+                    ['qos', 'policy'], deleted=[['interfaces', 'ethernet', 'eth2', 'mtu']])
+        self.assertEqual(commit_runs(diff, ownership, is_tag),
+                         [('service_ntp', None), ('interfaces_ethernet', 'eth0'),
+                          ('qos', None)])
+
+        # deleted nodes are left out, as are paths cut at a tag node
+        diff = Diff(['qos', 'policy'], ['interfaces', 'ethernet', 'eth0', 'mtu'],
+                    deleted=[['qos', 'policy']])
+        cut = ({'interfaces_ethernet_vif': [(['interfaces', 'ethernet'], False)],
+                'qos': [(['qos'], False)]}, {})
+        self.assertEqual(commit_runs(diff, cut, is_tag), [])
+
+    def test_option(self):
+        environ = {k: v for k, v in os.environ.items()
+                   if not k.startswith('VYOS_CONFIGD_')}
+        with patch.dict(os.environ, environ, clear=True), \
+             patch('vyos.configdep.os.path.exists', return_value=False):
+            self.assertFalse(configd_option('incremental'))
+            for value in ['0', 'no', 'False', '']:
+                os.environ['VYOS_CONFIGD_INCREMENTAL'] = value
+                self.assertFalse(configd_option('incremental'))
+            os.environ['VYOS_CONFIGD_INCREMENTAL'] = '1'
+            self.assertTrue(configd_option('incremental'))
+            self.assertFalse(configd_option('parallel'))
+
+            with patch('vyos.configdep.os.path.exists', return_value=True) as exists:
+                self.assertTrue(configd_option('parallel'))
+                exists.assert_called_with('/config/vyos-configd.parallel')
@@ -0,0 +1,119 @@
+#!/usr/bin/env python3
+#
+# Copyright (C) 2023 VyOS maintainers and contributors
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License version 2 or later as
+# published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+from io import BytesIO
+from unittest import TestCase
+
+from vyos import conntrack
+
+def flow(conn_id, src, dst, sport, dport, packets=1, octets=100, mark=0, zone=None,
+         proto=('tcp', 6)):
+    counters = f'<counters><packets>{packets}</packets><bytes>{octets}</bytes></counters>'
+    zone = f'<zone>{zone}</zone>' if zone is not None else ''
+    layer4 = f'<layer4 protonum="{proto[1]}" protoname="{proto[0]}">'
+    return (f'<flow><meta direction="original">'
+            f'<layer3 protonum="2" protoname="ipv4"><src>{src}</src><dst>{dst}</dst></layer3>'
+            f'{layer4}<sport>{sport}</sport><dport>{dport}</dport></layer4>{counters}</meta>'
+            f'<meta direction="reply">'
+            f'<layer3 protonum="2" protoname="ipv4"><src>{dst}</src><dst>{src}</dst></layer3>'
+            f'{layer4}<sport>{dport}</sport><dport>{sport}</dport></layer4>{counters}</meta>'
+            f'<meta direction="independent"><state>ESTABLISHED</state><timeout>120</timeout>'
+            f'<mark>{mark}</mark>{zone}<use>1</use><id>{conn_id}</id><assured/></meta></flow>\n')
+
+def table(flows):
+    return f'<?xml version="1.0" encoding="utf-8"?>\n<conntrack>\n{"".join(flows)}</conntrack>\n'
+
+class TestConntrack(TestCase):
+    def setUp(self):
+        self.flows = [flow(1, '192.0.2.1', '198.51.100.1', 1000, 22, 2, 200),
+                      flow(2, '192.0.2.2', '198.51.100.1', 1001, 53, 5, 50, mark=16,
+                           proto=('udp', 17)),
+                      flow(3, '192.0.2.130', '198.51.100.2', 1002, 443, 1, 900, zone=1)]
+
+    def read(self, flow_filter=None):
+        flow_filter = flow_filter or conntrack.FlowFilter()
+        infos = (conntrack.flow_info(f) for f in
+                 conntrack.parse_flows(BytesIO(table(self.flows).encode()), 16))
+        return [info['id'] for info in infos if flow_filter(info)]
+
+    def test_parse(self):
+        self.assertEqual(self.read(), ['1', '2', '3'])
+        self.assertEqual(list(conntrack.parse_flows(BytesIO(b''))), [])
+
+        element = next(conntrack.parse_flows(BytesIO(table(self.flows).encode())))
+        info = conntrack.flow_info(element)
+        self.assertEqual((info['orig_src'], info['orig_sport'], info['reply_src'],
+                          info['protocol'], info['state']),
+                         ('192.0.2.1', '1000', '198.51.100.1', 'tcp', 'ESTABLISHED'))
+        self.assertEqual((info['packets'], info['bytes']), (4, 400))
+
+        # same structure as returned by xmltodict before
+        tmp = conntrack.flow_dict(element)
+        self.assertEqual(len(tmp['meta']), 3)
+        self.assertEqual(tmp['meta'][0]['layer3'], {'protonum': '2', 'protoname': 'ipv4',
+                                                    'src': '192.0.2.1', 'dst': '198.51.100.1'})
+        self.assertEqual(tmp['meta'][2]['id'], '1')
+        self.assertIsNone(tmp['meta'][2]['assured'])
+
+    def test_filter(self):
+        self.assertEqual(self.read(conntrack.FlowFilter(source='192.0.2.0/25')), ['1', '2'])
+        self.assertEqual(self.read(conntrack.FlowFilter(destination='198.51.100.2')), ['3'])
+        self.assertEqual(self.read(conntrack.FlowFilter(protocol='17')), ['2'])
+        self.assertEqual(self.read(conntrack.FlowFilter(protocol='TCP', zone=1)), ['3'])
+        self.assertEqual(self.read(conntrack.FlowFilter(mark='0x10/0xf0')), ['2'])
+
+        tmp = conntrack.FlowFilter(source='192.0.2.1', destination='198.51.100.0/24',
+                                   protocol='tcp', mark=16)
+        self.assertEqual(tmp.args(), ['--orig-src', '192.0.2.1', '--proto', 'tcp',
+                                      '--mark', '16/4294967295'])
+        with self.assertRaises(ValueError):
+            conntrack.FlowFilter(source='192.0.2.300')
+
+    def test_top(self):
+        items = ((conntrack.flow_info(f), None) for f in
+                 conntrack.parse_flows(BytesIO(table(self.flows).encode())))
+        self.assertEqual([info['id'] for info, _ in conntrack.top(items, 2, 'bytes')],
+                         ['3', '1'])
+
+    def test_nat_aggregate(self):
+        def snat(inside, sport, public, port):
+            return {'orig_src': inside, 'orig_sport': sport, 'orig_dst': '198.51.100.1',
+                    'orig_dport': '443', 'reply_src': '198.51.100.1', 'reply_sport': '443',
+                    'reply_dst': public, 'reply_dport': port}
+
+        infos = [snat('100.64.0.1', '1000', '203.0.113.1', '1024'),
+                 snat('100.64.0.1', '1001', '203.0.113.1', '1100'),
+                 snat('100.64.0.2', '1000', '203.0.113.1', '2048'),
+                 snat('100.64.0.3', '1000', '203.0.113.2', '1025'),
+                 snat('100.64.0.3', '', '203.0.113.2', '')]
+        self.assertEqual(conntrack.nat_aggregate(infos, 'source', 'inside'),
+                         [('100.64.0.1', 2), ('100.64.0.3', 2), ('100.64.0.2', 1)])
+        self.assertEqual(conntrack.nat_aggregate(iter(infos), 'source', 'public'),
+                         [('203.0.113.1', 3), ('203.0.113.2', 2)])
+        self.assertEqual(conntrack.nat_aggregate(infos, 'source', 'block'),
+                         [(('203.0.113.1', 1024), 2), (('203.0.113.1', 2048), 1),
+                          (('203.0.113.2', 1024), 1)])
+        self.assertEqual(conntrack.nat_aggregate(infos, 'source', 'block', 64)[0],
+                         (('203.0.113.1', 1024), 1))
+
+        # destination NAT: the reply comes from the internal server
+        self.assertEqual(conntrack.nat_aggregate(infos, 'destination', 'inside'),
+                         [('198.51.100.1', 5)])
+
+    def test_format_table(self):
+        self.assertEqual(list(conntrack.format_table(['Id', 'State'], [4, 5],
+                                                     [[1, 'NEW'], [22, 'ESTABLISHED']])),
+                         ['Id    State', '----  -----', '1     NEW', '22    ESTABLISHED'])
@@ -14,8 +14,21 @@
 # You should have received a copy of the GNU General Public License
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
+import io
 import os
+import sys
+import time
+from types import SimpleNamespace
+from concurrent.futures import ThreadPoolExecutor
+from vyos.configdep import commit_levels
+from vyos.configdep import dependent_levels
+from vyos.configdep import generate_apply
+from vyos.configdep import run_captured
+from vyos.configdep import run_concurrently
+from vyos.configdict import get_tagnode_value
 from vyos.configdep import check_dependency_graph
+from vyos.configdep import read_dependency_dict
+from vyos.configdep import reverse_graph_from_dependency_dict
 
 _here = os.path.dirname(__file__)
 ddir = os.path.join(_here, '../../data/config-mode-dependencies')
@@ -29,3 +42,108 @@ class TestDependencyGraph(TestCase):
     def test_acyclic(self):
         res = check_dependency_graph(dependency_dir=ddir)
         self.assertTrue(res)
+
+    def test_reverse_graph(self):
+        d = read_dependency_dict(dependency_dir=ddir)
+        r = reverse_graph_from_dependency_dict(d)
+        self.assertIn('firewall', r['policy_route'])
+        self.assertIn('qos', r['interfaces_ethernet'])
+        self.assertIn('pki', r['interfaces_ethernet'])
+        self.assertNotIn('firewall', r)
+
+    def test_levels(self):
+        runs = [('a', None), ('b', None), ('c', None), ('d', None),
+                ('a', None), ('e', None)]
+        levels = dependent_levels(runs, dependency_dict={'b': {'x': ['d']}},
+                                  priorities={'a': 1, 'b': 1, 'c': 2, 'd': 1})
+        # independent scripts of equal priority share a level, a different
+        # or unknown priority, a dependency or the same script come later
+        self.assertEqual(levels, [[0, 1], [2], [3, 4], [5]])
+        self.assertEqual(dependent_levels([]), [])
+
+        # the same script never runs concurrently, also for different tagnodes
+        runs = [('interfaces-ethernet', 'eth0'), ('interfaces-ethernet', 'eth1'),
+                ('interfaces_bonding', 'bond0'), ('interfaces_bridge', 'br0')]
+        levels = dependent_levels(runs, priorities={'interfaces_ethernet': 318,
+                                                    'interfaces_bonding': 315,
+                                                    'interfaces_bridge': 315})
+        self.assertEqual(levels, [[0], [1], [2, 3]])
+
+    def test_commit_levels(self):
+        runs = [('ntp', None), ('snmp', None), ('lldp', None), ('pki', None),
+                ('interfaces-ethernet', 'eth0'), ('interfaces-ethernet', 'eth1'),
+                ('qos', None), ('unknown', None)]
+        levels = commit_levels(runs, dependency_dict={'pki': {'ethernet': ['interfaces-ethernet']},
+                                                      'qos': {'ethernet': ['interfaces-ethernet']}},
+                               priorities={'ntp': 900, 'snmp': 900, 'lldp': 985, 'pki': 300,
+                                           'interfaces_ethernet': 300, 'qos': 300})
+        # independent scripts of equal priority share a level, scripts which
+        # may call the same dependents or the same script do not
+        self.assertEqual(levels, [[('pki', None)],
+                                  [('interfaces_ethernet', 'eth0')],
+                                  [('interfaces_ethernet', 'eth1')],
+                                  [('qos', None)],
+                                  [('ntp', None), ('snmp', None)],
+                                  [('lldp', None)]])
+
+    def test_run_captured(self):
+        def task(name, fail=False):
+            def func():
+                print(name)
+                if fail:
+                    raise ValueError(name)
+                return name
+            return func
+
+        stdout = sys.stdout
+        with ThreadPoolExecutor(2) as executor:
+            results = run_captured(executor, [task('a'), task('b', fail=True)])
+        self.assertIs(sys.stdout, stdout)
+        self.assertEqual([output for _, output in results], ['a\n', 'b\n'])
+        self.assertEqual(results[0][0].result(), 'a')
+        self.assertIsInstance(results[1][0].exception(), ValueError)
+
+    def test_run_concurrently(self):
+        events = []
+        def task(name, delay=0, fail=False):
+            def func():
+                events.append(f'{name}-start')
+                time.sleep(delay)
+                print(name)
+                events.append(f'{name}-end')
+                if fail:
+                    raise ValueError(name)
+            return func
+
+        stdout = sys.stdout
+        sys.stdout = output = io.StringIO()
+        try:
+            with ThreadPoolExecutor(4) as executor:
+                errors = run_concurrently(executor, [('a', task('a', 0.2)),
+                                                     ('b', task('b', fail=True)),
+                                                     ('c', task('c'))])
+        finally:
+            sys.stdout = stdout
+
+        self.assertLess(events.index('b-end'), events.index('a-end'))
+        # output is emitted in submission order
+        self.assertEqual(output.getvalue(), 'a\nb\nc\n')
+        self.assertEqual([(name, str(e)) for name, e in errors], [('b', 'b')])
+
+    def test_run_concurrently_tagnode(self):
+        seen = {}
+        def module(name):
+            def apply(c):
+                # both scripts run concurrently
+                time.sleep(0.1)
+                seen[name] = get_tagnode_value()
+            return SimpleNamespace(__name__=name, generate=lambda c: None,
+                                   apply=apply)
+
+        with ThreadPoolExecutor(2) as executor:
+            run_concurrently(executor, [
+                ('eth', lambda: generate_apply(module('eth'), {}, 'eth0')),
+                ('wg', lambda: generate_apply(module('wg'), {}, 'wg1'))])
+
+        self.assertEqual(seen, {'eth': 'eth0', 'wg': 'wg1'})
+        self.assertNotIn('VYOS_TAGNODE_VALUE', os.environ)
@@ -0,0 +1,129 @@
+#!/usr/bin/env python3
+#
+# Copyright (C) 2023 VyOS maintainers and contributors
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License version 2 or later as
+# published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import os
+
+from tempfile import TemporaryDirectory
+from unittest import TestCase
+
+from vyos import dhcp_leases
+
+header = """# The format of this file is documented in the dhcpd.leases(5) manual page.
+# This lease file was written by isc-dhcp-4.4.3-P1
+
+# authoring-byte-order entry is generated, DO NOT DELETE
+authoring-byte-order little-endian;
+
+"""
+
+def lease(address, state='active', mac='00:53:00:00:00:01', hostname='client'):
+    return f"""lease {address} {{
+  starts 4 2023/08/03 10:00:00;
+  ends 4 2023/08/03 11:00:00;
+  cltt 4 2023/08/03 10:00:00;
+  binding state {state};
+  next binding state free;
+  rewind binding state free;
+  hardware ethernet {mac};
+  uid "\\001\\000S\\000\\000\\000\\001";
+  set shared-networkname = "LAN";
+  client-hostname "{hostname}";
+}}
+"""
+
+lease6 = """server-duid "\\000\\001\\000\\001,\\223\\240\\022\\000PV\\275\\006\\264";
+
+ia-na "\\001\\000\\000\\000\\000\\001\\000\\001" {
+  cltt 4 2023/08/03 10:00:00;
+  iaaddr 2001:db8::10 {
+    binding state active;
+    preferred-life 375;
+    max-life 600;
+    ends epoch 1691060400; # Thu Aug 03 11:00:00 2023
+    set shared-networkname = "LAN6";
+  }
+}
+
+ia-pd "\\002\\000\\000\\000\\000\\001\\000\\001" {
+  cltt 4 2023/08/03 10:00:00;
+  iaprefix 2001:db8:1::/56 {
+    binding state expired;
+    preferred-life 375;
+    max-life 600;
+    ends 4 2023/08/03 10:30:00;
+    set shared-networkname = "LAN6";
+  }
+}
+"""
+
+class TestDHCPLeases(TestCase):
+    def setUp(self):
+        self.tmp = TemporaryDirectory()
+        self.path = os.path.join(self.tmp.name, 'dhcpd.leases')
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def write(self, data, mode='w'):
+        with open(self.path, mode) as f:
+            f.write(data)
+
+    def test_parse(self):
+        leases, parsed = dhcp_leases.parse((header + lease('192.0.2.10')).encode())
+        self.assertEqual(parsed, len(header + lease('192.0.2.10')))
+        self.assertEqual(leases, [{'ip': '192.0.2.10', 'state': 'active', 'pool': 'LAN',
+                                   'start': 1691056800.0, 'end': 1691060400.0,
+                                   'mac': '00:53:00:00:00:01', 'hostname': 'client'}])
+
+        leases, _ = dhcp_leases.parse(lease6.encode())
+        self.assertEqual(leases, [
+            {'ip': '2001:db8::10', 'state': 'active', 'pool': 'LAN6', 'end': 1691060400.0,
+             'last_communication': 1691056800.0, 'iaid_duid': '0100000000010001',
+             'type': 'na'},
+            {'ip': '2001:db8:1::/56', 'state': 'expired', 'pool': 'LAN6',
+             'end': 1691058600.0, 'last_communication': 1691056800.0,
+             'iaid_duid': '0200000000010001', 'type': 'pd'}])
+
+        # a block still being written is left for the next read
+        data = (lease('192.0.2.10') + lease('192.0.2.11')[:40]).encode()
+        leases, parsed = dhcp_leases.parse(data)
+        self.assertEqual(len(leases), 1)
+        self.assertEqual(parsed, len(lease('192.0.2.10')))
+
+    def test_incremental(self):
+        self.write(header + lease('192.0.2.10') + lease('192.0.2.11'))
+        leases = dhcp_leases.LeaseFile(self.path)
+        self.assertEqual(sorted(leases.leases()), ['192.0.2.10', '192.0.2.11'])
+
+        # the last entry of an address wins
+        partial = lease('192.0.2.12')
+        self.write(lease('192.0.2.10', 'free') + partial[:50], 'a')
+        tmp = leases.leases()
+        self.assertEqual(tmp['192.0.2.10']['state'], 'free')
+        self.assertNotIn('192.0.2.12', tmp)
+
+        self.write(partial[50:], 'a')
+        self.assertEqual(leases.leases()['192.0.2.12']['hostname'], 'client')
+
+        # dhcpd replaced the file with the current leases
+        new = self.path + '.new'
+        with open(new, 'w') as f:
+            f.write(header + lease('192.0.2.20'))
+        os.replace(new, self.path)
+        self.assertEqual(list(leases.leases()), ['192.0.2.20'])
+
+        os.unlink(self.path)
+        self.assertEqual(leases.leases(), {})
@@ -0,0 +1,47 @@
+#!/usr/bin/env python3
+#
+# Copyright (C) 2023 VyOS maintainers and contributors
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License version 2 or later as
+# published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+from unittest import TestCase
+
+import vyos.ethtool
+from vyos.ethtool import Ethtool
+
+class TestVyOSEthtool(TestCase):
+    def setUp(self):
+        vyos.ethtool.invalidate()
+
+    def test_loopback(self):
+        ethtool = Ethtool('lo')
+        # loopback has no driver, link settings, ring buffers or pause frames
+        self.assertIsNone(ethtool.get_driver_name())
+        self.assertFalse(ethtool.check_flow_control())
+        self.assertIsNone(ethtool.get_ring_buffer_max('rx'))
+        self.assertFalse(ethtool.check_speed_duplex('1000', 'full'))
+        # but the kernel reports its feature set
+        enabled, fixed = ethtool.get_scatter_gather()
+        self.assertTrue(enabled)
+        self.assertTrue(fixed)
+
+    def test_cache(self):
+        Ethtool('lo')
+        self.assertIn('lo', vyos.ethtool._cache)
+        vyos.ethtool.invalidate('lo')
+        self.assertNotIn('lo', vyos.ethtool._cache)
+
+    def test_missing_interface(self):
+        ethtool = Ethtool('vyos-missing0')
+        self.assertIsNone(ethtool.get_driver_name())
+        self.assertEqual(ethtool.get_generic_receive_offload(), (False, True))
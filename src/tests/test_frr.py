@@ -0,0 +1,300 @@
+#!/usr/bin/env python3
+#
+# Copyright (C) 2023 VyOS maintainers and contributors
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License version 2 or later as
+# published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import random
+import re
+
+from unittest import TestCase
+from unittest.mock import patch
+
+from vyos import frr
+
+class ListConfig:
+    """ Previous list based implementation of FRRConfig, as reference """
+    def __init__(self, config):
+        self.config = config.split('\n')
+
+    def _find_first_block(self, start_pattern, stop_pattern, start_at):
+        _start = None
+        for i, element in enumerate(self.config[start_at:], start=start_at):
+            if not _start:
+                if re.match(start_pattern, element):
+                    _start = i
+                continue
+            if re.match(stop_pattern, element):
+                return (_start, i)
+        return None
+
+    def modify_section(self, start_pattern, replacement='!', stop_pattern=r'\S+',
+                       remove_stop_mark=False, count=0):
+        if isinstance(replacement, str):
+            replacement = replacement.split('\n')
+        _count = 0
+        _next_start = 0
+        while not count or _count < count:
+            _w = self._find_first_block(start_pattern + '$', stop_pattern, _next_start)
+            if not _w:
+                break
+            start_element, end_element = _w
+            del self.config[start_element:end_element + 1 if remove_stop_mark else end_element]
+            self.config[start_element:start_element] = replacement
+            _count += 1
+            _next_start = start_element + len(replacement)
+        return _count
+
+    def add_before(self, before_pattern, addition):
+        for i, element in enumerate(self.config):
+            if re.match(before_pattern + '$', element):
+                self.config[i:i] = addition.split('\n')
+                return True
+        return False
+
+    def __str__(self):
+        return '\n'.join(self.config)
+
+def bgp(asn, neighbors, vrf=''):
+    vrf = f' vrf {vrf}' if vrf else ''
+    lines = [f'router bgp {asn}{vrf}', ' no bgp ebgp-requires-policy']
+    lines += [f' neighbor 192.0.2.{n} remote-as {65000 + n}' for n in range(neighbors)]
+    lines += [' !', ' address-family ipv4 unicast', '  redistribute connected',
+              ' exit-address-family', 'exit', '!']
+    return lines
+
+def running_config(rng, neighbors=20, prefix_lists=30, route_maps=10):
+    lines = ['frr version 9.0.1', 'frr defaults traditional', 'hostname vyos',
+             'log syslog', 'service integrated-vtysh-config', '!']
+    lines += [f'ip route 10.{i}.0.0/16 192.0.2.254' for i in range(rng.randint(0, 5))]
+    lines += ['!', 'ip protocol rip route-map RIP-IN', '!', 'vrf red', ' vni 10',
+              ' ip route 0.0.0.0/0 192.0.2.1', 'exit-vrf', '!']
+    for ifname in ['eth0', 'eth1', 'eth2']:
+        lines += [f'interface {ifname}', ' ip ospf area 0', 'exit', '!']
+    lines += bgp(65000, neighbors) + bgp(65000, 3, 'red')
+    lines += ['router ospf', ' ospf router-id 192.0.2.1', 'exit', '!']
+    lines += [f'bgp community-list standard C{i} seq 5 permit 65000:{i}'
+              for i in range(rng.randint(0, 5))]
+    lines += [f'ip prefix-list PL{i} seq {5 * j} permit 10.{i}.{j}.0/24'
+              for i in range(prefix_lists) for j in range(1, 3)]
+    lines += ['!']
+    for i in range(route_maps):
+        lines += [f'route-map RM{i} permit 10', f' match ip address prefix-list PL{i}',
+                  ' set local-preference 200', 'exit', '!']
+    lines += ['line vty', '!', 'end', '']
+    return '\n'.join(lines)
+
+# section edits done by conf_mode scripts
+operations = [
+    (r'^router bgp \d+', '^exit', True),
+    (r'^router bgp \d+ vrf red', '^exit', True),
+    ('^interface eth1', '^exit', True),
+    ('interface \\S+', '^exit', True),
+    ('^router ospf', '^exit', True),
+    ('^vrf red', '^exit-vrf', True),
+    (r'^ip prefix-list .*', r'\S+', False),
+    (r'^route-map .*', '^exit', True),
+    (r'^bgp community-list .*', r'\S+', False),
+    (r'^ip route .*', r'\S+', False),
+    ('^ip protocol rip route-map [-a-zA-Z0-9.]+', '(\\s|!)', False),
+    (r'ip protocol \w+ route-map [-a-zA-Z0-9.]+', '(\\s|!)', False),
+    ('^router isis VyOS', '^exit', True),
+    ('^router ospf6?', '^exit', True),
+]
+
+class TestFRRConfig(TestCase):
+    def apply(self, config, operation):
+        pattern, stop, remove_stop = operation[:3]
+        if pattern == 'add_before':
+            return config.add_before(frr.default_add_before, stop)
+        return config.modify_section(pattern, stop_pattern=stop, remove_stop_mark=remove_stop,
+                                     **operation[3])
+
+    def test_identical(self):
+        rng = random.Random(4711)
+        for _ in range(50):
+            text = running_config(rng, rng.randint(0, 40), rng.randint(0, 60),
+                                  rng.randint(0, 10))
+            new = frr.FRRConfig(text)
+            old = ListConfig(text)
+            self.assertEqual(str(new), str(old))
+            for _ in range(8):
+                if rng.random() < 0.3:
+                    addition = '\n'.join(bgp(rng.randint(1, 3), rng.randint(0, 3)) +
+                                         ['ip prefix-list NEW seq 5 permit 10.0.0.0/8'])
+                    operation = ('add_before', addition, None)
+                else:
+                    kwargs = {}
+                    if rng.random() < 0.3:
+                        kwargs['count'] = rng.randint(1, 3)
+                    if rng.random() < 0.3:
+                        kwargs['replacement'] = rng.choice(['', 'ip route 0.0.0.0/0 192.0.2.1',
+                                                            'router ospf\nexit\n!'])
+                    operation = rng.choice(operations) + (kwargs,)
+                self.assertEqual(self.apply(new, operation), self.apply(old, operation),
+                                 operation)
+                self.assertEqual(str(new), str(old), operation)
+
+    def test_modify_section(self):
+        config = frr.FRRConfig(running_config(random.Random(1)))
+        self.assertEqual(config.modify_section(r'^router bgp \d+', stop_pattern='^exit',
+                                               remove_stop_mark=True), 1)
+        self.assertNotIn('router bgp 65000\n', str(config))
+        self.assertIn('router bgp 65000 vrf red', str(config))
+        self.assertEqual(config.modify_section('^router rip', stop_pattern='^exit'), 0)
+
+        self.assertTrue(config.add_before(frr.default_add_before, 'router bgp 65001\nexit'))
+        self.assertIn('router bgp 65001\nexit\nip prefix-list PL0 seq 5', str(config))
+        self.assertEqual(config.modify_section(r'^router bgp \d+', stop_pattern='^exit',
+                                               remove_stop_mark=True), 1)
+
+class TestCommit(TestCase):
+    def setUp(self):
+        self.running = running_config(random.Random(1))
+        self.reloads = []
+        self.saves = 0
+
+        def reload(config, daemon=None):
+            self.reloads.append(daemon)
+            self.running = config
+
+        def save():
+            self.saves += 1
+
+        patches = [patch('vyos.frr.get_configuration', lambda daemon: self.running),
+                   patch('vyos.frr.reload_configuration', reload),
+                   patch('vyos.frr.save_configuration', save)]
+        for p in patches:
+            p.start()
+            self.addCleanup(p.stop)
+
+    def test_unchanged(self):
+        config = frr.FRRConfig()
+        config.load_configuration('bgpd')
+        # a dependent script rendering the same configuration
+        config.modify_section('^router rip', stop_pattern='^exit')
+        config.commit_configuration('bgpd')
+        self.assertEqual((self.reloads, self.saves), ([], 0))
+
+        config.modify_section(r'^router bgp \d+', stop_pattern='^exit',
+                              remove_stop_mark=True)
+        config.commit_configuration('bgpd')
+        self.assertEqual((self.reloads, self.saves), (['bgpd'], 1))
+        self.assertNotIn('router bgp 65000\n', self.running)
+
+class TestTransaction(TestCase):
+    def setUp(self):
+        self.running = {'bgpd': running_config(random.Random(1)),
+                        'zebra': 'frr version 9.0.1\n!\nline vty\n!\nend\n'}
+        self.reloads = []
+        self.saves = 0
+
+        def reload(config, daemon=None):
+            self.reloads.append(daemon)
+            if 'invalid' in config:
+                raise frr.CommitError('invalid')
+            self.running[daemon] = config
+
+        def mark(config):
+            if 'invalid' in config:
+                raise frr.ConfigurationNotValid('invalid')
+            return config
+
+        def save():
+            self.saves += 1
+
+        patches = [patch('vyos.frr.get_configuration', lambda daemon: self.running[daemon]),
+                   patch('vyos.frr.reload_configuration', reload),
+                   patch('vyos.frr.mark_configuration', mark),
+                   patch('vyos.frr.save_configuration', save)]
+        for p in patches:
+            p.start()
+            self.addCleanup(p.stop)
+        self.addCleanup(frr.end_transaction)
+
+    def run_script(self, name, daemon, section, addition):
+        # FRRConfig usage of conf_mode scripts, owners are the script files
+        body = (f'config = frr.FRRConfig()\n'
+                f'config.load_configuration({daemon!r})\n'
+                f'config.modify_section({section!r}, stop_pattern="^exit", '
+                f'remove_stop_mark=True)\n'
+                f'config.add_before(frr.default_add_before, {addition!r})\n'
+                f'config.commit_configuration({daemon!r})\n')
+        exec(compile(body, f'/usr/libexec/vyos/conf_mode/{name}.py', 'exec'), {'frr': frr})
+
+    def test_coalesced(self):
+        frr.begin_transaction()
+        self.run_script('protocols_bgp', 'bgpd', r'^router bgp \d+',
+                        'router bgp 65001\nexit')
+        self.run_script('policy', 'bgpd', r'^route-map .*',
+                        'route-map RM permit 10\nexit')
+        self.run_script('vrf', 'zebra', '^vrf blue', 'vrf blue\nexit-vrf')
+        self.assertEqual(self.reloads, [])
+
+        # later scripts continue from the staged configuration
+        config = frr.FRRConfig()
+        config.load_configuration('bgpd')
+        self.assertIn('router bgp 65001\nexit\nroute-map RM permit 10', str(config))
+
+        # changes done outside of FRRConfig in the meantime are kept
+        self.running['bgpd'] = self.running['bgpd'].replace('hostname vyos', 'hostname r1')
+
+        self.assertEqual(frr.end_transaction(), [])
+        self.assertEqual(self.reloads, ['bgpd', 'zebra'])
+        self.assertEqual(self.saves, 1)
+        self.assertIn('hostname r1', self.running['bgpd'])
+        self.assertIn('router bgp 65001\nexit\nroute-map RM permit 10', self.running['bgpd'])
+        self.assertNotIn('router bgp 65000\n', self.running['bgpd'])
+        self.assertIn('vrf blue', self.running['zebra'])
+
+        # without a transaction every commit reloads
+        self.run_script('vrf', 'zebra', '^vrf blue', 'vrf green\nexit-vrf')
+        self.assertEqual(self.reloads, ['bgpd', 'zebra', 'zebra'])
+
+    def test_failure(self):
+        frr.begin_transaction()
+        self.run_script('protocols_bgp', 'bgpd', r'^router bgp \d+',
+                        'router bgp 65001\nexit')
+        self.run_script('policy', 'bgpd', r'^route-map .*', 'invalid')
+        self.run_script('protocols_rpki', 'bgpd', '^rpki', 'rpki\nexit')
+        self.run_script('vrf', 'zebra', '^vrf blue', 'vrf blue\nexit-vrf')
+
+        errors = frr.end_transaction()
+        self.assertEqual([owner for owner, _ in errors], ['policy', 'protocols_rpki'])
+        self.assertIsInstance(errors[0][1], frr.ConfigurationNotValid)
+        # the daemon runs the changes of the scripts preceding the failing
+        # one, other daemons all of them
+        self.assertIn('router bgp 65001', self.running['bgpd'])
+        self.assertNotIn('invalid', self.running['bgpd'])
+        self.assertNotIn('rpki', self.running['bgpd'])
+        self.assertIn('vrf blue', self.running['zebra'])
+        self.assertEqual(self.saves, 1)
+
+    def test_discard(self):
+        original = self.running['bgpd']
+        frr.begin_transaction()
+        self.run_script('policy', 'bgpd', r'^route-map .*', 'invalid')
+        # the script failed after staging its changes
+        frr.discard_staged('policy')
+        self.assertEqual(frr.end_transaction(), [])
+        self.assertEqual((self.reloads, self.saves), ([], 0))
+        self.assertEqual(self.running['bgpd'], original)
+
+        # nothing changed, nothing to reload
+        frr.begin_transaction()
+        config = frr.FRRConfig()
+        config.load_configuration('bgpd')
+        self.assertEqual(config.modify_section('^router rip', stop_pattern='^exit'), 0)
+        config.commit_configuration('bgpd')
+        self.assertEqual(frr.end_transaction(), [])
+        self.assertEqual((self.reloads, self.saves), ([], 0))
@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+#
+# Copyright (C) 2023 VyOS maintainers and contributors
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License version 2 or later as
+# published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import json
+
+from unittest import TestCase
+from unittest.mock import patch
+
+from vyos import frr_routes
+
+def route(prefix, nexthop, interface='eth0', protocol='bgp'):
+    return {'prefix': prefix, 'protocol': protocol, 'selected': True, 'distance': 20,
+            'metric': 0, 'nexthops': [{'ip': nexthop, 'afi': 'ipv4',
+                                       'interfaceName': interface, 'active': True}]}
+
+zebra = {f'10.{i // 256}.{i % 256}.0/24': [route(f'10.{i // 256}.{i % 256}.0/24',
+                                                  f'192.0.2.{i % 4}')]
+         for i in range(600)}
+zebra['0.0.0.0/0'] = [route('0.0.0.0/0', '198.51.100.1', 'eth1', 'static'),
+                      route('0.0.0.0/0', '198.51.100.2', 'eth2', 'static')]
+
+bgp = {'vrfId': 0, 'vrfName': 'default', 'tableVersion': 12345678,
+       'routerId': '192.0.2.254', 'defaultLocPrf': 100, 'localAS': 65000,
+       'routes': {'10.0.0.0/24': [{'valid': True, 'bestpath': True, 'path': '65001',
+                                   'nexthops': [{'ip': '192.0.2.1', 'afi': 'ipv4'}]},
+                                  {'valid': True, 'path': '65002 65001',
+                                   'nexthops': [{'ip': '192.0.2.2', 'afi': 'ipv4'}]}],
+                  '10.0.1.0/24': [{'valid': True, 'bestpath': True, 'path': '',
+                                   'nexthops': [{'ip': '0.0.0.0', 'afi': 'ipv4'}]}]},
+       'totalRoutes': 2, 'totalPaths': 3}
+
+def chunks(text, size):
+    return (text[i:i + size] for i in range(0, len(text), size))
+
+class TestFRRRoutes(TestCase):
+    def test_iter_items(self):
+        text = json.dumps(zebra, indent=2)
+        for size in [1, 7, 4096, len(text)]:
+            self.assertEqual(dict(frr_routes.iter_items(chunks(text, size))), zebra)
+
+        text = json.dumps(bgp)
+        for size in [1, 3, 100]:
+            self.assertEqual(dict(frr_routes.iter_items(chunks(text, size), ['routes'])),
+                             bgp['routes'])
+            # numbers split between chunks
+            self.assertEqual(dict(frr_routes.iter_items(chunks(text, size))), bgp)
+
+        self.assertEqual(list(frr_routes.iter_items(['', ' \n'])), [])
+        self.assertEqual(list(frr_routes.iter_items(['{', '}'], ['routes'])), [])
+        with self.assertRaises(KeyError):
+            list(frr_routes.iter_items(['{"prefix": "10.0.0.0/24", "paths": []}'],
+                                       ['routes']))
+        with self.assertRaises(ValueError):
+            list(frr_routes.iter_items(['{"10.0.0.0/24": [] "10.0.1.0/24": []}']))
+        with self.assertRaises(ValueError):
+            list(frr_routes.iter_items(['{"10.0.0.0/24": [{"prefix": "1']))
+
+    def test_routes(self):
+        with patch('vyos.frr_vty.stream', return_value=chunks(json.dumps(zebra), 1000)):
+            routes = list(frr_routes.routes('show ip route json'))
+        self.assertEqual(len(routes), 602)
+        self.assertEqual(routes[0]['prefix'], '10.0.0.0/24')
+
+        with patch('vyos.frr_vty.stream', return_value=chunks(json.dumps(bgp), 10)):
+            paths = list(frr_routes.routes('show bgp ipv4 unicast json', ['routes'],
+                                           save_key_to='route_key'))
+        self.assertEqual([(p['route_key'], p['path']) for p in paths],
+                         [('10.0.0.0/24', '65001'), ('10.0.0.0/24', '65002 65001'),
+                          ('10.0.1.0/24', '')])
+
+    def test_nexthop_filter(self):
+        routes = [r for rs in zebra.values() for r in rs]
+        self.assertEqual(len(list(filter(frr_routes.NexthopFilter('192.0.2.1'), routes))),
+                         150)
+        self.assertEqual(len(list(filter(frr_routes.NexthopFilter('192.0.2.0/30'), routes))),
+                         600)
+        self.assertEqual([r['nexthops'][0]['ip'] for r in
+                          filter(frr_routes.NexthopFilter('eth2'), routes)], ['198.51.100.2'])
+        self.assertEqual(list(filter(frr_routes.NexthopFilter('2001:db8::1'), routes)), [])
+        with self.assertRaises(ValueError):
+            frr_routes.NexthopFilter('192.0.2.300')
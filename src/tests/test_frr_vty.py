@@ -0,0 +1,174 @@
+#!/usr/bin/env python3
+#
+# Copyright (C) 2023 VyOS maintainers and contributors
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License version 2 or later as
+# published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import os
+import socket
+import threading
+
+from tempfile import TemporaryDirectory
+from unittest import TestCase
+from unittest.mock import patch
+
+from vyos import frr_vty
+
+class Daemon:
+    """ vty socket of an FRR daemon, answering with canned output """
+    def __init__(self, path, replies):
+        self.replies = replies
+        self.commands = []
+        self.connections = 0
+        self._open = []
+        self._server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self._server.bind(path)
+        self._server.listen()
+        threading.Thread(target=self._accept, daemon=True).start()
+
+    def _accept(self):
+        while True:
+            try:
+                conn, _ = self._server.accept()
+            except OSError:
+                return
+            self.connections += 1
+            self._open.append(conn)
+            threading.Thread(target=self._serve, args=(conn,), daemon=True).start()
+
+    def _serve(self, conn):
+        data = b''
+        with conn:
+            while True:
+                chunk = conn.recv(4096)
+                if not chunk:
+                    return
+                data += chunk
+                while b'\0' in data:
+                    command, data = data.split(b'\0', 1)
+                    command = command.decode()
+                    self.commands.append(command)
+                    output, status = self.replies.get(command, ('', 2))
+                    # large replies arrive in several chunks
+                    conn.sendall(output.encode() + b'\0\0\0' + bytes([status]))
+
+    def restart(self):
+        """ Close all sessions, as a restarted daemon would """
+        for conn in self._open:
+            try:
+                conn.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                # already closed by the client
+                pass
+        self._open = []
+
+    def close(self):
+        self.restart()
+        self._server.close()
+
+class TestVty(TestCase):
+    def setUp(self):
+        self.tmp = TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        patcher = patch('vyos.frr_vty.path_vty', self.tmp.name)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        self.bgpd = Daemon(os.path.join(self.tmp.name, 'bgpd.vty'), {
+            'enable': ('', 0),
+            'show bgp summary': ('IPv4 Unicast Summary:\n' + 'x' * 200000 + '\n', 0),
+            'show bgp summary json': ('{"ipv4Unicast": {"as": 65000}}', 0),
+            'show bgp neighbors 192.0.2.1 json': ('', 0),
+            'show bgp vrf red': ('% No such VRF\n', 1),
+        })
+        self.addCleanup(self.bgpd.close)
+        self.client = frr_vty.Client()
+        self.addCleanup(self.client.close)
+
+    def test_daemon_of(self):
+        self.assertEqual(frr_vty.daemon_of('show bgp summary json'), 'bgpd')
+        self.assertEqual(frr_vty.daemon_of('show ip bgp 192.0.2.0/24'), 'bgpd')
+        self.assertEqual(frr_vty.daemon_of('show ipv6 route vrf red summary'), 'zebra')
+        self.assertEqual(frr_vty.daemon_of('show interface eth0 json'), 'zebra')
+        self.assertEqual(frr_vty.daemon_of('show ip ospf neighbor'), 'ospfd')
+        self.assertIsNone(frr_vty.daemon_of('show running-config'))
+
+    def test_execute(self):
+        output = self.client.execute('show bgp summary', cache=False)
+        self.assertTrue(output.startswith('IPv4 Unicast Summary:\nxxx'))
+        self.assertEqual(len(output), 200022)
+        self.assertEqual(self.client.execute_json('show bgp summary'),
+                         {'ipv4Unicast': {'as': 65000}})
+        self.assertEqual(self.client.execute_json('show bgp neighbors 192.0.2.1'), {})
+
+        with self.assertRaises(frr_vty.VtyError) as e:
+            self.client.execute('show bgp vrf red')
+        self.assertEqual(e.exception.errno, 1)
+
+        # all commands used the same connection, entering enable mode once
+        self.assertEqual(self.bgpd.connections, 1)
+        self.assertEqual(self.bgpd.commands.count('enable'), 1)
+
+    def test_cache(self):
+        for _ in range(3):
+            self.client.execute('show bgp summary json')
+        self.assertEqual(self.bgpd.commands.count('show bgp summary json'), 1)
+
+        self.client.execute('show bgp summary json', cache=False)
+        self.assertEqual(self.bgpd.commands.count('show bgp summary json'), 2)
+
+        with patch('vyos.frr_vty.cache_ttl', 0):
+            self.client.clear_cache()
+            self.client.execute('show bgp summary json')
+            self.client.execute('show bgp summary json')
+        self.assertEqual(self.bgpd.commands.count('show bgp summary json'), 4)
+
+    def test_reconnect(self):
+        self.client.execute('show bgp summary json', cache=False)
+        # the session of the pooled connection is gone
+        self.bgpd.restart()
+        self.assertEqual(self.client.execute_json('show bgp summary', cache=False),
+                         {'ipv4Unicast': {'as': 65000}})
+        self.assertEqual(self.bgpd.connections, 2)
+
+    def test_reconnect_failure(self):
+        self.client.execute('show bgp summary json', cache=False)
+        self.bgpd.restart()
+        closed = []
+        close = frr_vty.Connection.close
+        execute = frr_vty.Connection.execute
+        def track(connection):
+            closed.append(connection)
+            close(connection)
+        def reset(connection, command):
+            if command == 'enable':
+                return execute(connection, command)
+            raise ConnectionResetError()
+        # the new session fails as well
+        with patch.object(frr_vty.Connection, 'close', track), \
+             patch.object(frr_vty.Connection, 'execute', reset):
+            with self.assertRaises(ConnectionResetError):
+                self.client._execute('bgpd', 'show bgp summary json')
+        # neither the stale nor the new connection is left open
+        self.assertEqual(len(closed), 2)
+        self.assertEqual(self.client._idle.get('bgpd'), [])
+
+    def test_fallback(self):
+        # commands of daemons without socket, or not known to the daemon
+        with patch('vyos.frr_vty.vtysh', return_value='vtysh output') as vtysh:
+            self.assertEqual(self.client.execute('show ip route'), 'vtysh output')
+            self.assertEqual(self.client.execute('show bgp unknown'), 'vtysh output')
+            self.assertEqual(self.client.execute('show running-config'), 'vtysh output')
+        self.assertEqual([c.args for c in vtysh.call_args_list],
+                         [('show ip route', 'zebra'), ('show bgp unknown', 'bgpd'),
+                          ('show running-config', None)])
@@ -0,0 +1,93 @@
+#!/usr/bin/env python3
+#
+# Copyright (C) 2023 VyOS maintainers and contributors
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License version 2 or later as
+# published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import gzip
+import os
+
+from tempfile import TemporaryDirectory
+from unittest import TestCase
+from unittest.mock import patch
+
+from vyos import geoip
+
+database = """1.0.0.0,1.0.0.255,AU
+1.0.1.0,1.0.3.255,CN
+1.0.4.0,1.0.7.255,AU
+1.0.8.0,1.0.15.255,CN
+1.0.16.0,1.0.31.255,JP
+1.0.32.0,1.0.63.255,CN
+2001:200::,2001:200:ffff:ffff:ffff:ffff:ffff:ffff,JP
+2001:201::,2001:201::ffff,JP
+2001:250::,2001:250:ffff:ffff:ffff:ffff:ffff:ffff,CN
+"""
+
+class TestGeoIP(TestCase):
+    def setUp(self):
+        self.tmp = TemporaryDirectory()
+        self.database = os.path.join(self.tmp.name, 'dbip-country-lite.csv.gz')
+        with gzip.open(self.database, 'wt') as f:
+            f.write(database)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_index(self):
+        a = lambda address: geoip.address_to_int(address)[0]
+        with geoip.open_index(self.database) as index:
+            self.assertTrue(os.path.exists(geoip.index_path(self.database)))
+            self.assertEqual(sorted(index.codes()), ['au', 'cn', 'jp'])
+            self.assertEqual(index.ranges('CN'), [(a('1.0.1.0'), a('1.0.3.255')),
+                                                  (a('1.0.8.0'), a('1.0.15.255')),
+                                                  (a('1.0.32.0'), a('1.0.63.255'))])
+            # adjacent ranges are merged
+            self.assertEqual(index.ranges('jp', ipv6=True),
+                             [(a('2001:200::'), a('2001:201::ffff'))])
+            self.assertEqual(index.ranges('jp'), [(a('1.0.16.0'), a('1.0.31.255'))])
+            self.assertEqual(index.ranges('de'), [])
+
+    def test_rebuild(self):
+        with geoip.open_index(self.database) as index:
+            self.assertEqual(len(index.ranges('au')), 2)
+
+        with gzip.open(self.database, 'wt') as f:
+            f.write('1.0.0.0,1.0.7.255,AU\n')
+        os.utime(self.database, ns=(0, 1))
+        with geoip.open_index(self.database) as index:
+            self.assertEqual(index.ranges('au'), [(0x01000000, 0x010007ff)])
+            self.assertEqual(index.ranges('cn'), [])
+
+    def test_read_only(self):
+        cache = os.path.join(self.tmp.name, 'cache')
+        write = geoip._write
+        def read_only(path, chunks):
+            # the filesystem of the database is read-only
+            if path == geoip.index_path(self.database):
+                raise OSError(30, 'Read-only file system')
+            return write(path, chunks)
+
+        with patch('vyos.geoip.cache_dir', cache), \
+                patch('vyos.geoip._write', side_effect=read_only):
+            with geoip.open_index(self.database) as index:
+                self.assertEqual(len(index.ranges('au')), 2)
+            self.assertFalse(os.path.exists(geoip.index_path(self.database)))
+            self.assertTrue(os.path.exists(geoip.cache_path(self.database)))
+
+        # no writable location at all
+        with patch('vyos.geoip.cache_dir', os.path.join(self.tmp.name, 'other')), \
+                patch('vyos.geoip._write', side_effect=PermissionError):
+            with geoip.open_index(self.database) as index:
+                self.assertEqual(sorted(index.codes()), ['au', 'cn', 'jp'])
+                self.assertEqual(len(index.ranges('cn')), 3)
@@ -0,0 +1,122 @@
+#!/usr/bin/env python3
+#
+# Copyright (C) 2023 VyOS maintainers and contributors
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License version 2 or later as
+# published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+from unittest import TestCase
+
+from vyos import nftables
+
+def rule(rule_id, action='accept'):
+    return f'tcp dport {rule_id} counter {action} comment "ipv4-NAM-foo-{rule_id}"'
+
+def ruleset(rules, elements='{ 192.0.2.1 }', hook='policy accept;'):
+    lines = '\n'.join(f'        {r}' for r in rules)
+    return f"""
+flush chain raw vyos_global_rpfilter
+delete table ip vyos_filter
+table ip vyos_filter {{
+    chain VYOS_INPUT_filter {{
+        type filter hook input priority filter; {hook}
+        counter accept comment "INP-filter default-action accept"
+    }}
+    chain NAME_foo {{
+{lines}
+        counter drop comment "foo default-action drop"
+    }}
+    set A_bar {{
+        type ipv4_addr
+        flags interval
+        elements = {elements}
+    }}
+}}
+"""
+
+class TestNftables(TestCase):
+    def test_parse(self):
+        tmp = nftables.parse(ruleset([rule(10)]))
+        self.assertEqual(tmp['prologue'], ['flush chain raw vyos_global_rpfilter'])
+        table = tmp['tables'][('ip', 'vyos_filter')]
+        self.assertEqual(table['chain']['VYOS_INPUT_filter']['header'],
+                         ['type filter hook input priority filter; policy accept;'])
+        self.assertEqual(table['chain']['NAME_foo']['rules'],
+                         [rule(10), 'counter drop comment "foo default-action drop"'])
+        self.assertEqual(table['set']['A_bar']['elements'], '{ 192.0.2.1 }')
+
+    def test_structural(self):
+        base = ruleset([rule(10)])
+        self.assertEqual(nftables.diff(base, base), [])
+        self.assertIsNone(nftables.diff(base, ruleset([rule(10)], hook='policy drop;')))
+        self.assertIsNone(nftables.diff(base, base.replace('NAME_foo', 'NAME_baz')))
+        # unknown table statements always need a full reload
+        helper = base.replace('    set A_bar', '    ct helper ftp {\n        type "ftp" protocol tcp;\n    }\n    set A_bar')
+        self.assertIsNone(nftables.diff(base, helper))
+        self.assertIsNone(nftables.diff(helper, helper))
+
+    def test_rules(self):
+        changes = nftables.diff(ruleset([rule(10), rule(20), rule(30)]),
+                                ruleset([rule(5), rule(10), rule(20, 'drop'),
+                                         rule(25), rule(40)], '{ 192.0.2.2 }'))
+        live = {('ip', 'vyos_filter'): {
+            'VYOS_INPUT_filter': [(1, 'INP-filter default-action accept')],
+            'NAME_foo': [(2, 'ipv4-NAM-foo-10'), (3, 'ipv4-NAM-foo-20'),
+                         (4, 'ipv4-NAM-foo-30'), (5, 'foo default-action drop')]}}
+        prefix = 'ip vyos_filter NAME_foo'
+        self.assertEqual(nftables.commands(changes, live), [
+            f'delete rule {prefix} handle 4',
+            f'insert rule {prefix} position 2 {rule(5)}',
+            f'replace rule {prefix} handle 3 {rule(20, "drop")}',
+            f'insert rule {prefix} position 5 {rule(25)}',
+            f'insert rule {prefix} position 5 {rule(40)}',
+            'flush set ip vyos_filter A_bar',
+            'add element ip vyos_filter A_bar { 192.0.2.2 }'])
+
+    def test_rewrite(self):
+        # reordered rules and rules without comment are rewritten per chain
+        changes = nftables.diff(ruleset([rule(10), rule(20)]),
+                                ruleset([rule(20), rule(10)]))
+        live = {('ip', 'vyos_filter'): {'NAME_foo': [
+            (2, 'ipv4-NAM-foo-10'), (3, 'ipv4-NAM-foo-20'),
+            (5, 'foo default-action drop')]}}
+        tmp = nftables.commands(changes, live)
+        self.assertEqual(tmp[0], 'flush chain ip vyos_filter NAME_foo')
+        self.assertEqual(len(tmp), 4)
+
+        # kernel state does not match the previous ruleset
+        self.assertIsNone(nftables.commands(changes, {('ip', 'vyos_filter'): {}}))
+
+    def test_snapshot(self):
+        def nft_rule(handle, comment, packets, octets):
+            return {'rule': {'family': 'ip', 'table': 'vyos_filter', 'chain': 'NAME_foo',
+                             'handle': handle, 'comment': comment, 'expr': [
+                                 {'match': {'op': '==', 'left': {'payload': {
+                                     'protocol': 'tcp', 'field': 'dport'}}, 'right': 22}},
+                                 {'counter': {'packets': packets, 'bytes': octets}},
+                                 {'accept': None}]}}
+
+        chain = {'chain': {'family': 'ip', 'table': 'vyos_filter', 'name': 'NAME_foo'}}
+        first = nftables.Snapshot([{'metainfo': {}}, chain,
+                                   nft_rule(2, 'ipv4-NAM-foo-10', 10, 1000),
+                                   nft_rule(3, 'ipv4-NAM-foo-20', 5, 500)], timestamp=100)
+        self.assertTrue(first.has_chain('ip', 'vyos_filter', 'NAME_foo'))
+        self.assertEqual(len(first.rules('ip', 'vyos_filter', 'NAME_foo')), 2)
+        self.assertEqual(first.counters(first.rule('ip', 'vyos_filter', 'NAME_foo',
+                                                   'ipv4-NAM-foo-20')), (5, 500))
+
+        # rule 20 was replaced in between and starts from zero
+        second = nftables.Snapshot([chain, nft_rule(2, 'ipv4-NAM-foo-10', 30, 3000),
+                                    nft_rule(4, 'ipv4-NAM-foo-20', 8, 800)], timestamp=102)
+        rates = second.rates(first)
+        self.assertEqual(rates[('ip', 'vyos_filter', 'NAME_foo', 'ipv4-NAM-foo-10')], (10, 1000))
+        self.assertEqual(rates[('ip', 'vyos_filter', 'NAME_foo', 'ipv4-NAM-foo-20')], (4, 400))
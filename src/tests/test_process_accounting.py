@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+#
+# Copyright (C) 2023 VyOS maintainers and contributors
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License version 2 or later as
+# published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import json
+
+from vyos import debug
+from unittest import TestCase
+from unittest.mock import patch
+
+class TestProcessAccounting(TestCase):
+    def test_summary(self):
+        accounting = debug.ProcessAccounting(top=2)
+        for i in range(1, 21):
+            accounting.record('vyos.ethtool', f'ethtool eth{i}', i / 100)
+        accounting.record('vyos.firewall', 'nft -f /run/nftables.conf', 0.01)
+
+        summary = accounting.summary()
+        self.assertEqual(list(summary), ['vyos.ethtool', 'vyos.firewall'])
+        ethtool = summary['vyos.ethtool']
+        self.assertEqual(ethtool['count'], 20)
+        self.assertAlmostEqual(ethtool['total'], 2.1)
+        self.assertAlmostEqual(ethtool['p95'], 0.19)
+        self.assertEqual([s['command'] for s in ethtool['slowest']],
+                         ['ethtool eth20', 'ethtool eth19'])
+        self.assertEqual(json.loads(accounting.to_json()), summary)
+
+    def test_context(self):
+        with debug.process_accounting() as accounting:
+            debug.account_process('ip -j link show', 0.5)
+        debug.account_process('ip -j addr show', 0.5)
+
+        summary = accounting.summary()
+        self.assertEqual(summary[__name__]['count'], 1)
+
+    def test_bounded(self):
+        accounting = debug.ProcessAccounting(top=2, samples=10)
+        for i in range(100):
+            accounting.record('vyos.ifconfig', ['ip', 'link', 'show'], 0.1)
+        summary = accounting.summary()['vyos.ifconfig']
+        self.assertEqual(summary['count'], 100)
+        self.assertAlmostEqual(summary['total'], 10.0)
+        self.assertEqual(len(accounting._modules['vyos.ifconfig']['durations']), 10)
+        # equal durations of list and string commands
+        accounting.record('vyos.ifconfig', 'ip link show', 0.1)
+        self.assertEqual([s['command'] for s in accounting.summary()['vyos.ifconfig']['slowest']],
+                         ['ip link show', 'ip link show'])
+
+        accounting.reset()
+        self.assertEqual(accounting.summary(), {})
+
+    def test_flag_per_commit(self):
+        patch.object(debug, '_flag_checked', False).start()
+        patch.object(debug, '_flag_accounting', None).start()
+        patch.object(debug, '_accounting', []).start()
+        patch('vyos.debug.atexit.register').start()
+        self.addCleanup(patch.stopall)
+
+        with patch.object(debug, 'enabled', return_value=''):
+            debug.account_process('ip -j link show', 0.5)
+        self.assertIsNone(debug._flag_accounting)
+
+        # the flag is checked once per process, and per commit by vyos-configd
+        with patch.object(debug, 'enabled', return_value='/tmp/vyos.process.debug'):
+            debug.account_process('ip -j link show', 0.5)
+            self.assertIsNone(debug._flag_accounting)
+            debug.reset_process_accounting()
+            debug.account_process('ip -j link show', 0.5)
+        self.assertEqual(debug._flag_accounting.summary()[__name__]['count'], 1)
+
+        with patch.object(debug, 'enabled', return_value=''):
+            debug.reset_process_accounting()
+            debug.account_process('ip -j link show', 0.5)
+        self.assertEqual(debug._accounting, [])
@@ -0,0 +1,88 @@
+#!/usr/bin/env python3
+#
+# Copyright (C) 2023 VyOS maintainers and contributors
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License version 2 or later as
+# published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import os
+import tempfile
+import vyos.profiler
+
+from unittest import TestCase
+
+class TestProfiler(TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.event_file = vyos.profiler.event_file
+        vyos.profiler.event_file = os.path.join(self.tmp.name, 'events')
+        os.environ['VYOS_PROFILE_DEBUG'] = 'yes'
+        vyos.profiler.refresh()
+
+    def tearDown(self):
+        del os.environ['VYOS_PROFILE_DEBUG']
+        vyos.profiler.refresh()
+        vyos.profiler.event_file = self.event_file
+        self.tmp.cleanup()
+
+    def test_program(self):
+        self.assertEqual(vyos.profiler.program('sudo /usr/sbin/ip -j link'), 'ip')
+        self.assertEqual(vyos.profiler.program('LC_ALL=C ethtool eth0'), 'ethtool')
+        self.assertEqual(vyos.profiler.program(['/usr/bin/echo', 'hi']), 'echo')
+
+    def test_list_command(self):
+        from vyos.utils.process import cmd
+        self.assertEqual(cmd(['echo', 'hi']), 'hi')
+        events = vyos.profiler.read_events()
+        self.assertEqual([(e['name'], e['detail']) for e in events],
+                         [('echo', 'echo hi')])
+
+        vyos.profiler.refresh()
+        del os.environ['VYOS_PROFILE_DEBUG']
+        self.assertEqual(cmd(['echo', 'hi']), 'hi')
+        os.environ['VYOS_PROFILE_DEBUG'] = 'yes'
+
+    def test_nested_spans(self):
+        with vyos.profiler.span('ntp', 'script'):
+            with vyos.profiler.span('apply'):
+                pass
+
+        events = vyos.profiler.read_events()
+        self.assertEqual([e['name'] for e in events], ['apply', 'ntp'])
+        self.assertTrue(events[0]['stack'].endswith(';ntp;apply'))
+        self.assertLessEqual(events[1]['self'], events[1]['dur'])
+
+        trace = vyos.profiler.trace(events)
+        self.assertEqual(len(trace['traceEvents']), 2)
+        self.assertEqual(trace['traceEvents'][0]['ph'], 'X')
+
+        folded = vyos.profiler.collapsed(events)
+        for line in folded.splitlines():
+            stack, value = line.rsplit(' ', 1)
+            self.assertTrue(int(value) > 0)
+
+    def test_disabled(self):
+        del os.environ['VYOS_PROFILE_DEBUG']
+        vyos.profiler.refresh()
+        with vyos.profiler.span('ntp', 'script'):
+            pass
+        os.environ['VYOS_PROFILE_DEBUG'] = 'yes'
+        self.assertEqual(vyos.profiler.read_events(), [])
+
+    def test_flag_cached(self):
+        self.assertTrue(vyos.profiler.enabled())
+        del os.environ['VYOS_PROFILE_DEBUG']
+        # the flag is not checked again for every span
+        self.assertTrue(vyos.profiler.enabled())
+        vyos.profiler.refresh()
+        self.assertFalse(vyos.profiler.enabled())
+        os.environ['VYOS_PROFILE_DEBUG'] = 'yes'
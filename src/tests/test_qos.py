@@ -0,0 +1,82 @@
+#!/usr/bin/env python3
+#
+# Copyright (C) 2023 VyOS maintainers and contributors
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License version 2 or later as
+# published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+from copy import deepcopy
+from unittest import TestCase
+from unittest.mock import patch
+
+from vyos.qos import TCBatch
+from vyos.qos import TrafficShaper
+
+match = {'ssh': {'ip': {'destination': {'port': '22'}}}}
+shaper = {
+    'bandwidth': '100mbit',
+    'class': {
+        '10': {'bandwidth': '10mbit', 'burst': '15k', 'codel_quantum': '1514',
+               'queue_type': 'fair-queue', 'match': match},
+        '20': {'bandwidth': '10mbit', 'burst': '15k', 'codel_quantum': '1514',
+               'queue_type': 'fair-queue', 'match': match},
+    },
+    'default': {'bandwidth': '20mbit', 'burst': '15k', 'codel_quantum': '1514',
+                'queue_type': 'fq-codel'},
+}
+
+def build(config):
+    batch = TCBatch('eth0')
+    TrafficShaper('eth0', batch=batch).update(config, 'egress')
+    return batch
+
+class TestQoSBatch(TestCase):
+    def test_collect(self):
+        batch = build(shaper)
+        lines = batch.lines()
+        self.assertEqual(lines[0], 'qdisc replace dev eth0 root handle 1: htb '
+                                   'r2q 62 default 15')
+        self.assertIn('filter add dev eth0 parent 1: protocol all prio 1 u32 '
+                      'match ip dport 22 0xffff flowid 1:a', lines)
+
+    def test_diff_unchanged(self):
+        previous = build(shaper).lines()
+        self.assertEqual(build(shaper)._diff(previous), [])
+
+    def test_diff_replace(self):
+        previous = build(shaper).lines()
+        config = deepcopy(shaper)
+        config['class']['10']['ceiling'] = '50mbit'
+        config['class']['20']['queue_type'] = 'drop-tail'
+        self.assertEqual(build(config)._diff(previous), [
+            ('class replace dev eth0 parent 1:1 classid 1:a htb rate 10000000 '
+             'burst 15k quantum 1514 ceil 50000000', 'class 10'),
+            ('qdisc replace dev eth0 parent 1:14 pfifo', 'class 20')])
+        # and back to the previous queue type
+        self.assertEqual(build(shaper)._diff(build(config).lines())[-1],
+                         ('qdisc replace dev eth0 parent 1:14 sfq', 'class 20'))
+
+    def test_diff_rebuild(self):
+        # changes of filters or the root qdisc require a full rebuild
+        previous = build(shaper).lines()
+        config = deepcopy(shaper)
+        config['class']['10']['match']['ssh']['ip']['destination']['port'] = '23'
+        self.assertIsNone(build(config)._diff(previous))
+
+    def test_error_context(self):
+        batch = build(shaper)
+        with patch('vyos.qos.base.popen',
+                   return_value=('RTNETLINK answers: Invalid argument\n'
+                                 'Command failed -:3', 1)):
+            with self.assertRaises(OSError) as e:
+                batch._run(batch._commands)
+        self.assertIn('(class 10)', str(e.exception))
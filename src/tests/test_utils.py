@@ -26,3 +26,92 @@ class TestVyOSUtils(TestCase):
     def test_sysctl_read(self):
         from vyos.utils.system import sysctl_read
         self.assertEqual(sysctl_read('net.ipv4.conf.lo.forwarding'), '1')
+
+    def test_sysctl_path(self):
+        from vyos.utils.system import sysctl_path
+        self.assertEqual(sysctl_path('net.ipv4.conf.eth0/10.forwarding'),
+                         '/proc/sys/net/ipv4/conf/eth0.10/forwarding')
+
+    def test_sysctl_batch(self):
+        import os
+        from tempfile import TemporaryDirectory
+        from vyos.utils.system import SysctlBatch
+        with TemporaryDirectory() as tmp:
+            same = os.path.join(tmp, 'same')
+            other = os.path.join(tmp, 'other')
+            for path in [same, other]:
+                with open(path, 'w') as f:
+                    f.write('0\n')
+
+            batch = SysctlBatch(dry_run=True)
+            batch.set_path(same, 1)
+            batch.set_path(same, 0)
+            batch.set_path(other, 2)
+            self.assertEqual(batch.get_path(other), '2')
+            self.assertTrue(batch.flush())
+            self.assertEqual(batch.report, [(other, '0', '2')])
+            with open(other) as f:
+                self.assertEqual(f.read(), '0\n')
+
+            with SysctlBatch() as batch:
+                batch.set_path(same, 0)
+                batch.set_path(other, 2)
+                batch.set_path(os.path.join(tmp, 'missing', 'file'), 1)
+            self.assertEqual(batch.report, [(other, '0', '2')])
+            self.assertEqual(len(batch.errors), 1)
+            with open(other) as f:
+                self.assertEqual(f.read(), '2')
+
+            # writes queued before a failure are not applied
+            with self.assertRaises(ValueError):
+                with SysctlBatch() as batch:
+                    batch.set_path(other, 3)
+                    raise ValueError('invalid config')
+            self.assertEqual(batch.report, [])
+            with open(other) as f:
+                self.assertEqual(f.read(), '2')
+
+    def test_persistent_cache(self):
+        from tempfile import TemporaryDirectory
+        from vyos.utils import cache
+        calls = []
+        def parse(conf, rule_id):
+            calls.append(rule_id)
+            return f'{conf["action"]} comment "{rule_id}"'
+
+        with TemporaryDirectory() as tmp:
+            default, cache.cache_dir = cache.cache_dir, tmp
+            try:
+                first = cache.PersistentCache(parse, maxsize=2)
+                self.assertEqual(first({'action': 'drop'}, '10'), 'drop comment "10"')
+                self.assertEqual(first({'action': 'drop'}, '10'), 'drop comment "10"')
+                first({'action': 'accept'}, '20')
+                first({'action': 'accept'}, '30')
+                self.assertEqual(calls, ['10', '20', '30'])
+                first.save()
+
+                # a new process only finds the most recently used entries
+                second = cache.PersistentCache(parse, maxsize=2)
+                second({'action': 'accept'}, '30')
+                self.assertEqual(len(second), 2)
+                second({'action': 'drop'}, '10')
+                self.assertEqual(calls, ['10', '20', '30', '10'])
+            finally:
+                cache.cache_dir = default
+
+    def test_commit_generation(self):
+        import os
+        from tempfile import TemporaryDirectory
+        from unittest.mock import patch
+        from vyos.utils.commit import commit_generation
+        with TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, '.commit-generation')
+            with patch('vyos.defaults.commit_generation', path):
+                self.assertIsNone(commit_generation())
+                open(path, 'w').close()
+                os.utime(path, ns=(0, 1000))
+                first = commit_generation()
+                self.assertEqual(first, 1000)
+                # as touched by the commit post-hook
+                os.utime(path)
+                self.assertNotEqual(commit_generation(), first)
@@ -0,0 +1,226 @@
+#!/usr/bin/env python3
+#
+# Copyright (C) 2023 VyOS maintainers and contributors
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License version 2 or later as
+# published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import os
+import socket
+import struct
+import threading
+import time
+
+from tempfile import TemporaryDirectory
+from unittest import TestCase
+from unittest.mock import patch
+
+from vyos.utils import dns
+
+def record(kind, ttl, rdata, name=b'\xc0\x0c'):
+    return name + struct.pack('!HHIH', kind, dns.CLASS_IN, ttl, len(rdata)) + rdata
+
+class StubServer(threading.Thread):
+    """
+    Local DNS server answering from 'zone', a dict mapping (name, type) to a
+    list of (type, ttl, rdata) answers. Names listed in 'slow' are answered
+    after 'delay' seconds, 'truncated' names set the TC bit over UDP. Answers
+    of 'stray' names are preceded by an answer with another ID.
+    """
+    def __init__(self, zone, slow=(), delay=0, truncated=(), stray=()):
+        super().__init__(daemon=True)
+        self.zone = zone
+        self.slow = slow
+        self.delay = delay
+        self.truncated = truncated
+        self.stray = stray
+        self.queries = []
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.sock.bind(('127.0.0.1', 0))
+        self.tcp = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.tcp.bind(('127.0.0.1', self.sock.getsockname()[1]))
+        self.tcp.listen()
+        self.port = self.sock.getsockname()[1]
+        self.start()
+        threading.Thread(target=self._serve_tcp, daemon=True).start()
+
+    def answer(self, data, tcp=False):
+        ident, _, _, _, _, _ = struct.unpack_from('!HHHHHH', data)
+        name, offset = dns.decode_name(data, 12)
+        kind = struct.unpack_from('!H', data, offset)[0]
+        question = data[12:offset + 4]
+        self.queries.append((name, kind, tcp))
+        if name in self.slow:
+            time.sleep(self.delay)
+
+        flags = 0x8180
+        if name in self.truncated and not tcp:
+            return struct.pack('!HHHHHH', ident, flags | dns.FLAG_TC, 1, 0, 0, 0) + question
+        if (name, kind) not in self.zone:
+            soa = (b'\xc0\x0c' * 2 + struct.pack('!IIIII', 1, 3600, 600, 86400, 42))
+            return (struct.pack('!HHHHHH', ident, flags | dns.RCODE_NXDOMAIN, 1, 0, 1, 0) +
+                    question + record(dns.TYPE_SOA, 300, soa))
+        answers = self.zone[(name, kind)]
+        return (struct.pack('!HHHHHH', ident, flags, 1, len(answers), 0, 0) +
+                question + b''.join(record(*a) for a in answers))
+
+    def run(self):
+        while True:
+            data, peer = self.sock.recvfrom(512)
+            threading.Thread(target=self._reply, args=(data, peer),
+                             daemon=True).start()
+
+    def _reply(self, data, peer):
+        response = self.answer(data)
+        if dns.decode_name(data, 12)[0] in self.stray:
+            ident = struct.unpack_from('!H', response)[0] ^ 1
+            self.sock.sendto(struct.pack('!H', ident) + response[2:], peer)
+        self.sock.sendto(response, peer)
+
+    def _serve_tcp(self):
+        while True:
+            conn, _ = self.tcp.accept()
+            with conn:
+                length = struct.unpack('!H', conn.recv(2))[0]
+                response = self.answer(conn.recv(length), tcp=True)
+                conn.sendall(struct.pack('!H', len(response)) + response)
+
+class TestVyOSUtilsDNS(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        a = socket.inet_aton
+        cname = dns.encode_name('www.example.com')
+        cls.server = StubServer({
+            ('example.com', dns.TYPE_A): [(dns.TYPE_A, 120, a('192.0.2.1')),
+                                          (dns.TYPE_A, 60, a('192.0.2.2'))],
+            ('example.com', dns.TYPE_AAAA): [
+                (dns.TYPE_AAAA, 300, socket.inet_pton(socket.AF_INET6, '2001:db8::1'))],
+            ('alias.example.com', dns.TYPE_A): [
+                (dns.TYPE_CNAME, 30, cname),
+                (dns.TYPE_A, 600, a('192.0.2.3'), cname)],
+            ('big.example.com', dns.TYPE_A): [(dns.TYPE_A, 100, a('192.0.2.4'))],
+            ('slow.example.com', dns.TYPE_A): [(dns.TYPE_A, 100, a('192.0.2.5'))],
+        }, slow=['slow.example.com'], delay=1.5, truncated=['big.example.com'],
+           stray=['alias.example.com'])
+
+    def setUp(self):
+        self.tmp = TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        hosts = os.path.join(self.tmp.name, 'hosts')
+        with open(hosts, 'w') as f:
+            f.write('127.0.0.1 localhost\n'
+                    '# static host mappings\n'
+                    '192.0.2.10 router.example.com router # comment\n'
+                    '2001:db8::10 router.example.com router\n')
+        patcher = patch('vyos.utils.dns.hosts_file', hosts)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def query(self, name, ipv6=False, timeout=1.0, search=None):
+        return dns.query(name, ipv6, servers=['127.0.0.1'], port=self.server.port,
+                         timeout=timeout, search=search)
+
+    def test_query(self):
+        self.assertEqual(self.query('example.com'), ({'192.0.2.1', '192.0.2.2'}, 60))
+        self.assertEqual(self.query('example.com', ipv6=True), ({'2001:db8::1'}, 300))
+        self.assertEqual(self.query('alias.example.com'), ({'192.0.2.3'}, 30))
+        # negative answers are cached for the SOA minimum
+        self.assertEqual(self.query('missing.example.com'), (set(), 42))
+
+    def test_hosts(self):
+        count = len(self.server.queries)
+        self.assertEqual(self.query('router'), ({'192.0.2.10'}, dns.hosts_ttl))
+        self.assertEqual(self.query('Router.example.com.', ipv6=True),
+                         ({'2001:db8::10'}, dns.hosts_ttl))
+        self.assertEqual(len(self.server.queries), count)
+
+    def test_search(self):
+        self.assertEqual(dns.search_names('www', ['example.com', 'example.net']),
+                         ['www.example.com', 'www.example.net', 'www'])
+        self.assertEqual(dns.search_names('www.example', ['example.com']),
+                         ['www.example', 'www.example.example.com'])
+        self.assertEqual(dns.search_names('www.', ['example.com']), ['www'])
+        self.assertEqual(self.query('alias', search=['example.net', 'example.com']),
+                         ({'192.0.2.3'}, 30))
+        self.assertEqual(self.query('missing', search=['example.com']), (set(), 42))
+
+    def test_resolv_conf(self):
+        path = os.path.join(self.tmp.name, 'resolv.conf')
+        with open(path, 'w') as f:
+            f.write('domain example.org\nsearch example.com example.net\n'
+                    'nameserver 192.0.2.53\noptions ndots:2 rotate\n')
+        self.assertEqual(dns.read_resolv_conf(path),
+                         {'nameservers': ['192.0.2.53'], 'ndots': 2,
+                          'search': ['example.com', 'example.net']})
+
+    def test_stray_answer(self):
+        # alias.example.com is first answered with another ID
+        self.assertEqual(self.query('alias.example.com'), ({'192.0.2.3'}, 30))
+
+    def test_truncated(self):
+        self.assertEqual(self.query('big.example.com'), ({'192.0.2.4'}, 100))
+        self.assertIn(('big.example.com', dns.TYPE_A, True), self.server.queries)
+
+    def test_timeout(self):
+        with self.assertRaises(OSError):
+            self.query('slow.example.com', timeout=0.2)
+
+    def test_resolver(self):
+        now = [0]
+        resolver = dns.Resolver(servers=['127.0.0.1'], port=self.server.port,
+                                timeout=0.5, min_ttl=10, max_ttl=100, retry=5,
+                                keep_on_failure=True, clock=lambda: now[0])
+        keys = {('example.com', False), ('example.com', True),
+                ('alias.example.com', False), ('slow.example.com', False),
+                ('192.0.2.9', False), ('192.0.2.9', True)}
+
+        # a slow upstream only delays its own name
+        start = time.monotonic()
+        self.assertEqual(resolver.resolve(keys), keys)
+        self.assertLess(time.monotonic() - start, 1.4)
+        self.assertEqual(resolver.addresses('example.com'), {'192.0.2.1', '192.0.2.2'})
+        self.assertEqual(resolver.addresses('192.0.2.9'), {'192.0.2.9'})
+        self.assertEqual(resolver.addresses('192.0.2.9', True), set())
+        self.assertEqual(resolver.addresses('slow.example.com'), set())
+        self.assertEqual(resolver.next_refresh(), 5)
+
+        # names are re-resolved once their TTL expired
+        now[0] = 30
+        self.assertEqual(sorted(resolver.due(keys)), [('alias.example.com', False),
+                                                      ('slow.example.com', False)])
+        now[0] = 60
+        self.assertIn(('example.com', False), resolver.due(keys))
+        self.assertNotIn(('example.com', True), resolver.due(keys))
+        resolver.resolve(keys)
+        self.assertEqual(resolver.addresses('example.com'), {'192.0.2.1', '192.0.2.2'})
+
+        # names no longer used are dropped
+        resolver.resolve({('example.com', False)})
+        self.assertEqual(resolver.addresses('alias.example.com'), set())
+
+    def test_resolver_negative(self):
+        now = [0]
+        keys = {('example.com', False)}
+        resolvers = [dns.Resolver(servers=['127.0.0.1'], port=self.server.port,
+                                  timeout=0.5, keep_on_failure=keep,
+                                  clock=lambda: now[0]) for keep in [True, False]]
+        for resolver in resolvers:
+            resolver.resolve(keys)
+
+        # a transient NXDOMAIN only empties the addresses without cache
+        now[0] = 3600
+        with patch.dict(self.server.zone):
+            del self.server.zone[('example.com', dns.TYPE_A)]
+            self.assertEqual(resolvers[0].resolve(keys), set())
+            self.assertEqual(resolvers[1].resolve(keys), keys)
+        self.assertEqual(resolvers[0].addresses('example.com'), {'192.0.2.1', '192.0.2.2'})
+        self.assertEqual(resolvers[1].addresses('example.com'), set())
@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+#
+# Copyright (C) 2023 VyOS maintainers and contributors
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License version 2 or later as
+# published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import struct
+
+from unittest import TestCase
+
+from vyos.utils import netlink
+
+
+def attr(kind, payload):
+    return netlink._attr(kind, payload)
+
+
+def u32(value):
+    return struct.pack('=I', value)
+
+
+def link_message(index, name, flags=0x11043, attrs=b''):
+    return (struct.pack('=BxHiII', 0, 1, index, flags, 0) +
+            attr(netlink.IFLA_IFNAME, name.encode() + b'\0') + attrs)
+
+
+class TestVyOSUtilsNetlink(TestCase):
+    def test_attributes(self):
+        data = attr(1, b'abc') + attr(2 | 0x8000, u32(7))
+        self.assertEqual(netlink.attributes(data), [(1, b'abc'), (2, u32(7))])
+
+    def test_vlan(self):
+        qos = attr(1, struct.pack('=II', 0, 1))
+        info_data = (attr(netlink.IFLA_VLAN_ID, struct.pack('=H', 10)) +
+                     attr(netlink.IFLA_VLAN_FLAGS, struct.pack('=II', 1, 0xffffffff)) +
+                     attr(netlink.IFLA_VLAN_INGRESS_QOS, qos) +
+                     attr(netlink.IFLA_VLAN_PROTOCOL, struct.pack('!H', 0x88a8)))
+        linkinfo = (attr(netlink.IFLA_INFO_KIND, b'vlan\0') +
+                    attr(netlink.IFLA_INFO_DATA, info_data) +
+                    attr(netlink.IFLA_INFO_SLAVE_KIND, b'vrf\0') +
+                    attr(netlink.IFLA_INFO_SLAVE_DATA, attr(1, u32(1000))))
+        link = netlink.Link(link_message(5, 'eth0.10', attrs=(
+            attr(netlink.IFLA_MTU, u32(1500)) +
+            attr(netlink.IFLA_LINK, u32(2)) +
+            attr(netlink.IFLA_MASTER, u32(3)) +
+            attr(netlink.IFLA_ADDRESS, bytes.fromhex('00505600000a')) +
+            attr(netlink.IFLA_LINKINFO, linkinfo))))
+
+        self.assertTrue(link.is_complete())
+        tmp = link.to_dict({2: 'eth0', 3: 'red', 5: 'eth0.10'})
+        self.assertEqual(tmp['ifname'], 'eth0.10')
+        self.assertEqual(tmp['link'], 'eth0')
+        self.assertEqual(tmp['master'], 'red')
+        self.assertEqual(tmp['mtu'], 1500)
+        self.assertEqual(tmp['address'], '00:50:56:00:00:0a')
+        self.assertEqual(tmp['flags'], ['BROADCAST', 'MULTICAST', 'UP', 'LOWER_UP'])
+        self.assertEqual(tmp['linkinfo'], {
+            'info_kind': 'vlan',
+            'info_data': {'protocol': '802.1ad', 'id': 10,
+                          'flags': ['REORDER_HDR'],
+                          'ingress_qos': [{'from': 0, 'to': 1}]},
+            'info_slave_kind': 'vrf',
+            'info_slave_data': {'table': 1000}})
+
+    def test_incomplete_kind(self):
+        linkinfo = attr(netlink.IFLA_INFO_KIND, b'vxlan\0')
+        link = netlink.Link(link_message(6, 'vxlan0', attrs=attr(
+            netlink.IFLA_LINKINFO, linkinfo)))
+        self.assertFalse(link.is_complete())
+
+    def test_loopback(self):
+        tmp = netlink.link_config('lo')
+        self.assertEqual(tmp['ifname'], 'lo')
+        self.assertEqual(tmp['link_type'], 'loopback')
+        self.assertIsNone(netlink.link_config('vyos-does-not-exist'))
+
+        link, _ = netlink.lookup('lo')
+        local = [a.to_dict()['local'] for a in netlink.addresses(link)]
+        self.assertIn('127.0.0.1', local)
+
+    def test_snapshot(self):
+        with netlink.snapshot():
+            first = netlink.get_snapshot()
+            self.assertIs(first, netlink.get_snapshot())
+            self.assertTrue(netlink.link_exists('lo'))
+            netlink.invalidate()
+            self.assertIsNot(first, netlink.get_snapshot())
+        self.assertIsNone(netlink._snapshots())
@@ -46,5 +46,56 @@ class TestVyOSUtilsNetwork(TestCase):
         self.assertFalse(vyos.utils.network.is_loopback_addr('::2'))
         self.assertFalse(vyos.utils.network.is_loopback_addr('192.0.2.1'))
 
+    def test_range_to_cidrs(self):
+        from ipaddress import ip_address
+        from ipaddress import summarize_address_range
+        for start, end in [(0, 2**32 - 1), (10, 10), (1, 254), (256, 1023), (7, 129)]:
+            expected = [(int(n.network_address), n.prefixlen) for n in
+                        summarize_address_range(ip_address(start), ip_address(end))]
+            self.assertEqual(vyos.utils.network.range_to_cidrs(start, end), expected)
 
+    def test_aggregate_addresses(self):
+        from ipaddress import ip_address
+        from ipaddress import ip_network
+        from random import Random
 
+        def members(entries):
+            res = set()
+            for entry in entries:
+                if '-' in entry:
+                    start, end = (int(ip_address(a)) for a in entry.split('-'))
+                else:
+                    network = ip_network(entry, strict=False)
+                    start = int(network.network_address)
+                    end = int(network.broadcast_address)
+                version = ip_address(entry.split('-')[0].split('/')[0]).version
+                res.update((version, value) for value in range(start, end + 1))
+            return res
+
+        aggregate = vyos.utils.network.aggregate_addresses
+        self.assertEqual(aggregate(['192.0.2.0/25', '192.0.2.128/25', '192.0.2.7']),
+                         ['192.0.2.0/24'])
+        self.assertEqual(aggregate(['2001:db8::1-2001:db8::3', '2001:db8::4', '10.0.0.1']),
+                         ['10.0.0.1', '2001:db8::1-2001:db8::4'])
+        self.assertEqual(aggregate(['!192.0.2.1']), ['!192.0.2.1'])
+
+        random = Random(4711)
+        for _ in range(50):
+            entries = []
+            for _ in range(random.randint(1, 20)):
+                kind = random.choice(['address', 'network', 'range'])
+                base, prefix = random.choice([('10.0.0.0', 22), ('2001:db8::', 118)])
+                first = int(ip_address(base))
+                value = ip_address(first + random.randrange(2 ** (32 - 22)))
+                if kind == 'address':
+                    entries.append(str(value))
+                elif kind == 'network':
+                    length = random.randint(prefix, value.max_prefixlen)
+                    entries.append(str(ip_network(f'{value}/{length}', strict=False)))
+                else:
+                    end = ip_address(int(value) + random.randrange(300))
+                    entries.append(f'{value}-{end}')
+
+            result = aggregate(entries)
+            self.assertEqual(members(result), members(entries))
+            self.assertLessEqual(len(result), len(entries))